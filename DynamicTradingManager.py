@@ -7,6 +7,13 @@ import logging
 import time
 import requests
 import shutil
+import heapq
+import random
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from data_loader import load_config
+from rate_limiter import RateLimiter, get_rate_limiter
+from market_cache import get_market_cache
 
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
 
@@ -15,37 +22,115 @@ USB_PATHS = ["/mnt/usb_trading_data/", "/media/usb/", "/mnt/external_usb/", "D:/
 BACKUP_PATH = next((path for path in USB_PATHS if os.path.exists(path)), "backup_data/")
 CLOUD_BACKUP = "/mnt/google_drive/trading_backup/"
 
+# 📌 Limiti API di Binance condivisi con lo scheduler delle richieste
+EXCHANGE_NAME = "Binance"
+API_LIMITS = (load_config() or {}).get("trading_parameters", {}).get("api_limits", {})
+
+# 📌 Richieste fetch_ticker parallele quando l'exchange non offre fetch_tickers
+TICKER_WORKERS = 8
+
+def ticker_metrics(ticker):
+    """Volume in valuta di quotazione e variazione percentuale assoluta di un ticker."""
+    volume = ticker.get('quoteVolume') or 0
+    price_change = abs((ticker.get('change') or 0) / (ticker.get('last') or 1))
+    return volume, price_change
+
+class TopNRanker:
+    """Classifica in streaming delle migliori N coppie per volume (a parità, per volatilità).
+
+    Ogni snapshot di ticker aggiorna solo la coppia interessata; la classifica viene ricalcolata
+    (heap, O(M log N)) solo quando l'aggiornamento può davvero cambiarla.
+    """
+
+    def __init__(self, top_n, min_volume=0, volatility_threshold=0, rank_by="volume"):
+        self.top_n = top_n
+        self.min_volume = min_volume
+        self.volatility_threshold = volatility_threshold
+        self.rank_by = rank_by
+        self.scores = {}  # symbol -> chiave di ordinamento delle sole coppie idonee
+        self._top = []
+        self._dirty = False
+
+    def _score(self, volume, price_change):
+        return (price_change, volume) if self.rank_by == "volatility" else (volume, price_change)
+
+    def update(self, symbol, ticker):
+        """Registra un nuovo snapshot del ticker e segnala se la classifica potrebbe essere cambiata."""
+        volume, price_change = ticker_metrics(ticker)
+        eligible = volume >= self.min_volume and price_change >= self.volatility_threshold
+        previous = self.scores.pop(symbol, None)
+        in_top = previous is not None and symbol in {entry[1] for entry in self._top}
+
+        if eligible:
+            score = self._score(volume, price_change)
+            self.scores[symbol] = score
+            if in_top or len(self._top) < self.top_n or score > self._top[-1][0]:
+                self._dirty = True
+        elif in_top:
+            self._dirty = True
+        return self._dirty
+
+    def update_many(self, tickers):
+        """Applica un blocco di snapshot {symbol: ticker} e restituisce la classifica aggiornata."""
+        for symbol, ticker in tickers.items():
+            self.update(symbol, ticker)
+        return self.top()
+
+    def top(self):
+        """Simboli delle migliori N coppie, dal migliore al peggiore."""
+        if self._dirty:
+            self._top = heapq.nlargest(self.top_n, ((score, symbol) for symbol, score in self.scores.items()))
+            self._dirty = False
+        return [symbol for _, symbol in self._top]
+
 class DynamicTradingManager:
-    def __init__(self, top_n=10, volatility_threshold=0.02, min_volume=1000000, backup_file="trading_pairs.json"):
+    def __init__(self, top_n=10, volatility_threshold=0.02, min_volume=1000000, backup_file="trading_pairs.json",
+                 exchange=None):
         """Gestisce dinamicamente la selezione delle coppie di trading."""
         self.top_n = top_n
         self.volatility_threshold = volatility_threshold
         self.min_volume = min_volume
         self.backup_file = os.path.join(BACKUP_PATH, backup_file)
-        self.exchange = ccxt.binance()  # Connessione a Binance
+        self.exchange = exchange or ccxt.binance()  # Connessione a Binance
+        self.rate_limiter = get_rate_limiter()
+        self.rate_limiter.register(EXCHANGE_NAME, API_LIMITS.get("max_requests_per_minute", 100))
+        self.ranker = TopNRanker(top_n, min_volume, volatility_threshold)
+        self.market_cache = get_market_cache()
+
+    def fetch_tickers(self, symbols):
+        """Scarica i ticker con una sola chiamata bulk o, se non supportata, con richieste parallele."""
+        if self.exchange.has.get('fetchTickers'):
+            self.rate_limiter.acquire_sync(EXCHANGE_NAME)
+            tickers = self.exchange.fetch_tickers(symbols)
+            return {symbol: tickers[symbol] for symbol in symbols if symbol in tickers}
+
+        def fetch_one(symbol):
+            self.rate_limiter.acquire_sync(EXCHANGE_NAME)
+            return symbol, self.exchange.fetch_ticker(symbol)
+
+        with ThreadPoolExecutor(max_workers=TICKER_WORKERS) as executor:
+            return dict(executor.map(fetch_one, symbols))
+
+    def on_ticker_snapshot(self, tickers):
+        """Aggiorna la classifica con nuovi snapshot (es. da WebSocket) senza rifare la scansione completa."""
+        return self.ranker.update_many(tickers)
 
     def fetch_eur_trading_pairs(self, retries=3, delay=2):
         """Recupera le coppie di trading in EUR con i volumi più alti e gestione avanzata degli errori."""
         for attempt in range(retries):
             try:
-                markets = self.exchange.load_markets()
-                pairs = []
-                
-                for symbol, market in markets.items():
-                    if "/EUR" in symbol and market['active']:
-                        ticker = self.exchange.fetch_ticker(symbol)
-                        volume = ticker.get('quoteVolume', 0)
-                        price_change = abs(ticker.get('change', 0) / ticker.get('last', 1))
-
-                        if volume >= self.min_volume and price_change >= self.volatility_threshold:
-                            pairs.append((symbol, volume, price_change))
-                
-                sorted_pairs = sorted(pairs, key=lambda x: x[1], reverse=True)[:self.top_n]
-                trading_pairs = [pair[0] for pair in sorted_pairs]
+                markets = self.market_cache.load_markets(self.exchange, EXCHANGE_NAME)
+                symbols = [symbol for symbol, market in markets.items() if "/EUR" in symbol and market['active']]
+
+                trading_pairs = self.on_ticker_snapshot(self.fetch_tickers(symbols))
 
                 self.backup_trading_pairs(trading_pairs)
                 return trading_pairs
 
+            except ccxt.RateLimitExceeded as e:
+                logging.warning(f"⚠️ Limite API di {EXCHANGE_NAME} raggiunto (tentativo {attempt+1}/{retries}): {e}")
+                self.rate_limiter.penalize(EXCHANGE_NAME, API_LIMITS.get("cooldown_time_seconds", 60))
+
             except Exception as e:
                 logging.error(f"⚠️ Errore nel recupero delle coppie EUR (tentativo {attempt+1}/{retries}): {e}")
                 time.sleep(delay * (2 ** attempt))  # Backoff esponenziale
@@ -95,7 +180,65 @@ class DynamicTradingManager:
             except Exception as e:
                 logging.error(f"❌ Errore nel backup su Google Drive: {e}")
 
-if __name__ == "__main__":
+# ===========================
+# 🔹 BENCHMARK SU EXCHANGE SINTETICO
+# ===========================
+
+class SyntheticExchange:
+    """Exchange locale con migliaia di mercati sintetici e latenza simulata per ogni richiesta."""
+
+    def __init__(self, n_markets, latency=0.005, bulk=True):
+        self.latency = latency
+        self.has = {'fetchTickers': bulk}
+        self.markets = {f"C{i}/EUR": {'active': True} for i in range(n_markets)}
+        self.requests = 0
+
+    def load_markets(self):
+        return self.markets
+
+    def _ticker(self, symbol):
+        last = random.uniform(0.1, 1000)
+        return {'symbol': symbol, 'last': last, 'change': last * random.uniform(-0.1, 0.1),
+                'quoteVolume': random.uniform(1e5, 1e8)}
+
+    def fetch_ticker(self, symbol):
+        self.requests += 1
+        time.sleep(self.latency)
+        return self._ticker(symbol)
+
+    def fetch_tickers(self, symbols=None):
+        self.requests += 1
+        time.sleep(self.latency)
+        return {symbol: self._ticker(symbol) for symbol in symbols or self.markets}
+
+def benchmark_scan(market_counts=(1000, 5000, 20000), latency=0.005):
+    """Confronta scansione sequenziale, parallela e bulk su exchange sintetici."""
+    unlimited = RateLimiter(burst=10**6)  # Nessun limite: si misura solo la scansione
+    unlimited.register(EXCHANGE_NAME, 10**9)
+    for n_markets in market_counts:
+        for mode in ("sequenziale", "parallela", "bulk"):
+            exchange = SyntheticExchange(n_markets, latency, bulk=(mode == "bulk"))
+            manager = DynamicTradingManager(exchange=exchange, min_volume=0, volatility_threshold=0)
+            manager.rate_limiter = unlimited
+            symbols = list(exchange.markets)
+            started = time.perf_counter()
+            if mode == "sequenziale":
+                tickers = {symbol: exchange.fetch_ticker(symbol) for symbol in symbols}
+                ranking = manager.on_ticker_snapshot(tickers)
+            else:
+                ranking = manager.on_ticker_snapshot(manager.fetch_tickers(symbols))
+            scan_time = time.perf_counter() - started
+
+            started = time.perf_counter()
+            for symbol in random.sample(symbols, min(1000, n_markets)):
+                manager.on_ticker_snapshot({symbol: exchange._ticker(symbol)})
+            rerank_us = (time.perf_counter() - started) / min(1000, n_markets) * 1e6
+            logging.info(f"📊 {n_markets} mercati, scansione {mode}: {scan_time:.2f}s, {exchange.requests} richieste, "
+                         f"re-rank incrementale {rerank_us:.1f} µs/ticker, top: {ranking[:3]}")
+
+if __name__ == "__main__" and "--benchmark" in sys.argv:
+    benchmark_scan()
+elif __name__ == "__main__":
     manager = DynamicTradingManager()
     selected_pairs = manager.select_trading_pairs()
     logging.info(f"📊 Coppie di trading selezionate: {selected_pairs}")
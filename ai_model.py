@@ -11,6 +11,8 @@ from sklearn.preprocessing import MinMaxScaler
 import xgboost as xgb
 import indicators
 import data_handler
+from frame_memory import declare_columns
+from window_dataset import WindowDataset
 import drl_agent
 import gym_trading_env
 import risk_management
@@ -24,6 +26,9 @@ MODEL_DIR = "/mnt/usb_trading_data/models" if os.path.exists("/mnt/usb_trading_d
 MODEL_FILE = os.path.join(MODEL_DIR, "trading_model.h5")
 XGB_MODEL_FILE = os.path.join(MODEL_DIR, "xgb_trading_model.json")
 
+# 📌 Colonne lette dai modelli (il resto non viene tenuto in memoria)
+declare_columns("ai_model", ["close"])
+
 # Creazione della directory del modello se non esiste
 os.makedirs(MODEL_DIR, exist_ok=True)
 
@@ -89,24 +94,15 @@ def preprocess_data(data):
     scaled_data = scaler.fit_transform(data)
     return scaled_data, scaler
 
-def prepare_lstm_data(data, look_back=60):
-    """Prepara i dati per l'input nel modello LSTM."""
-    X, y = [], []
-    for i in range(look_back, len(data)):
-        X.append(data[i-look_back:i, 0])
-        y.append(data[i, 0])
-    X, y = np.array(X), np.array(y)
-    X = np.reshape(X, (X.shape[0], X.shape[1], 1))
-    return X, y
-
-def prepare_xgboost_data(data, look_back=60):
-    """Prepara i dati per l'input nel modello XGBoost."""
-    X, y = [], []
-    for i in range(look_back, len(data)):
-        X.append(data[i-look_back:i, 0])
-        y.append(data[i, 0])
-    X, y = np.array(X), np.array(y)
-    return X, y
+def prepare_lstm_data(data, look_back=60, horizon=1, stride=1, features=(0,)):
+    """Prepara i dati per l'input nel modello LSTM: finestre (campioni x look_back x feature) come viste senza copie."""
+    dataset = WindowDataset(data, look_back, horizon, stride, features=list(features))
+    return dataset.X, dataset.y
+
+def prepare_xgboost_data(data, look_back=60, horizon=1, stride=1, features=(0,)):
+    """Prepara i dati per l'input nel modello XGBoost: finestre appiattite (campioni x look_back*feature) come viste."""
+    dataset = WindowDataset(data, look_back, horizon, stride, features=list(features))
+    return dataset.X_flat, dataset.y
 
 def predict_with_lstm(model, data):
     """Effettua previsioni utilizzando il modello LSTM."""
@@ -120,24 +116,20 @@ def predict_with_xgboost(model, data):
 
 def main():
     # Caricamento e preprocessamento dei dati
-    data = data_handler.load_data()
+    data = data_handler.load_normalized_data(consumer="ai_model")
     scaled_data, scaler = preprocess_data(data['close'].values.reshape(-1, 1))
 
+    # Finestre di addestramento e validazione (viste sui dati scalati, nessuna copia)
+    dataset = WindowDataset(scaled_data)
+
     # Preparazione dei dati per LSTM
-    X_lstm, y_lstm = prepare_lstm_data(scaled_data)
-    X_train_lstm, X_val_lstm = X_lstm[:int(0.8*len(X_lstm))], X_lstm[int(0.8*len(X_lstm)):]
-    y_train_lstm, y_val_lstm = y_lstm[:int(0.8*len(y_lstm))], y_lstm[int(0.8*len(y_lstm)):]
+    X_train_lstm, y_train_lstm, X_val_lstm, y_val_lstm = dataset.split()
 
     # Addestramento del modello LSTM
     lstm_model, lstm_history = train_lstm_model(X_train_lstm, y_train_lstm, X_val_lstm, y_val_lstm)
 
     # Preparazione dei dati per XGBoost
-    X_xgb, y_xgb = prepare_xgboost_data(scaled_data)
-    X_train_xgb, X_val_xgb = X_xgb[:int(0.8*len(X_xgb))], X_xgb[int(0.8*len(X_xgb)):]
-    y_train_xgb, y_val_xgb = y_xgb[:int(0.8*len(y_xgb))], y_xgb[int(0.8*len(y_xgb)):]
+    X_train_xgb, y_train_xgb, X_val_xgb, y_val_xgb = dataset.split(flat=True)
 
     # Addestramento del modello XGBoost
     xgb_model = train_xgboost_model(X_train_xgb, y_train_xgb, X_val_xgb, y_val_xgb)
-
-    # Esempio di previsione con
-::contentReference[oaicite:0]{index=0}
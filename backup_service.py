@@ -0,0 +1,202 @@
+# backup_service.py - Backup asincrono, deduplicato per contenuto, verso USB e Cloud
+import os
+import json
+import queue
+import atexit
+import shutil
+import hashlib
+import logging
+import threading
+import requests
+from pathlib import Path
+
+# Configurazione logging avanzata
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+# 📌 Parametri del servizio di backup
+BACKUP_QUEUE_SIZE = 64  # File in attesa oltre i quali le nuove richieste vengono scartate
+HASH_BLOCK_SIZE = 1 << 20
+BACKUP_STATE_FILE = "backup_hashes.json"  # Ultimo hash copiato per ogni file e destinazione
+
+def file_hash(path):
+    """SHA-256 del contenuto del file, letto a blocchi."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+# ===========================
+# 🔹 DESTINAZIONI DI BACKUP
+# ===========================
+
+class DirectoryTarget:
+    """Copia in una directory (USB, cartella sincronizzata col Cloud) con scrittura atomica."""
+
+    def __init__(self, directory):
+        self.directory = Path(directory)
+        self.name = f"dir:{self.directory}"
+
+    def write(self, source, name):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        destination = self.directory / name
+        tmp_destination = self.directory / f".{name}.tmp"
+        shutil.copyfile(source, tmp_destination)
+        os.replace(tmp_destination, destination)  # I lettori vedono sempre il file vecchio o quello nuovo completo
+
+    def has(self, name, size):
+        """True se la copia esiste ancora con la dimensione attesa (es. USB non sostituita o svuotata)."""
+        try:
+            return (self.directory / name).stat().st_size == size
+        except OSError:
+            return False
+
+class HttpUploadTarget:
+    """Caricamento su un servizio Cloud via HTTP (multipart)."""
+
+    def __init__(self, url, timeout=60):
+        self.url = url
+        self.timeout = timeout
+        self.name = f"http:{url}"
+
+    def write(self, source, name):
+        with open(source, "rb") as f:
+            response = requests.post(self.url, files={"file": (name, f)}, timeout=self.timeout)
+        response.raise_for_status()
+
+    def has(self, name, size):
+        """Il servizio remoto non si può interrogare: si considera presente l'ultima copia caricata."""
+        return True
+
+# ===========================
+# 🔹 SERVIZIO IN BACKGROUND
+# ===========================
+
+class BackupService:
+    """Esegue i backup in un thread separato con coda limitata.
+
+    - le richieste ripetute per lo stesso file in attesa vengono unite in una sola copia;
+    - un file il cui contenuto coincide con l'ultima versione copiata su una destinazione viene saltato,
+      purché la copia sia ancora presente sulla destinazione;
+    - ogni destinazione riceve il file in modo atomico.
+    """
+
+    def __init__(self, queue_size=BACKUP_QUEUE_SIZE, state_file=BACKUP_STATE_FILE):
+        self.state_file = state_file
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._pending = set()
+        self._lock = threading.Lock()
+        self._hashes = self._load_state()
+        self.stats = {"submitted": 0, "coalesced": 0, "dropped": 0, "unchanged": 0, "copied": 0, "errors": 0}
+        self._thread = threading.Thread(target=self._run, name="backup-service", daemon=True)
+        self._thread.start()
+
+    def _load_state(self):
+        try:
+            with open(self.state_file, "r") as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+
+    def _save_state(self):
+        with self._lock:
+            data = dict(self._hashes)
+        tmp_file = f"{self.state_file}.tmp"
+        with open(tmp_file, "w") as f:
+            json.dump(data, f)
+        os.replace(tmp_file, self.state_file)
+
+    def _count(self, stat):
+        with self._lock:
+            self.stats[stat] += 1
+
+    def submit(self, path, targets, name=None):
+        """Accoda il backup di un file e ritorna subito; il contenuto viene letto al momento della copia."""
+        path = str(path)
+        targets = tuple(targets)
+        key = (path, name or os.path.basename(path), targets)
+        with self._lock:
+            self.stats["submitted"] += 1
+            if key in self._pending:
+                self.stats["coalesced"] += 1
+                return True
+            try:
+                self._queue.put_nowait(key)
+            except queue.Full:
+                self.stats["dropped"] += 1
+                logging.warning(f"⚠️ Coda di backup piena, {path} verrà copiato al prossimo salvataggio.")
+                return False
+            self._pending.add(key)
+        return True
+
+    def _run(self):
+        while True:
+            key = self._queue.get()
+            try:
+                if key is None:
+                    return
+                with self._lock:
+                    # Un salvataggio successivo a questo punto rimette il file in coda con il contenuto nuovo
+                    self._pending.discard(key)
+                self._backup(*key)
+            finally:
+                self._queue.task_done()
+
+    def _backup(self, path, name, targets):
+        if not os.path.exists(path):
+            logging.warning(f"⚠️ Il file {path} non esiste e non può essere copiato.")
+            return
+        try:
+            size = os.path.getsize(path)
+            digest = file_hash(path)
+        except OSError as e:
+            logging.error(f"❌ Errore nella lettura di {path} per il backup: {e}")
+            self._count("errors")
+            return
+
+        changed = False
+        for target in targets:
+            state_key = f"{target.name}|{name}"
+            with self._lock:
+                unchanged = self._hashes.get(state_key) == digest
+            if unchanged and target.has(name, size):
+                self._count("unchanged")
+                continue
+            try:
+                target.write(path, name)
+                with self._lock:
+                    self._hashes[state_key] = digest
+                self._count("copied")
+                changed = True
+                logging.info(f"✅ Backup di {name} completato su {target.name}.")
+            except Exception as e:
+                self._count("errors")
+                logging.error(f"❌ Errore nel backup di {name} su {target.name}: {e}")
+        if changed:
+            self._save_state()
+
+    def flush(self, timeout=None):
+        """Attende lo svuotamento della coda (utile in chiusura o nei test)."""
+        if timeout is None:
+            self._queue.join()
+            return True
+        done = threading.Event()
+        threading.Thread(target=lambda: (self._queue.join(), done.set()), daemon=True).start()
+        return done.wait(timeout)
+
+    def stop(self):
+        """Completa i backup in coda e ferma il thread."""
+        self._queue.put(None)
+        self._thread.join()
+
+_backup_service = None
+_backup_service_lock = threading.Lock()
+
+def get_backup_service():
+    """Restituisce il servizio di backup condiviso dal processo, avviandolo al primo utilizzo."""
+    global _backup_service
+    with _backup_service_lock:
+        if _backup_service is None:
+            _backup_service = BackupService()
+            atexit.register(_backup_service.flush, 30)  # I backup in coda non vanno persi all'uscita
+        return _backup_service
@@ -0,0 +1,262 @@
+# bar_aggregator.py - Aggregazione in streaming dei trade in barre OHLCV per tutti i timeframe configurati
+import os
+import time
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from market_data_store import MarketDataStore
+
+# Configurazione logging avanzata
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+# 📌 Parametri di default
+DEFAULT_TIMEFRAMES = ["1m", "5m", "15m", "30m", "1h", "4h", "1d"]
+ALLOWED_LATENESS_MS = 2000  # Attesa dei trade in ritardo prima di chiudere una barra
+IDLE_TIMEOUT_SECONDS = 5.0  # Simbolo senza trade: da qui l'orario degli eventi avanza con l'orologio locale
+BARS_DIR = "bars"
+FLUSH_INTERVAL_SECONDS = 60.0
+FLUSH_MAX_BARS = 1000
+COMPACT_INTERVAL_SECONDS = 3600.0  # Ogni quanto i file scritti dai flush vengono uniti (uno per partizione)
+
+_UNIT_MS = {"s": 1000, "m": 60_000, "h": 3_600_000, "d": 86_400_000, "w": 604_800_000}
+
+def timeframe_ms(timeframe):
+    """Durata di un timeframe in millisecondi ("1m", "4h", "1d", ...); "D1" è accettato come "1d"."""
+    timeframe = timeframe.strip()
+    if timeframe[:1].isalpha():  # Notazione MetaTrader: D1, H4, M15
+        timeframe = timeframe[1:] + timeframe[0]
+    try:
+        return int(timeframe[:-1]) * _UNIT_MS[timeframe[-1].lower()]
+    except (KeyError, ValueError):
+        raise ValueError(f"Timeframe non valido: {timeframe}")
+
+class _OpenBar:
+    """Barra in costruzione: apertura e chiusura seguono l'orario dei trade, non l'ordine di arrivo."""
+
+    __slots__ = ("start", "open", "high", "low", "close", "volume", "trades", "first_ts", "last_ts")
+
+    def __init__(self, start, timestamp, price, quantity):
+        self.start = start
+        self.open = self.high = self.low = self.close = price
+        self.volume = quantity
+        self.trades = 1
+        self.first_ts = self.last_ts = timestamp
+
+    def add(self, timestamp, price, quantity):
+        if price > self.high:
+            self.high = price
+        elif price < self.low:
+            self.low = price
+        if timestamp < self.first_ts:
+            self.first_ts, self.open = timestamp, price
+        if timestamp >= self.last_ts:
+            self.last_ts, self.close = timestamp, price
+        self.volume += quantity
+        self.trades += 1
+
+    def to_dict(self):
+        return {"timestamp": self.start, "open": self.open, "high": self.high, "low": self.low,
+                "close": self.close, "volume": self.volume, "trades": self.trades}
+
+class BarAggregator:
+    """Costruisce in un solo passaggio le barre OHLCV di ogni timeframe a partire dai trade.
+
+    Una barra viene chiusa quando l'orario dei trade del simbolo supera la sua fine di almeno
+    `allowed_lateness_ms`; i trade in ritardo entro questo margine finiscono nella barra giusta, quelli
+    più vecchi vengono scartati e contati. Alla chiusura gli iscritti ricevono
+    callback(symbol, timeframe, bar). I periodi senza trade non producono barre.
+
+    L'orario di riferimento è il massimo timestamp dei trade ricevuti per simbolo: l'orologio locale
+    serve solo a rilevare i simboli fermi da almeno `idle_timeout` secondi (vedi advance()), così uno
+    scarto tra l'orologio dell'exchange e quello locale non chiude le barre in anticipo.
+    """
+
+    def __init__(self, timeframes=None, allowed_lateness_ms=ALLOWED_LATENESS_MS, idle_timeout=IDLE_TIMEOUT_SECONDS):
+        self.timeframes = {timeframe: timeframe_ms(timeframe) for timeframe in timeframes or DEFAULT_TIMEFRAMES}
+        self.allowed_lateness_ms = allowed_lateness_ms
+        self.idle_timeout = idle_timeout
+        self.open_bars = {}  # (symbol, timeframe) -> {inizio barra: _OpenBar}
+        self.closed_until = {}  # (symbol, timeframe) -> fine dell'ultima barra chiusa
+        self.watermarks = {}  # symbol -> istante fino al quale non si attendono altri trade
+        self.last_event = {}  # symbol -> massimo timestamp dei trade ricevuti
+        self.last_arrival = {}  # symbol -> orologio monotono locale all'arrivo dell'ultimo trade
+        self.subscribers = []
+        self._lock = threading.Lock()
+
+        # 📊 Statistiche
+        self.trades = 0
+        self.late_trades = 0
+        self.closed_bars = 0
+
+    def subscribe(self, callback, timeframes=None):
+        """Registra una funzione chiamata alla chiusura di ogni barra (opzionalmente solo di alcuni timeframe)."""
+        self.subscribers.append((callback, set(timeframes) if timeframes else None))
+
+    def add_trade(self, symbol, timestamp, price, quantity=0.0):
+        """Aggiunge un trade (timestamp in ms) a tutti i timeframe e chiude le barre completate."""
+        with self._lock:
+            self.trades += 1
+            for timeframe, duration in self.timeframes.items():
+                key = (symbol, timeframe)
+                start = timestamp - timestamp % duration
+                if start < self.closed_until.get(key, start):
+                    self.late_trades += 1
+                    continue
+                bars = self.open_bars.setdefault(key, {})
+                bar = bars.get(start)
+                if bar is None:
+                    bars[start] = _OpenBar(start, timestamp, price, quantity)
+                else:
+                    bar.add(timestamp, price, quantity)
+            if timestamp > self.last_event.get(symbol, float("-inf")):
+                self.last_event[symbol] = timestamp
+            self.last_arrival[symbol] = time.monotonic()
+            closed = self._advance(symbol, self.last_event[symbol] - self.allowed_lateness_ms)
+        self._emit(closed)
+
+    def advance(self, now=None):
+        """Chiude le barre scadute dei simboli senza trade da almeno `idle_timeout` secondi (es. da un timer).
+
+        Per un simbolo fermo l'orario degli eventi avanza, dall'ultimo trade ricevuto, del tempo misurato
+        dall'orologio monotono locale (`now`, default time.monotonic()).
+        """
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            closed = []
+            for symbol, arrival in list(self.last_arrival.items()):
+                idle = now - arrival
+                if idle >= self.idle_timeout:
+                    closed += self._advance(symbol, self.last_event[symbol] + idle * 1000 - self.allowed_lateness_ms)
+        self._emit(closed)
+
+    def flush(self, symbol=None):
+        """Chiude subito tutte le barre aperte (es. allo spegnimento).
+
+        Il watermark non cambia: le barre successive si chiudono normalmente, mentre i trade che
+        ricadono in una barra già chiusa vengono contati come in ritardo.
+        """
+        with self._lock:
+            closed = []
+            for (name, timeframe), bars in self.open_bars.items():
+                if symbol in (None, name):
+                    closed += self._close_bars(name, timeframe, bars, list(bars))
+            self.closed_bars += len(closed)
+        self._emit(closed)
+
+    def _advance(self, symbol, watermark):
+        if watermark <= self.watermarks.get(symbol, float("-inf")):
+            return []
+        self.watermarks[symbol] = watermark
+        closed = []
+        for timeframe, duration in self.timeframes.items():
+            bars = self.open_bars.get((symbol, timeframe))
+            if bars:
+                closed += self._close_bars(symbol, timeframe, bars,
+                                           [start for start in bars if start + duration <= watermark])
+        self.closed_bars += len(closed)
+        return closed
+
+    def _close_bars(self, symbol, timeframe, bars, starts):
+        closed = []
+        for start in sorted(starts):
+            closed.append((symbol, timeframe, bars.pop(start).to_dict()))
+            self.closed_until[(symbol, timeframe)] = start + self.timeframes[timeframe]
+        return closed
+
+    def _emit(self, closed):
+        for symbol, timeframe, bar in closed:
+            for callback, timeframes in self.subscribers:
+                if timeframes is not None and timeframe not in timeframes:
+                    continue
+                try:
+                    callback(symbol, timeframe, bar)
+                except Exception as e:
+                    logging.error(f"❌ Errore nell'iscritto alle barre {symbol} {timeframe}: {e}")
+
+    def stats(self):
+        with self._lock:
+            return {"trades": self.trades, "late_trades": self.late_trades, "closed_bars": self.closed_bars,
+                    "open_bars": sum(len(bars) for bars in self.open_bars.values())}
+
+# ===========================
+# 🔹 SALVATAGGIO DELLE BARRE CHIUSE
+# ===========================
+
+class ClosedBarWriter:
+    """Iscritto che salva solo le barre chiuse, a blocchi, in un archivio Parquet per timeframe.
+
+    Layout: <root>/<timeframe>/coin_id=<symbol>/date=<YYYY-MM-DD>/part-*.parquet (vedi MarketDataStore).
+    La scrittura avviene in un thread separato per non bloccare la ricezione dei trade. Ogni flush crea
+    un file per partizione: ogni `compact_interval` secondi e alla chiusura le partizioni toccate vengono
+    unite con MarketDataStore.compact(), così il numero di file non cresce senza limite.
+    """
+
+    def __init__(self, root=BARS_DIR, flush_interval=FLUSH_INTERVAL_SECONDS, flush_bars=FLUSH_MAX_BARS,
+                 compact_interval=COMPACT_INTERVAL_SECONDS):
+        self.root = root
+        self.flush_interval = flush_interval
+        self.flush_bars = flush_bars
+        self.compact_interval = compact_interval
+        self._touched = set()  # (timeframe, symbol) scritti dopo l'ultima compattazione (solo thread di scrittura)
+        self._last_compact = time.monotonic()
+        self.stores = {}
+        self._pending = {}  # (symbol, timeframe) -> barre chiuse non ancora salvate
+        self._pending_count = 0
+        self._last_flush = time.monotonic()
+        self._lock = threading.Lock()
+        self._executor = None  # Creato alla prima scrittura, di nuovo dopo close()
+
+    def store(self, timeframe):
+        store = self.stores.get(timeframe)
+        if store is None:
+            store = self.stores[timeframe] = MarketDataStore(os.path.join(self.root, timeframe))
+        return store
+
+    def __call__(self, symbol, timeframe, bar):
+        with self._lock:
+            self._pending.setdefault((symbol, timeframe), []).append(bar)
+            self._pending_count += 1
+            due = (self._pending_count >= self.flush_bars
+                   or time.monotonic() - self._last_flush >= self.flush_interval)
+        if due:
+            self.flush()
+
+    def flush(self):
+        """Consegna al thread di scrittura le barre in attesa."""
+        with self._lock:
+            pending, self._pending, self._pending_count = self._pending, {}, 0
+            self._last_flush = time.monotonic()
+            if not pending:
+                return None
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="bar-writer")
+            return self._executor.submit(self._write, pending)
+
+    def _write(self, pending):
+        for (symbol, timeframe), bars in pending.items():
+            try:
+                self.store(timeframe).write_bars(symbol, bars)
+                self._touched.add((timeframe, symbol))
+            except Exception as e:
+                logging.error(f"❌ Errore nel salvataggio delle barre {symbol} {timeframe}: {e}")
+        if time.monotonic() - self._last_compact >= self.compact_interval:
+            self._compact()
+
+    def _compact(self):
+        """Unisce i file delle crypto scritte dopo l'ultima compattazione (nel thread di scrittura)."""
+        touched, self._touched = self._touched, set()
+        self._last_compact = time.monotonic()
+        for timeframe, symbol in sorted(touched):
+            try:
+                self.store(timeframe).compact(symbol)
+            except Exception as e:
+                logging.error(f"❌ Errore nella compattazione delle barre {symbol} {timeframe}: {e}")
+
+    def close(self):
+        """Salva le barre rimaste, compatta i file scritti e attende la fine delle scritture."""
+        self.flush()
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.submit(self._compact)
+            executor.shutdown(wait=True)
@@ -5,9 +5,16 @@ import logging
 import sys
 import aiohttp
 import asyncio
-import random
+import time
 from datetime import datetime
-from data_loader import load_market_data_apis
+from data_loader import load_market_data_apis, load_config
+from rate_limiter import get_rate_limiter, parse_retry_after
+from exchange_health import HealthTracker
+from http_cache import ResponseCache
+from market_data_store import store_from_config
+from incremental_sync import (WatermarkStore, DEFAULT_TIMEFRAME, DELTA_FILE, append_bars,
+                              days_to_fetch, filter_new_bars, load_delta_bars)
+from json_stream_reader import iter_raw_bars
 
 # Impostazione del loop per Windows
 if sys.platform == "win32":
@@ -20,25 +27,60 @@ logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(
 DAYS_HISTORY = 60  # Default: 60 giorni
 
 # Caricare le API disponibili
-services = load_market_data_apis()
+services = {"exchanges": load_market_data_apis() or []}
+
+# 📌 Scheduler condiviso con un token bucket per exchange
+rate_limiter = get_rate_limiter()
+
+# 📌 Punteggi di salute degli exchange, persistiti tra un'esecuzione e l'altra
+health_tracker = HealthTracker()
+
+# Codici HTTP che indicano il superamento del limite di richieste
+RATE_LIMIT_STATUSES = {400, 429}
+
+# 📌 Parametri di download configurabili in config.json
+CONFIG = load_config() or {}
+FETCH_CONFIG = CONFIG.get("market_data_fetch", {})
+UNIVERSE_SIZE = FETCH_CONFIG.get("universe_size", 10)  # Numero di crypto da scaricare
+CONCURRENT_FETCH = FETCH_CONFIG.get("concurrent_fetch", True)
+MAX_CONCURRENT_REQUESTS = FETCH_CONFIG.get("max_concurrent_requests", 10)
+INCREMENTAL_SYNC = FETCH_CONFIG.get("incremental_sync", True)  # Scarica solo le barre nuove
+HEDGED_REQUESTS = FETCH_CONFIG.get("hedged_requests", True)  # Richieste coperte su più exchange
+HEDGE_DELAY = FETCH_CONFIG.get("hedge_delay_seconds", 2.0)  # Attesa prima di interrogare l'exchange successivo
+
+# 📌 Cache su disco delle risposte: riavvii e import multipli non consumano la quota API
+response_cache = ResponseCache(ttls=FETCH_CONFIG.get("cache_ttl_seconds"),
+                               max_size_mb=FETCH_CONFIG.get("cache_max_size_mb", 200))
 
 # 📌 Backup dei dati in locale, USB o Cloud
 STORAGE_PATH = "/mnt/usb_trading_data/market_data.json" if os.path.exists("/mnt/usb_trading_data") else "market_data.json"
 CLOUD_BACKUP = "/mnt/google_drive/trading_backup/market_data.json"
 
+# 📌 Archivio Parquet per le barre OHLCV (None se il backend configurato è il JSON)
+market_store = store_from_config(CONFIG.get("storage", {}))
+
 # ===========================
 # 🔹 GESTIONE API MULTI-EXCHANGE
 # ===========================
 
-async def fetch_data_from_exchanges(session, currency):
+async def fetch_data_from_exchanges(session, currency, hedged=HEDGED_REQUESTS):
     """Scarica dati dai vari exchange e passa al successivo se l'API raggiunge il limite."""
-    for exchange in services["exchanges"]:
+    try:
+        if hedged:
+            return await fetch_data_from_exchanges_hedged(session, currency)
+        return await fetch_data_from_exchanges_sequential(session, currency)
+    finally:
+        health_tracker.save()
+
+async def fetch_data_from_exchanges_sequential(session, currency):
+    """Interroga gli exchange uno alla volta, in ordine di affidabilità."""
+    for exchange in health_tracker.rank(services["exchanges"]):
         api_url = exchange["api_url"].replace("{currency}", currency)
         requests_per_minute = exchange["limitations"]["requests_per_minute"]
 
         logging.info(f"🔄 Tentando di recuperare dati da {exchange['name']} ({requests_per_minute} req/min)...")
         
-        data = await fetch_market_data(session, api_url, requests_per_minute)
+        data = await fetch_market_data(session, api_url, requests_per_minute, exchange_name=exchange["name"])
         if data:
             logging.info(f"✅ Dati ottenuti con successo da {exchange['name']}!")
             return data
@@ -48,19 +90,105 @@ async def fetch_data_from_exchanges(session, currency):
     logging.error("❌ Nessun exchange disponibile ha fornito dati validi.")
     return None
 
-async def fetch_market_data(session, url, requests_per_minute, retries=3):
+async def fetch_data_from_exchanges_hedged(session, currency, hedge_delay=HEDGE_DELAY):
+    """Interroga l'exchange più affidabile e, superato il budget di latenza o in caso di errore,
+    anche il successivo: vince la prima risposta valida, le richieste rimaste vengono annullate."""
+    remaining = health_tracker.rank(services["exchanges"])
+
+    def launch_next():
+        exchange = remaining.pop(0)
+        api_url = exchange["api_url"].replace("{currency}", currency)
+        logging.info(f"🔄 Richiesta coperta a {exchange['name']} (punteggio {health_tracker.score(exchange['name']):.2f})...")
+        task = asyncio.create_task(fetch_market_data(session, api_url, exchange["limitations"]["requests_per_minute"],
+                                                     retries=1, exchange_name=exchange["name"]))
+        task.exchange_name = exchange["name"]
+        task.started = time.monotonic()
+        return task
+
+    if not remaining:
+        logging.error("❌ Nessun exchange configurato.")
+        return None
+
+    pending = {launch_next()}
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, timeout=hedge_delay if remaining else None,
+                                               return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                data = task.result()
+                if data:
+                    logging.info(f"✅ Dati ottenuti con successo da {task.exchange_name}!")
+                    return data
+                logging.warning(f"⚠️ Nessun dato valido da {task.exchange_name}.")
+
+            # Budget di latenza superato o richiesta fallita: si coinvolge l'exchange successivo
+            if remaining:
+                pending.add(launch_next())
+    finally:
+        # Le richieste annullate non hanno un esito: contano come timeout solo se hanno superato il budget
+        # di latenza, altrimenti (coperture appena partite) non modificano il punteggio
+        for task in pending:
+            task.cancel()
+            if time.monotonic() - task.started >= hedge_delay:
+                record_health(task.exchange_name, task.started, ok=False)
+
+    logging.error("❌ Nessun exchange disponibile ha fornito dati validi.")
+    return None
+
+def record_health(exchange_name, started, ok, rate_limited=False):
+    """Registra latenza ed esito di una richiesta nel punteggio di salute dell'exchange."""
+    if exchange_name:
+        health_tracker.record(exchange_name, time.monotonic() - started, ok, rate_limited)
+
+async def handle_rate_limit(response, exchange_name, default_wait):
+    """Rispetta l'header Retry-After: blocca il bucket dell'exchange o, se assente, attende direttamente."""
+    wait_time = parse_retry_after(response.headers.get("Retry-After"), default_wait)
+    if exchange_name:
+        rate_limiter.penalize(exchange_name, wait_time)
+    else:
+        logging.warning(f"⚠️ Errore {response.status}. Attesa {wait_time:.1f} secondi prima di riprovare...")
+        await asyncio.sleep(wait_time)
+
+async def request_json(session, url, exchange_name=None, delay=2):
+    """Singola richiesta GET che passa da cache su disco, rate limiter e punteggio di salute."""
+    cached_data, fresh, entry = response_cache.lookup(url)
+    if fresh:
+        return cached_data
+
+    if exchange_name:
+        await rate_limiter.acquire(exchange_name)
+    started = time.monotonic()
+    try:
+        headers = response_cache.conditional_headers(entry)
+        async with session.get(url, headers=headers, timeout=aiohttp.ClientTimeout(total=30)) as response:
+            if response.status == 304 and entry is not None:
+                record_health(exchange_name, started, ok=True)
+                response_cache.revalidated(entry, response.headers)
+                return cached_data
+            elif response.status == 200:
+                data = await response.json()
+                record_health(exchange_name, started, ok=True)
+                response_cache.store(url, data, response.headers)
+                return data
+            elif response.status in RATE_LIMIT_STATUSES:
+                record_health(exchange_name, started, ok=False, rate_limited=True)
+                await handle_rate_limit(response, exchange_name, delay)
+            else:
+                record_health(exchange_name, started, ok=False)
+    except Exception:
+        record_health(exchange_name, started, ok=False)
+        raise
+    return None
+
+async def fetch_market_data(session, url, requests_per_minute, retries=3, exchange_name=None):
     """Scarica i dati di mercato attuali con gestione avanzata degli errori."""
     delay = max(2, 60 / requests_per_minute)
     
     for attempt in range(retries):
         try:
-            async with session.get(url, timeout=aiohttp.ClientTimeout(total=30)) as response:
-                if response.status == 200:
-                    return await response.json()
-                elif response.status in {400, 429}:
-                    wait_time = random.randint(20, 40)
-                    logging.warning(f"⚠️ Errore {response.status}. Attesa {wait_time} secondi prima di riprovare...")
-                    await asyncio.sleep(wait_time)
+            data = await request_json(session, url, exchange_name, delay)
+            if data is not None:
+                return data
         except Exception as e:
             logging.error(f"❌ Errore nella richiesta API {url}: {e}")
             await asyncio.sleep(delay)
@@ -69,53 +197,210 @@ async def fetch_market_data(session, url, requests_per_minute, retries=3):
 
 async def fetch_historical_data(session, coin_id, currency, days=DAYS_HISTORY, retries=3):
     """Scarica i dati storici con gestione avanzata degli errori."""
-    for exchange in services["exchanges"]:
-        historical_url = exchange["api_url"].replace("{currency}", currency).replace("{symbol}", coin_id)
+    for exchange in health_tracker.rank(services["exchanges"]):
+        historical_url = (exchange["api_url"].replace("{currency}", currency)
+                          .replace("{symbol}", coin_id).replace("{days}", str(days)))
+        
+        delay = max(2, 60 / exchange["limitations"]["requests_per_minute"])
         
         for attempt in range(retries):
             try:
-                async with session.get(historical_url, timeout=aiohttp.ClientTimeout(total=30)) as response:
-                    if response.status == 200:
-                        return await response.json()
+                data = await request_json(session, historical_url, exchange["name"], delay)
+                if data is not None:
+                    return data
             except Exception as e:
                 logging.error(f"❌ Errore nel recupero dati storici {coin_id} da {exchange['name']}: {e}")
                 await asyncio.sleep(2 ** attempt)
     
     return None
 
-async def main_fetch_all_data(currency):
-    """Scarica sia i dati di mercato attuali che quelli storici, con failover su più exchange."""
-    async with aiohttp.ClientSession() as session:
+async def fetch_all_historical_concurrently(session, coins, currency, filename, max_concurrency=MAX_CONCURRENT_REQUESTS):
+    """Scarica i dati storici di più crypto in parallelo e li salva man mano che arrivano."""
+    semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def fetch_coin(crypto):
+        async with semaphore:
+            crypto["historical_prices"] = await fetch_historical_data(session, crypto["id"], currency)
+            return crypto
+
+    final_data = []
+    tasks = [asyncio.create_task(fetch_coin(crypto)) for crypto in coins]
+    with StreamingJsonWriter(filename) as writer:
+        for completed in asyncio.as_completed(tasks):
+            crypto = await completed
+            writer.write(storage_record(crypto))
+            final_data.append(crypto)
+            logging.info(f"📥 Dati storici di {crypto['id']} salvati ({len(final_data)}/{len(coins)}).")
+
+    logging.info(f"✅ Backup dati salvato in {filename}.")
+    return final_data
+
+async def sync_historical_incremental(session, coins, currency, watermarks, max_concurrency=MAX_CONCURRENT_REQUESTS,
+                                     timeframe=DEFAULT_TIMEFRAME):
+    """Scarica solo le barre successive al watermark di ogni crypto e le aggiunge in coda allo storico.
+
+    Nessun api_url di market_data_apis.json prevede il segnaposto {days}: gli exchange restituiscono
+    sempre la stessa finestra e le barre già presenti vengono scartate lato client da filter_new_bars.
+    """
+    semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def sync_coin(crypto):
+        coin_id = crypto["id"]
+        watermark = watermarks.get(coin_id, timeframe)
+        async with semaphore:
+            bars = await fetch_historical_data(session, coin_id, currency, days=days_to_fetch(watermark, DAYS_HISTORY))
+
+        new_bars = filter_new_bars(bars, watermark)
+        if market_store is not None:
+            market_store.write_bars(coin_id, new_bars)
+        else:
+            append_bars(coin_id, new_bars, timeframe)
+        watermarks.update(coin_id, new_bars, timeframe)
+        crypto["historical_prices"] = new_bars
+        return crypto
+
+    try:
+        # Con return_exceptions un errore non lascia le altre crypto in esecuzione durante il salvataggio;
+        # anche in caso di annullamento gather attende la fine di tutti i task prima del finally
+        results = await asyncio.gather(*(sync_coin(crypto) for crypto in coins), return_exceptions=True)
+    finally:
+        # Un solo salvataggio per sincronizzazione, quando nessuna crypto sta più aggiungendo barre
+        watermarks.save()
+    errors = [result for result in results if isinstance(result, BaseException)]
+    for crypto, result in zip(coins, results):
+        if isinstance(result, BaseException):
+            logging.error(f"❌ Sincronizzazione incrementale di {crypto['id']} non riuscita: {result}")
+    if errors:
+        raise errors[0]
+    synced = results
+    total_bars = sum(len(crypto["historical_prices"]) for crypto in synced)
+    logging.info(f"✅ Sincronizzazione incrementale: {total_bars} nuove barre per {len(synced)} crypto.")
+    return synced
+
+def seed_watermarks_from_storage(watermarks, timeframe=DEFAULT_TIMEFRAME):
+    """Ricostruisce i watermark dall'ultima barra già salvata per ogni crypto (file dei watermark assente).
+
+    Restituisce False se lo storico non contiene barre: in quel caso serve un download completo.
+    """
+    if market_store is not None:
+        bars = market_store.read(columns=["close"]).reset_index()
+        for coin_id, last in bars.groupby("coin_id")["timestamp"].max().items():
+            watermarks.update(coin_id, [{"timestamp": last.value // 1_000_000}], timeframe)
+    else:
+        # Lettura in streaming di market_data.json e del log incrementale non ancora consolidato
+        for coin_id, bar in iter_raw_bars(STORAGE_PATH):
+            watermarks.update(coin_id, [bar], timeframe)
+        for bar in load_delta_bars():
+            if bar.get("coin_id"):
+                watermarks.update(bar["coin_id"], [bar], bar.get("timeframe", timeframe))
+    if not watermarks.watermarks:
+        return False
+    watermarks.save()
+    logging.info(f"✅ Watermark ricostruiti dallo storico per {len(watermarks.watermarks)} crypto.")
+    return True
+
+async def main_fetch_all_data(currency, concurrent=CONCURRENT_FETCH, universe_size=UNIVERSE_SIZE,
+                              max_concurrency=MAX_CONCURRENT_REQUESTS, incremental=INCREMENTAL_SYNC):
+    """Scarica sia i dati di mercato attuali che quelli storici, con failover su più exchange.
+
+    In modalità incrementale, se esiste già uno storico completo, vengono scaricate e salvate solo
+    le barre successive ai watermark e `historical_prices` contiene soltanto le barre nuove.
+    """
+    watermarks = WatermarkStore()
+    connector = aiohttp.TCPConnector(limit=max_concurrency)
+    async with aiohttp.ClientSession(connector=connector) as session:
         market_data = await fetch_data_from_exchanges(session, currency)
 
         if not market_data:
             logging.error("❌ Errore: dati di mercato non disponibili, uso backup.")
             market_data = load_backup("market_data_backup.json")
 
-        final_data = []
-        for crypto in market_data[:10]:
-            coin_id = crypto.get("id")
-            if not coin_id:
-                continue
+        coins = [crypto for crypto in market_data[:universe_size] if crypto.get("id")]
 
-            historical_data = await fetch_historical_data(session, coin_id, currency)
-            crypto["historical_prices"] = historical_data
-            final_data.append(crypto)
+        # 📌 Senza watermark lo storico esistente va riletto, altrimenti le barre già salvate verrebbero riaggiunte
+        if incremental and os.path.exists(STORAGE_PATH) and not watermarks.loaded:
+            if not seed_watermarks_from_storage(watermarks):
+                logging.warning("⚠️ Watermark assenti e storico senza barre: download completo.")
+                incremental = False
+
+        if incremental and os.path.exists(STORAGE_PATH):
+            synced = await sync_historical_incremental(session, coins, currency, watermarks, max_concurrency)
+            save_fetch_state()
+            return synced
+
+        if concurrent:
+            final_data = await fetch_all_historical_concurrently(session, coins, currency, STORAGE_PATH, max_concurrency)
+        else:
+            final_data = []
+            for crypto in coins:
+                crypto["historical_prices"] = await fetch_historical_data(session, crypto["id"], currency)
+                final_data.append(crypto)
+            save_backup([storage_record(crypto) for crypto in final_data], STORAGE_PATH)
+
+        # 📌 Il download completo sostituisce il log incrementale e riparte dai nuovi watermark
+        if os.path.exists(DELTA_FILE):
+            os.remove(DELTA_FILE)
+        watermarks.seed_from(final_data)
+        watermarks.save()
 
-        save_backup(final_data, STORAGE_PATH)
         sync_to_cloud()
+        save_fetch_state()
         return final_data
 
+def save_fetch_state():
+    """Salva punteggi di salute e indice della cache e registra le statistiche della cache."""
+    health_tracker.save()
+    response_cache.save()
+    logging.info(f"📊 Cache HTTP: {response_cache.stats()}")
+
 # ===========================
 # 🔹 GESTIONE BACKUP
 # ===========================
 
+def storage_record(crypto):
+    """Con l'archivio Parquet attivo le barre vanno nei file colonnari e nel JSON resta solo l'istantanea di mercato."""
+    if market_store is None:
+        return crypto
+    market_store.write_bars(crypto["id"], crypto.get("historical_prices") or [], replace=True)
+    return {key: value for key, value in crypto.items() if key != "historical_prices"}
+
 def save_backup(data, filename):
     """Salva un backup locale, su USB e Cloud dei dati API."""
     with open(filename, "w") as file:
         json.dump(data, file, indent=4)
     logging.info(f"✅ Backup dati salvato in {filename}.")
 
+class StreamingJsonWriter:
+    """Scrive un array JSON un elemento alla volta, rendendo definitivo il file solo a scrittura completata."""
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.tmp_filename = f"{filename}.tmp"
+        self.count = 0
+        self._file = None
+
+    def __enter__(self):
+        self._file = open(self.tmp_filename, "w")
+        self._file.write("[\n")
+        return self
+
+    def write(self, item):
+        """Aggiunge un elemento all'array e lo scrive subito su disco."""
+        if self.count:
+            self._file.write(",\n")
+        json.dump(item, self._file)
+        self._file.flush()
+        self.count += 1
+
+    def __exit__(self, exc_type, exc, tb):
+        self._file.write("\n]\n")
+        self._file.close()
+        if exc_type is None:
+            os.replace(self.tmp_filename, self.filename)
+        else:
+            os.remove(self.tmp_filename)
+        return False
+
 def load_backup(filename):
     """Carica i dati salvati in precedenza in caso di errore API."""
     if os.path.exists(filename):
@@ -134,5 +419,51 @@ def sync_to_cloud():
         except Exception as e:
             logging.error(f"❌ Errore nel backup su Google Drive: {e}")
 
+# ===========================
+# 🔹 VERIFICA
+# ===========================
+
+async def incremental_failure_check():
+    """Una crypto che fallisce non fa salvare i watermark mentre le altre stanno ancora scrivendo barre."""
+    import tempfile
+    global fetch_historical_data
+    now_ms = int(time.time() * 1000)
+    bars = [{"timestamp": now_ms - i * 60_000, "open": 1.0, "high": 1.0, "low": 1.0, "close": 1.0, "volume": 1.0}
+            for i in range(3, 0, -1)]
+
+    async def fake_fetch(session, coin_id, currency, days=DAYS_HISTORY, retries=3):
+        if coin_id == "failing":
+            raise RuntimeError("errore simulato")
+        if coin_id == "slow":
+            await asyncio.sleep(0.2)  # Termina dopo l'errore di "failing"
+        return bars
+
+    original_fetch, original_dir = fetch_historical_data, os.getcwd()
+    with tempfile.TemporaryDirectory() as directory:
+        os.chdir(directory)  # Watermark, log incrementale e archivio Parquet nella directory temporanea
+        fetch_historical_data = fake_fetch
+        try:
+            watermarks = WatermarkStore()
+            coins = [{"id": "fast"}, {"id": "failing"}, {"id": "slow"}]
+            try:
+                await sync_historical_incremental(None, coins, "eur", watermarks)
+                raised = False
+            except RuntimeError:
+                raised = True
+            saved = WatermarkStore().watermarks
+            # Seconda sincronizzazione: nessuna barra di "slow" deve essere aggiunta di nuovo
+            again = await sync_historical_incremental(None, [{"id": "fast"}, {"id": "slow"}], "eur", WatermarkStore())
+        finally:
+            fetch_historical_data = original_fetch
+            os.chdir(original_dir)
+
+    checks = {"raised": raised, "slow_saved": "slow" in saved and "fast" in saved, "failing_absent": "failing" not in saved,
+              "no_duplicates": all(not crypto["historical_prices"] for crypto in again)}
+    ok = all(checks.values())
+    logging.info(f"{'✅' if ok else '❌'} Sincronizzazione incrementale con una crypto in errore: {checks}")
+    return ok
+
 if __name__ == "__main__":
+    if sys.argv[1:] == ["check"]:
+        sys.exit(0 if asyncio.run(incremental_failure_check()) else 1)
     asyncio.run(main_fetch_all_data("eur"))
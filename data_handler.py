@@ -1,156 +1,330 @@
 # data_handler.py
 import os
+import sys
 import pandas as pd
 import asyncio
 import json
 import logging
-import websockets
+import itertools
 from datetime import datetime
-from sklearn.preprocessing import MinMaxScaler
 import data_api_module
-from indicators import TradingIndicators
+import incremental_sync
+from market_data_store import migrate_from_json
+from json_stream_reader import iter_raw_bars, iter_bar_chunks, chunks_to_dataframe, compact_bar_frame
+from panel_indicators import compute_panel_indicators
+from normalizer import FeatureNormalizer, NORMALIZER_STATE_FILE
+from freshness_index import FreshnessIndex, FRESHNESS_FILE as FRESHNESS_INDEX_FILE
+from frame_memory import compact_frame, required_columns, log_memory_report
+from tick_pipeline import TickPipeline
+from bar_aggregator import BarAggregator, ClosedBarWriter, DEFAULT_TIMEFRAMES, timeframe_ms
+from websocket_feed import FeedManager
 import shutil
 
 # Configurazioni di salvataggio e backup
 SAVE_DIRECTORY = "/mnt/usb_trading_data/processed_data" if os.path.exists("/mnt/usb_trading_data") else "D:/trading_data/processed_data"
-HISTORICAL_DATA_FILE = os.path.join(SAVE_DIRECTORY, "historical_data.parquet")
+HISTORICAL_DATA_DIR = os.path.join(SAVE_DIRECTORY, "historical_data")  # Un file Parquet elaborato per crypto
+FRESHNESS_FILE = os.path.join(SAVE_DIRECTORY, FRESHNESS_INDEX_FILE)  # Stato di aggiornamento per crypto e timeframe
 SCALPING_DATA_FILE = os.path.join(SAVE_DIRECTORY, "scalping_data.parquet")
+SCALPING_DATA_DIR = os.path.join(SAVE_DIRECTORY, "scalping_data")  # Trade salvati a blocchi dalla tick pipeline
+BARS_DATA_DIR = os.path.join(SAVE_DIRECTORY, "bars")  # Barre OHLCV chiuse costruite dai trade in tempo reale
+NORMALIZER_FILE = os.path.join(SAVE_DIRECTORY, NORMALIZER_STATE_FILE)  # Statistiche di normalizzazione per crypto
 RAW_DATA_FILE = "market_data.json"
-MAX_AGE = 30 * 24 * 60 * 60  # 30 giorni in secondi
 
-# WebSocket URL per dati in tempo reale per scalping
-WEBSOCKET_URL = "wss://stream.binance.com:9443/ws/btcusdt@trade"
+# WebSocket per dati in tempo reale per scalping: stream combinati di tutti i simboli configurati
+WEBSOCKET_BASE_URL = "wss://stream.binance.com:9443"
+WEBSOCKET_SYMBOLS = data_api_module.CONFIG.get("trading_parameters", {}).get("scalping", {}).get("symbols", ["BTCUSDT"])
 
 # Configurazione logging avanzato
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
 
-# Creazione dello scaler per la normalizzazione dei dati
-scaler = MinMaxScaler()
+# 📌 Archivio Parquet dei dati grezzi (None se il backend configurato è market_data.json)
+market_store = data_api_module.market_store
+
+# 📌 Normalizzatore persistente: stessa scala per training, backtest e tempo reale
+normalizer = FeatureNormalizer(state_file=NORMALIZER_FILE)
+
+# 📌 Indice di aggiornamento: si rielaborano solo le crypto con barre nuove
+freshness_index = FreshnessIndex(FRESHNESS_FILE)
+
+# 📌 Barre OHLCV di tutti i timeframe configurati costruite dallo stesso flusso di trade
+TIMEFRAMES = data_api_module.CONFIG.get("trading_parameters", {}).get("timeframes", DEFAULT_TIMEFRAMES)
+bar_aggregator = BarAggregator(TIMEFRAMES)
+bar_writer = ClosedBarWriter(BARS_DATA_DIR)
+bar_aggregator.subscribe(bar_writer)
+
+# 📌 Ring buffer dei trade in tempo reale: indicatori aggiornati tick per tick, salvataggio a blocchi
+tick_pipeline = TickPipeline(flush_dir=SCALPING_DATA_DIR, trade_listeners=[bar_aggregator.add_trade])
 
 async def process_websocket_message(message):
     """Elabora il messaggio ricevuto dal WebSocket per dati real-time per scalping."""
-    try:
-        data = json.loads(message)
-        price = float(data["p"])  # Prezzo dell'ultima operazione
-        timestamp = datetime.fromtimestamp(data["T"] / 1000.0)  # Converti timestamp
+    tick_pipeline.process_message(message)
 
-        df = pd.DataFrame([[timestamp, price]], columns=["timestamp", "price"])
-        df.set_index("timestamp", inplace=True)
+def get_scalping_data(symbol="BTCUSDT", n=None, compact=False, consumer=None, normalized=True):
+    """Ultimi trade di un simbolo con i relativi indicatori, letti dal ring buffer in memoria.
 
-        # Calcolo indicatori tecnici in tempo reale per scalping
-        df["rsi"] = TradingIndicators.relative_strength_index(df)
-        df["macd"], df["macd_signal"] = TradingIndicators.moving_average_convergence_divergence(df)
-        df["ema"] = TradingIndicators.exponential_moving_average(df)
-        df["bollinger_upper"], df["bollinger_lower"] = TradingIndicators.bollinger_bands(df)
+    Con normalized=True (default) i tick hanno le feature dei dati storici sulla stessa scala usata
+    in training e backtest (vedi normalize_ticks); con compact=True restano solo le colonne dichiarate
+    dai consumatori, in float32.
+    """
+    df = tick_pipeline.buffer(symbol).latest(n)
+    if normalized:
+        df = normalize_ticks(df, symbol)
+    return compact_frame(df, required_columns(consumer)) if compact else df
 
-        # Normalizzazione dei dati per scalping
-        df = normalize_data(df)
+def get_bar_frames(symbols, timeframe="1m", bars=500):
+    """Ultime `bars` barre chiuse di più simboli, con un'unica lettura dell'archivio delle barre.
 
-        # Salvataggio dati per scalping
-        save_processed_data(df, SCALPING_DATA_FILE)
-        logging.info(f"✅ Dati scalping aggiornati e salvati: {df.tail(1)}")
+    Restituisce {simbolo: DataFrame OHLCV indicizzato per tempo}; i simboli senza barre sono assenti.
+    """
+    start = pd.Timestamp.now(tz="UTC").tz_localize(None) - pd.Timedelta(milliseconds=timeframe_ms(timeframe) * bars)
+    df = bar_writer.store(timeframe).read(coin_ids=list(symbols), start=start)
+    return {str(symbol): group.drop(columns="coin_id").tail(bars)
+            for symbol, group in df.groupby("coin_id", sort=False)}
 
-    except Exception as e:
-        logging.error(f"❌ Errore nell'elaborazione del messaggio WebSocket: {e}")
+# 📌 Colonne dei tick che corrispondono alle feature delle barre storiche
+TICK_FEATURES = {"close": "price", "open": "price", "high": "price", "low": "price", "volume": "quantity"}
 
-async def consume_websocket():
-    """Consuma dati dal WebSocket per operazioni di scalping."""
-    async with websockets.connect(WEBSOCKET_URL) as websocket:
-        logging.info("✅ Connessione WebSocket stabilita per dati real-time.")
-        try:
-            async for message in websocket:
-                await process_websocket_message(message)
-        except websockets.ConnectionClosed:
-            logging.warning("⚠️ Connessione WebSocket chiusa. Riconnessione in corso...")
-            await asyncio.sleep(5)
-            await consume_websocket()
-        except Exception as e:
-            logging.error(f"❌ Errore durante la ricezione dei dati WebSocket: {e}")
-            await asyncio.sleep(5)
-            await consume_websocket()
+def normalize_ticks(df, symbol):
+    """Tick di un simbolo con le feature del normalizzatore, scalati con le statistiche salvate (fit=False).
+
+    Il prezzo del trade vale come open/high/low/close e la quantità come volume; gli indicatori del ring
+    buffer hanno già i nomi delle feature. Un simbolo senza statistiche proprie usa quelle globali.
+    """
+    ticks = pd.DataFrame(index=df.index)
+    for feature in normalizer.features:
+        column = TICK_FEATURES.get(feature, feature)
+        ticks[feature] = df[column] if column in df.columns else float("nan")
+    ticks[normalizer.symbol_column] = symbol
+    return normalize_data(ticks, fit=False)
+
+async def advance_bar_clock(interval=1.0):
+    """Chiude le barre scadute anche quando non arrivano trade (mercato fermo o connessione interrotta)."""
+    while True:
+        await asyncio.sleep(interval)
+        bar_aggregator.advance()
+
+async def consume_websocket(symbols=None):
+    """Consuma dati dal WebSocket per operazioni di scalping (riconnessione gestita dal FeedManager)."""
+    feed = FeedManager(symbols or WEBSOCKET_SYMBOLS, base_url=WEBSOCKET_BASE_URL)
+    feed.add_handler(process_websocket_message)
+    tick_pipeline.start_flusher()
+    bar_clock = asyncio.get_running_loop().create_task(advance_bar_clock())
+    try:
+        await feed.run()
+    finally:
+        bar_clock.cancel()
+        await tick_pipeline.stop_flusher()
+        # Le barre ancora aperte vengono chiuse e salvate prima di uscire
+        bar_aggregator.flush()
+        await asyncio.to_thread(bar_writer.close)
+        logging.info(f"📊 Statistiche feed WebSocket: {feed.stats()}")
 
 async def fetch_and_prepare_historical_data():
     """Scarica, elabora e normalizza i dati storici."""
     try:
-        if not should_update_data(HISTORICAL_DATA_FILE):
-            logging.info("✅ Dati storici già aggiornati.")
-            return load_processed_data(HISTORICAL_DATA_FILE)
-
-        logging.info("📥 Avvio del processo di scaricamento ed elaborazione dei dati storici...")
         ensure_directory_exists(SAVE_DIRECTORY)
 
-        if not os.path.exists(RAW_DATA_FILE):
+        if not os.path.exists(RAW_DATA_FILE) and not (market_store is not None and market_store.has_data()):
             logging.warning("⚠️ File JSON grezzo non trovato. Tentativo di scaricamento dati...")
             await data_api_module.main_fetch_all_data("eur")
 
-        return process_historical_data()
+        stale_coins = should_update_data()
+        if stale_coins == []:
+            logging.info("✅ Dati storici già aggiornati.")
+            return load_processed_data(HISTORICAL_DATA_DIR)
+
+        logging.info(f"📥 Elaborazione dei dati storici di {'tutte le' if stale_coins is None else len(stale_coins)} crypto...")
+        return process_historical_data(stale_coins)
 
     except Exception as e:
         logging.error(f"❌ Errore durante il processo di dati storici: {e}")
         return pd.DataFrame()
 
-def process_historical_data():
-    """Elabora e normalizza i dati storici."""
+def should_update_data():
+    """Crypto da rielaborare secondo l'indice di aggiornamento.
+
+    Restituisce None se non esistono dati elaborati (rielaborazione completa), altrimenti l'elenco
+    (eventualmente vuoto) delle crypto con barre nuove, mai elaborate o normalizzate con un'altra versione.
+    """
+    if not freshness_index.entries or not os.path.isdir(HISTORICAL_DATA_DIR):
+        return None
+
+    coins = known_coins()
+    stale = set(freshness_index.stale_coins(coins, normalizer.version))
+    # Partizione mancante: da rielaborare, a meno che l'ultimo tentativo non abbia prodotto righe
+    stale.update(coin_id for coin_id in coins
+                 if not os.path.exists(processed_partition(coin_id)) and not freshness_index.get(coin_id).get("empty"))
+    return sorted(stale)
+
+def known_coins():
+    """Crypto note da watermark, indice di aggiornamento e archivio; registra l'ultima barra acquisita di ognuna."""
+    # Ultima barra acquisita per crypto: i watermark sono aggiornati a ogni scaricamento
+    watermarks = incremental_sync.WatermarkStore().watermarks
+    for coin_id, timeframes in watermarks.items():
+        freshness_index.record_ingested(coin_id, timeframes.get(incremental_sync.DEFAULT_TIMEFRAME))
+    coins = set(watermarks) | set(freshness_index.entries)
+    if market_store is not None:
+        coins.update(market_store.coins())
+    return coins
+
+def load_raw_historical_data(coin_ids=None):
+    """Carica le barre OHLCV grezze (di tutte le crypto o solo di `coin_ids`) in un DataFrame indicizzato per timestamp."""
+    if market_store is not None:
+        if not market_store.has_data():
+            migrate_from_json(RAW_DATA_FILE, market_store)
+        return compact_bar_frame(market_store.read(coin_ids))
+
+    # Lettura in streaming: le barre passano in blocchi di colonne tipizzate, convertite in modo vettoriale
+    delta_bars = ((bar.pop("coin_id", None), bar) for bar in incremental_sync.load_delta_bars())
+    bars = itertools.chain(iter_raw_bars(RAW_DATA_FILE), delta_bars)
+    if coin_ids is not None:
+        wanted = set(coin_ids)
+        bars = ((coin_id, bar) for coin_id, bar in bars if coin_id in wanted)
+    stats = {}
+    df = chunks_to_dataframe(iter_bar_chunks(bars, stats=stats))
+    if stats.get("rejected"):
+        logging.warning(f"⚠️ Scartate {stats['rejected']} barre non valide su {stats['rows']} (timestamp o chiusura mancanti).")
+    return df
+
+def process_historical_data(coin_ids=None):
+    """Elabora e normalizza i dati storici di tutte le crypto o solo di quelle in `coin_ids`.
+
+    Ogni crypto richiesta viene segnata come elaborata fino all'ultima barra acquisita, anche se le sue
+    barre più recenti (o tutte) sono state scartate: senza barre nuove non viene rielaborata di nuovo.
+    """
     try:
-        with open(RAW_DATA_FILE, "r") as file:
-            raw_data = json.load(file)
-
-        historical_data_list = []
-        for crypto in raw_data:
-            prices = crypto.get("historical_prices", [])
-            for entry in prices:
-                try:
-                    timestamp = entry.get("timestamp")
-                    open_price = entry.get("open")
-                    high_price = entry.get("high")
-                    low_price = entry.get("low")
-                    close_price = entry.get("close")
-                    volume = entry.get("volume")
-
-                    if timestamp and close_price:
-                        historical_data_list.append({
-                            "timestamp": timestamp,
-                            "coin_id": crypto.get("id", "unknown"),
-                            "close": close_price,
-                            "open": open_price,
-                            "high": high_price,
-                            "low": low_price,
-                            "volume": volume,
-                        })
-                except Exception as e:
-                    logging.error(f"⚠️ Errore nel parsing dei dati storici per {crypto.get('id', 'unknown')}: {e}")
-
-        df = pd.DataFrame(historical_data_list)
-        df["timestamp"] = pd.to_datetime(df["timestamp"])
-        df.set_index("timestamp", inplace=True)
-
-        # Calcolo degli indicatori tecnici sui dati storici
-        df["rsi"] = TradingIndicators.relative_strength_index(df)
-        df["macd"], df["macd_signal"] = TradingIndicators.moving_average_convergence_divergence(df)
-        df["ema"] = TradingIndicators.exponential_moving_average(df)
-        df["bollinger_upper"], df["bollinger_lower"] = TradingIndicators.bollinger_bands(df)
+        requested = set(coin_ids) if coin_ids is not None else known_coins()
+        ingested = {coin_id: freshness_index.get(coin_id).get("last_bar") or 0 for coin_id in requested}
+        df = load_raw_historical_data(coin_ids)
+        if df.empty:
+            logging.warning("⚠️ Nessuna barra grezza da elaborare.")
+            record_empty_coins(requested, ingested)
+            return load_processed_data(HISTORICAL_DATA_DIR)
+
+        # Calcolo degli indicatori tecnici sui dati storici, separatamente per ogni crypto (in parallelo)
+        df = compute_panel_indicators(df)
 
         # Normalizzazione dei dati storici
         df = normalize_data(df)
 
-        save_processed_data(df, HISTORICAL_DATA_FILE)
-        logging.info(f"✅ Dati storici normalizzati e salvati.")
+        # Una partizione per crypto: le crypto non toccate restano come sono
+        processed = set()
+        for coin_id, group in df.groupby("coin_id", observed=True, sort=False):
+            save_processed_data(group, processed_partition(coin_id))
+            processed_bar = max(group.index.max().value // 1_000_000, ingested.get(coin_id, 0))
+            freshness_index.record_processed(coin_id, processed_bar, normalizer.version)
+            processed.add(coin_id)
+        record_empty_coins(requested - processed, ingested)
+        logging.info(f"✅ Dati storici normalizzati e salvati ({df['coin_id'].nunique()} crypto rielaborate).")
+        df = load_processed_data(HISTORICAL_DATA_DIR)
+        log_memory_report(df, "dati storici", top_symbols=5)
         return df
 
     except Exception as e:
         logging.error(f"❌ Errore durante l'elaborazione dei dati storici: {e}")
         return pd.DataFrame()
 
-def normalize_data(df):
-    """Normalizza i dati per il trading AI."""
+def record_empty_coins(coin_ids, ingested):
+    """Segna come elaborate fino all'ultima barra acquisita le crypto senza barre valide e salva l'indice."""
+    for coin_id in coin_ids:
+        freshness_index.record_processed(coin_id, ingested.get(coin_id, 0), normalizer.version, empty=True)
+    if coin_ids:
+        logging.warning(f"⚠️ Nessuna barra valida per {sorted(coin_ids)}: saranno rielaborate all'arrivo di barre nuove.")
+    freshness_index.save()
+
+def normalize_data(df, fit=True):
+    """Normalizza i dati per il trading AI (in float32, con le statistiche salvate per ogni crypto).
+
+    Con fit=True le statistiche vengono aggiornate solo con le righe nuove e salvate; con fit=False
+    (backtest e tempo reale) si applica la scala esistente senza modificarla.
+    """
     try:
-        cols_to_normalize = ["close", "open", "high", "low", "volume", "rsi", "macd", "macd_signal", "ema", "bollinger_upper", "bollinger_lower"]
-        df[cols_to_normalize] = scaler.fit_transform(df[cols_to_normalize])
-        return df
+        if fit:
+            normalizer.partial_fit(df)
+            normalizer.save()
+        return normalizer.transform(df)
     except Exception as e:
         logging.error(f"❌ Errore durante la normalizzazione dei dati: {e}")
         return df
 
+# ===========================
+# 🔹 DATI ELABORATI
+# ===========================
+
+def ensure_directory_exists(path):
+    os.makedirs(path, exist_ok=True)
+
+def processed_partition(coin_id):
+    """File Parquet con i dati elaborati di una crypto."""
+    return os.path.join(HISTORICAL_DATA_DIR, f"coin_id={coin_id}.parquet")
+
+def save_processed_data(df, path):
+    """Salva un DataFrame elaborato in Parquet in modo atomico."""
+    ensure_directory_exists(os.path.dirname(path))
+    tmp_path = f"{path}.tmp"
+    df.to_parquet(tmp_path)
+    os.replace(tmp_path, path)
+
+def load_normalized_data(data=None, consumer=None, compact=True):
+    """Dati storici normalizzati pronti per modelli e ambienti di trading.
+
+    Senza `data` vengono letti i dati elaborati salvati; un DataFrame passato viene normalizzato con la
+    scala salvata (senza aggiornarla). Con compact=True si tengono solo le colonne dichiarate da
+    `consumer` (o da tutti i consumatori registrati) in formato compatto.
+    """
+    if data is None:
+        df = load_processed_data(HISTORICAL_DATA_DIR)
+    else:
+        df = data.copy()
+        if all(feature in df.columns for feature in normalizer.features):
+            df = normalize_data(df, fit=False)
+    if compact and not df.empty:
+        df = compact_frame(df, required_columns(consumer))
+    return df
+
+def load_processed_data(path):
+    """Legge un file Parquet elaborato o tutte le partizioni per crypto di una directory."""
+    if os.path.isdir(path):
+        files = sorted(os.path.join(path, name) for name in os.listdir(path) if name.endswith(".parquet"))
+        if not files:
+            return pd.DataFrame()
+        return pd.concat([pd.read_parquet(file) for file in files]).sort_index(kind="stable")
+    if os.path.exists(path):
+        return pd.read_parquet(path)
+    return pd.DataFrame()
+
+# ===========================
+# 🔹 VERIFICA
+# ===========================
+
+def processed_watermark_check():
+    """Una crypto con l'ultima barra scartata, o senza barre valide, non resta da rielaborare per sempre."""
+    import tempfile
+    from market_data_store import MarketDataStore
+    global HISTORICAL_DATA_DIR, market_store, freshness_index, normalizer
+    saved = (HISTORICAL_DATA_DIR, market_store, freshness_index, normalizer, os.getcwd())
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)  # Nessun watermark: l'ultima barra acquisita è registrata a mano nell'indice
+        HISTORICAL_DATA_DIR = os.path.join(tmp, "historical_data")
+        market_store = MarketDataStore(os.path.join(tmp, "store"))
+        freshness_index = FreshnessIndex(os.path.join(tmp, FRESHNESS_INDEX_FILE))
+        normalizer = FeatureNormalizer(state_file=os.path.join(tmp, NORMALIZER_STATE_FILE))
+        try:
+            start = 1_704_067_200_000
+            bars = [{"timestamp": start + i * 60_000, "open": 1, "high": 2, "low": 0.5, "close": 1 + i % 7,
+                     "volume": 10} for i in range(100)]
+            market_store.write_bars("good", bars)
+            freshness_index.record_ingested("good", start + 100 * 60_000)  # Ultima barra scartata (senza chiusura)
+            freshness_index.record_ingested("empty", start)  # Nessuna barra valida
+            process_historical_data(["good", "empty"])
+            first = should_update_data()
+            freshness_index.record_ingested("empty", start + 60_000)  # Barra nuova: torna da rielaborare
+            ok = first == [] and should_update_data() == ["empty"]
+        finally:
+            HISTORICAL_DATA_DIR, market_store, freshness_index, normalizer, cwd = saved
+            os.chdir(cwd)
+    logging.info(f"{'✅' if ok else '❌'} Crypto senza righe elaborate non più rielaborate a ogni ciclo.")
+    return ok
 
-::contentReference[oaicite:0]{index=0}
- 
+if __name__ == "__main__":
+    sys.exit(0 if processed_watermark_check() else 1)
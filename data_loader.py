@@ -5,6 +5,8 @@ import logging
 import shutil
 from pathlib import Path
 from datetime import datetime
+from market_data_store import store_from_config
+from backup_service import get_backup_service, DirectoryTarget
 
 # Configurazione logging avanzato
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
@@ -21,6 +23,10 @@ MARKET_DATA_FILE = "market_data.json"
 BACKUP_DIR.mkdir(parents=True, exist_ok=True)
 CLOUD_BACKUP_DIR.mkdir(parents=True, exist_ok=True)
 
+# 📌 Destinazioni del servizio di backup in background (istanze fisse per unire le richieste ripetute)
+BACKUP_TARGETS = [DirectoryTarget(BACKUP_DIR), DirectoryTarget(CLOUD_BACKUP_DIR)]
+CLOUD_TARGETS = [DirectoryTarget(CLOUD_BACKUP_DIR)]
+
 # ===========================
 # 🔹 FUNZIONI DI UTILITÀ
 # ===========================
@@ -52,10 +58,20 @@ def load_market_data_apis(json_file=MARKET_API_FILE):
         return None
 
 def save_market_data(data, json_file=MARKET_DATA_FILE):
-    """Salva i dati di mercato e crea un backup su USB/cloud."""
+    """Salva i dati di mercato e crea un backup su USB/cloud.
+
+    Con il backend Parquet attivo le barre storiche vanno nell'archivio colonnare
+    e nel JSON resta solo l'istantanea di mercato.
+    """
     try:
-        with open(json_file, 'w') as f:
-            json.dump(data, f, indent=4)
+        market_store = store_from_config((load_config() or {}).get("storage", {}))
+        if market_store is not None:
+            for crypto in data:
+                if crypto.get("id") and isinstance(crypto.get("historical_prices"), list):
+                    market_store.write_bars(crypto["id"], crypto["historical_prices"], replace=True)
+            data = [{key: value for key, value in crypto.items() if key != "historical_prices"} for crypto in data]
+
+        write_json_atomic(data, json_file)
         create_backup(json_file)
         logging.info(f"✅ Dati di mercato salvati in {json_file}")
     except Exception as e:
@@ -76,16 +92,20 @@ def get_eur_trading_pairs(market_data):
 # 🔹 FUNZIONI DI BACKUP
 # ===========================
 
+def write_json_atomic(data, filename):
+    """Scrive un file JSON in modo atomico, così il backup in background non copia mai un file a metà."""
+    tmp_filename = f"{filename}.tmp"
+    with open(tmp_filename, 'w') as f:
+        json.dump(data, f, indent=4)
+    os.replace(tmp_filename, filename)
+
 def create_backup(filename):
-    """Crea un backup del file specificato nella directory di backup e su cloud."""
+    """Accoda il backup del file specificato nella directory di backup e su cloud (senza attendere la copia)."""
     try:
         file_path = Path(filename)
         if file_path.exists():
-            backup_path = BACKUP_DIR / file_path.name
-            shutil.copy(file_path, backup_path)
-            cloud_backup_path = CLOUD_BACKUP_DIR / file_path.name
-            shutil.copy(file_path, cloud_backup_path)
-            logging.info(f"✅ Backup creato per {filename} in {BACKUP_DIR} e sincronizzato su Cloud.")
+            get_backup_service().submit(file_path, BACKUP_TARGETS)
+            logging.info(f"📤 Backup di {filename} accodato per {BACKUP_DIR} e Cloud.")
         else:
             logging.warning(f"⚠️ Il file {filename} non esiste e non può essere copiato.")
     except Exception as e:
@@ -109,13 +129,10 @@ def save_backup(data, filename):
     """Salva un backup dei dati di configurazione su USB e Cloud."""
     try:
         backup_file = BACKUP_DIR / filename
-        with open(backup_file, 'w') as f:
-            json.dump(data, f, indent=4)
-
-        cloud_file = CLOUD_BACKUP_DIR / filename
-        shutil.copy(backup_file, cloud_file)
+        write_json_atomic(data, backup_file)
+        get_backup_service().submit(backup_file, CLOUD_TARGETS)
 
-        logging.info(f"✅ Backup dei dati salvato in {backup_file} e sincronizzato su Cloud.")
+        logging.info(f"✅ Backup dei dati salvato in {backup_file}, sincronizzazione su Cloud accodata.")
     except Exception as e:
         logging.error(f"❌ Errore durante il salvataggio del backup: {e}")
 
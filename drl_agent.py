@@ -17,6 +17,7 @@ from trading_environment import TradingEnv
 from data_handler import load_normalized_data
 from data_api_module import main_fetch_all_data as load_raw_data
 import indicators
+from backup_service import get_backup_service, HttpUploadTarget
 
 # 📌 Configurazione avanzata per Oracle Free e backup automatico
 LOG_DIR = "/mnt/usb_trading_data/logs" if os.path.exists("/mnt/usb_trading_data") else "D:/trading_logs"
@@ -33,22 +34,16 @@ CLOUD_BACKUP_DIR.mkdir(parents=True, exist_ok=True)
 
 # 📌 URL per il backup su Cloud
 CLOUD_BACKUP_URL = "https://your-cloud-backup-service.com/upload"
+CLOUD_UPLOAD_TARGETS = [HttpUploadTarget(CLOUD_BACKUP_URL)]
 
 # ===========================
 # 🔹 FUNZIONI DI BACKUP AUTOMATICO
 # ===========================
 
 def backup_model_to_cloud(model_path):
-    """Backup automatico del modello su cloud."""
-    try:
-        with open(model_path, 'rb') as f:
-            response = requests.post(CLOUD_BACKUP_URL, files={'file': f})
-        if response.status_code == 200:
-            logging.info(f"✅ Modello {model_path} caricato su cloud.")
-        else:
-            logging.error(f"❌ Errore nel backup su cloud: {response.status_code}")
-    except Exception as e:
-        logging.error(f"❌ Errore nel backup su cloud: {e}")
+    """Accoda il backup del modello su cloud: l'upload avviene in background e solo se il file è cambiato."""
+    if get_backup_service().submit(model_path, CLOUD_UPLOAD_TARGETS):
+        logging.info(f"📤 Upload su cloud del modello {model_path} accodato.")
 
 def save_model(model, model_name):
     """Salva il modello localmente e ne esegue il backup su cloud."""
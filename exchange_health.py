@@ -0,0 +1,87 @@
+# exchange_health.py - Punteggio di salute degli exchange per ordinare e coprire le richieste
+import os
+import json
+import logging
+import threading
+
+# Configurazione logging avanzata
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+# 📌 Parametri del punteggio di salute
+HEALTH_FILE = "exchange_health.json"
+EWMA_ALPHA = 0.2  # Peso delle osservazioni più recenti
+DEFAULT_LATENCY = 1.0  # Latenza ipotizzata (secondi) per exchange mai contattati
+ERROR_PENALTY = 10.0  # Secondi equivalenti aggiunti per un tasso di errore del 100%
+RATE_LIMIT_PENALTY = 20.0  # Secondi equivalenti aggiunti per un tasso di 429 del 100%
+
+class ExchangeHealth:
+    """Statistiche mobili (EWMA) di latenza, errori e limiti raggiunti per un exchange."""
+
+    def __init__(self, latency=DEFAULT_LATENCY, error_rate=0.0, rate_limit_rate=0.0, samples=0):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.samples = samples
+
+    def record(self, latency, ok, rate_limited=False):
+        """Aggiorna le medie mobili con l'esito di una richiesta."""
+        alpha = EWMA_ALPHA if self.samples else 1.0
+        self.latency += alpha * (latency - self.latency)
+        self.error_rate += alpha * ((0.0 if ok else 1.0) - self.error_rate)
+        self.rate_limit_rate += alpha * ((1.0 if rate_limited else 0.0) - self.rate_limit_rate)
+        self.samples += 1
+
+    @property
+    def score(self):
+        """Costo stimato in secondi: più basso è, più l'exchange è affidabile."""
+        return self.latency + ERROR_PENALTY * self.error_rate + RATE_LIMIT_PENALTY * self.rate_limit_rate
+
+    def to_dict(self):
+        return {"latency": self.latency, "error_rate": self.error_rate,
+                "rate_limit_rate": self.rate_limit_rate, "samples": self.samples}
+
+class HealthTracker:
+    """Raccoglie la salute di tutti gli exchange e la conserva tra un'esecuzione e l'altra."""
+
+    def __init__(self, filename=HEALTH_FILE):
+        self.filename = filename
+        self._lock = threading.Lock()
+        self.exchanges = self._load()
+
+    def _load(self):
+        if os.path.exists(self.filename):
+            try:
+                with open(self.filename, "r") as f:
+                    return {name: ExchangeHealth(**stats) for name, stats in json.load(f).items()}
+            except (json.JSONDecodeError, TypeError, OSError) as e:
+                logging.warning(f"⚠️ Punteggi di salute non leggibili in {self.filename}, ripartenza da zero: {e}")
+        return {}
+
+    def record(self, name, latency, ok, rate_limited=False):
+        """Registra l'esito di una richiesta verso l'exchange."""
+        with self._lock:
+            self.exchanges.setdefault(name, ExchangeHealth()).record(latency, ok, rate_limited)
+
+    def score(self, name):
+        with self._lock:
+            return self.exchanges.get(name, ExchangeHealth()).score
+
+    def rank(self, exchanges):
+        """Ordina gli exchange dal più al meno affidabile (a parità di punteggio mantiene l'ordine di configurazione)."""
+        return sorted(exchanges, key=lambda exchange: self.score(exchange["name"]))
+
+    def stats(self):
+        with self._lock:
+            return {name: {**health.to_dict(), "score": health.score} for name, health in self.exchanges.items()}
+
+    def save(self):
+        """Salva i punteggi in modo atomico."""
+        with self._lock:
+            data = {name: health.to_dict() for name, health in self.exchanges.items()}
+        tmp_filename = f"{self.filename}.tmp"
+        try:
+            with open(tmp_filename, "w") as f:
+                json.dump(data, f, indent=4)
+            os.replace(tmp_filename, self.filename)
+        except OSError as e:
+            logging.error(f"❌ Errore nel salvataggio dei punteggi di salute: {e}")
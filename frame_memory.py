@@ -0,0 +1,169 @@
+# frame_memory.py - Rappresentazione compatta dei DataFrame elaborati e report dell'occupazione di memoria
+import sys
+import logging
+import numpy as np
+import pandas as pd
+
+# Configurazione logging avanzata
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+# 📌 Colonne con il simbolo della crypto (convertite in categorie)
+SYMBOL_COLUMNS = ("coin_id", "symbol")
+SIGNAL_BITS_COLUMN = "signal_bits"  # Segnali booleani impacchettati, un bit per segnale
+MINUTES_PER_DAY = 1440
+
+# ===========================
+# 🔹 COLONNE RICHIESTE DAI CONSUMATORI
+# ===========================
+
+_column_needs = {}  # consumatore -> colonne lette
+
+def declare_columns(consumer, columns):
+    """Registra le colonne che un consumatore (modello, ambiente, strategia) legge davvero."""
+    _column_needs[consumer] = list(dict.fromkeys(columns))
+
+def required_columns(consumer=None):
+    """Colonne di un consumatore, o l'unione di tutti i consumatori registrati (None se nessuno ha dichiarato)."""
+    if consumer is not None:
+        return _column_needs.get(consumer)
+    if not _column_needs:
+        return None
+    return list(dict.fromkeys(column for columns in _column_needs.values() for column in columns))
+
+# ===========================
+# 🔹 CONVERSIONE COMPATTA
+# ===========================
+
+def pack_signals(df, columns=None):
+    """Impacchetta le colonne booleane in un'unica colonna intera (bit i = columns[i]).
+
+    L'elenco dei segnali resta in df.attrs[SIGNAL_BITS_COLUMN] per unpack_signals().
+    """
+    columns = list(columns if columns is not None else df.select_dtypes(include="bool").columns)
+    if not columns:
+        return df
+    if len(columns) > 64:
+        raise ValueError("Al massimo 64 segnali per colonna di bit")
+    dtype = next(dtype for dtype in (np.uint8, np.uint16, np.uint32, np.uint64) if np.iinfo(dtype).bits >= len(columns))
+    bits = np.zeros(len(df), dtype=dtype)
+    for i, column in enumerate(columns):
+        bits |= df[column].to_numpy(dtype=bool).astype(dtype) << dtype(i)
+    df = df.drop(columns=columns)
+    df[SIGNAL_BITS_COLUMN] = bits
+    df.attrs[SIGNAL_BITS_COLUMN] = columns
+    return df
+
+def unpack_signals(df, columns=None):
+    """Ricostruisce (tutte o alcune) colonne booleane da SIGNAL_BITS_COLUMN."""
+    names = df.attrs.get(SIGNAL_BITS_COLUMN, [])
+    if SIGNAL_BITS_COLUMN not in df.columns:
+        return df
+    bits = df[SIGNAL_BITS_COLUMN].to_numpy()
+    df = df.copy()
+    for i, name in enumerate(names):
+        if columns is None or name in columns:
+            df[name] = ((bits >> bits.dtype.type(i)) & 1).astype(bool)
+    return df
+
+def compact_frame(df, columns=None, float_dtype=np.float32, pack_booleans=True):
+    """Versione compatta di `df`: solo le colonne richieste, float32, interi ridotti, simboli categorici
+    e segnali booleani impacchettati in bit.
+
+    `columns` (default: required_columns()) elenca le colonne da tenere; le colonne dei simboli
+    restano sempre. Colonne richieste ma assenti vengono ignorate.
+    """
+    columns = columns if columns is not None else required_columns()
+    if columns is not None:
+        keep = [column for column in df.columns if column in set(columns) or column in SYMBOL_COLUMNS]
+        df = df[keep]
+    df = df.copy()
+
+    for column in df.columns:
+        series = df[column]
+        if column in SYMBOL_COLUMNS:
+            if not isinstance(series.dtype, pd.CategoricalDtype):
+                df[column] = series.astype("category")
+        elif pd.api.types.is_bool_dtype(series):
+            continue
+        elif pd.api.types.is_float_dtype(series):
+            if series.dtype.itemsize > np.dtype(float_dtype).itemsize:
+                df[column] = series.astype(float_dtype)
+        elif pd.api.types.is_integer_dtype(series):
+            df[column] = pd.to_numeric(series, downcast="unsigned" if series.min() >= 0 else "integer")
+
+    if pack_booleans:
+        df = pack_signals(df)
+    return df
+
+# ===========================
+# 🔹 REPORT DELLA MEMORIA
+# ===========================
+
+def memory_report(df, symbol_column="coin_id"):
+    """Byte occupati per colonna (indice incluso) e, come stima, per simbolo.
+
+    I valori per simbolo non sono misurati: sono la quota di righe del simbolo moltiplicata per i byte
+    medi per riga dell'intero DataFrame.
+    """
+    column_bytes = df.memory_usage(index=True, deep=True)
+    report = {"rows": len(df), "total_bytes": int(column_bytes.sum()),
+              "columns": {str(column): int(size) for column, size in column_bytes.items()}, "symbols": {}}
+    if symbol_column in df.columns and len(df):
+        # Stima: le colonne sono array contigui, ogni simbolo occupa la sua quota di righe
+        bytes_per_row = report["total_bytes"] / len(df)
+        counts = df[symbol_column].value_counts(sort=False)
+        report["symbols"] = {str(symbol): int(count * bytes_per_row) for symbol, count in counts.items() if count}
+    report["bytes_per_row"] = report["total_bytes"] / max(len(df), 1)
+    return report
+
+def project_memory(report, n_symbols, days, bars_per_day=MINUTES_PER_DAY):
+    """Memoria stimata per `days` giorni di barre di `n_symbols` simboli con lo stesso schema."""
+    return report["bytes_per_row"] * n_symbols * days * bars_per_day
+
+def log_memory_report(df, title="DataFrame", symbol_column="coin_id", top_symbols=10):
+    """Stampa nel log il report per colonna e per simbolo (i più pesanti)."""
+    report = memory_report(df, symbol_column)
+    lines = [f"📊 Memoria {title}: {report['total_bytes'] / 2**20:.1f} MiB, {report['rows']} righe, "
+             f"{report['bytes_per_row']:.1f} byte/riga"]
+    for column, size in sorted(report["columns"].items(), key=lambda item: -item[1]):
+        lines.append(f"   {column:<20} {size / 2**20:>10.2f} MiB")
+    for symbol, size in sorted(report["symbols"].items(), key=lambda item: -item[1])[:top_symbols]:
+        lines.append(f"   [{symbol}] {size / 2**20:>10.2f} MiB (stima)")
+    logging.info("\n".join(lines))
+    return report
+
+# ===========================
+# 🔹 CONFRONTO
+# ===========================
+
+def compare(n_symbols=200, bars_per_symbol=20_000, seed=3):
+    """Confronta memoria e contenuto di un DataFrame in float64/object e della sua versione compatta."""
+    rng = np.random.default_rng(seed)
+    n = n_symbols * bars_per_symbol
+    close = 100 * np.exp(rng.normal(0, 0.001, n).cumsum())
+    df = pd.DataFrame({
+        "coin_id": np.repeat([f"coin-{i}" for i in range(n_symbols)], bars_per_symbol).astype(object),
+        "close": close, "open": close, "high": close * 1.001, "low": close * 0.999,
+        "volume": rng.uniform(0, 1e6, n), "rsi": rng.uniform(0, 100, n), "macd": rng.normal(0, 1, n),
+        "leading_span_a": close, "leading_span_b": close, "trades": rng.integers(0, 5_000, n),
+        "Breakout": rng.random(n) < 0.05, "Buy_Signal": rng.random(n) < 0.1, "Sell_Signal": rng.random(n) < 0.1,
+    }, index=pd.date_range("2024-01-01", periods=n, freq="s", name="timestamp"))
+
+    declare_columns("benchmark", ["close", "open", "high", "low", "volume", "rsi", "macd", "trades",
+                                  "Buy_Signal", "Sell_Signal"])
+    compact = compact_frame(df, required_columns("benchmark"))
+    _column_needs.pop("benchmark", None)
+
+    before = log_memory_report(df, "originale", top_symbols=3)
+    after = log_memory_report(compact, "compatta", top_symbols=3)
+    restored = unpack_signals(compact)
+    ok = (restored["Buy_Signal"].equals(df["Buy_Signal"]) and restored["Sell_Signal"].equals(df["Sell_Signal"])
+          and np.allclose(compact["close"], df["close"], rtol=1e-6)
+          and (compact["trades"].to_numpy() == df["trades"].to_numpy()).all())
+    ratio = before["total_bytes"] / after["total_bytes"]
+    logging.info(f"{'✅' if ok else '❌'} Memoria ridotta di {ratio:.1f}x; 300 coppie x 90 giorni di barre al minuto: "
+                 f"{project_memory(before, 300, 90) / 2**30:.1f} GiB -> {project_memory(after, 300, 90) / 2**30:.1f} GiB")
+    return ok
+
+if __name__ == "__main__":
+    sys.exit(0 if compare() else 1)
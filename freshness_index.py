@@ -0,0 +1,86 @@
+# freshness_index.py - Indice di aggiornamento dei dati elaborati per crypto e timeframe
+import os
+import json
+import time
+import logging
+from incremental_sync import DEFAULT_TIMEFRAME
+
+# Configurazione logging avanzata
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+# 📌 File dell'indice (salvato accanto ai dati elaborati)
+FRESHNESS_FILE = "freshness_index.json"
+
+class FreshnessIndex:
+    """Per ogni crypto e timeframe registra fino a dove arrivano i dati grezzi e quelli elaborati.
+
+    Voce: {"last_bar": ultima barra acquisita (ms), "processed_bar": ultima barra coperta da indicatori e
+    normalizzazione (ms), "normalizer_version": versione del normalizzatore usata, "processed_at": epoch,
+    "empty": true se l'ultima elaborazione non ha prodotto righe}.
+    Una crypto è da rielaborare se ha barre nuove, se non è mai stata elaborata o se la configurazione
+    del normalizzatore è cambiata; le altre partizioni restano intatte.
+    """
+
+    def __init__(self, filename=FRESHNESS_FILE):
+        self.filename = filename
+        self.entries = self._load()
+
+    def _load(self):
+        if os.path.exists(self.filename):
+            try:
+                with open(self.filename, "r") as f:
+                    return json.load(f)
+            except (json.JSONDecodeError, OSError) as e:
+                logging.error(f"❌ Indice di aggiornamento non leggibile in {self.filename}, rielaborazione completa: {e}")
+        return {}
+
+    def save(self):
+        """Salva l'indice in modo atomico."""
+        directory = os.path.dirname(self.filename)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_filename = f"{self.filename}.tmp"
+        with open(tmp_filename, "w") as f:
+            json.dump(self.entries, f)
+        os.replace(tmp_filename, self.filename)
+
+    def get(self, coin_id, timeframe=DEFAULT_TIMEFRAME):
+        return self.entries.get(coin_id, {}).get(timeframe, {})
+
+    def record_ingested(self, coin_id, last_bar, timeframe=DEFAULT_TIMEFRAME):
+        """Registra l'ultima barra grezza disponibile (solo se più recente di quella nota)."""
+        if last_bar is None:
+            return
+        entry = self.entries.setdefault(coin_id, {}).setdefault(timeframe, {})
+        if last_bar > (entry.get("last_bar") or 0):
+            entry["last_bar"] = int(last_bar)
+
+    def record_processed(self, coin_id, processed_bar, normalizer_version, timeframe=DEFAULT_TIMEFRAME, empty=False):
+        """Registra che gli indicatori e la normalizzazione coprono la crypto fino a `processed_bar`.
+
+        Con `empty=True` l'elaborazione è stata tentata ma non ha prodotto righe (nessuna barra valida):
+        la crypto torna da rielaborare solo quando arrivano barre nuove.
+        """
+        entry = self.entries.setdefault(coin_id, {}).setdefault(timeframe, {})
+        entry["processed_bar"] = int(processed_bar)
+        entry["last_bar"] = max(entry.get("last_bar") or 0, int(processed_bar))
+        entry["normalizer_version"] = normalizer_version
+        entry["processed_at"] = time.time()
+        if empty:
+            entry["empty"] = True
+        else:
+            entry.pop("empty", None)
+
+    def is_stale(self, coin_id, normalizer_version, timeframe=DEFAULT_TIMEFRAME):
+        entry = self.get(coin_id, timeframe)
+        return (entry.get("processed_bar") is None
+                or (entry.get("last_bar") or 0) > entry["processed_bar"]
+                or entry.get("normalizer_version") != normalizer_version)
+
+    def stale_coins(self, coin_ids, normalizer_version, timeframe=DEFAULT_TIMEFRAME):
+        """Crypto (tra `coin_ids`) i cui dati elaborati non sono allineati ai dati grezzi."""
+        return [coin_id for coin_id in coin_ids if self.is_stale(coin_id, normalizer_version, timeframe)]
+
+    def forget(self, coin_id):
+        """Rimuove una crypto dall'indice (es. partizione elaborata cancellata a mano)."""
+        self.entries.pop(coin_id, None)
@@ -3,6 +3,8 @@ from gym import spaces
 import numpy as np
 import pandas as pd
 import data_handler
+from frame_memory import declare_columns
+from normalizer import DEFAULT_FEATURES
 from risk_management import RiskManagement
 import indicators
 import drl_agent
@@ -36,6 +38,9 @@ def backup_to_cloud(file_path):
     except Exception as e:
         logging.error(f"❌ Errore durante il backup su cloud: {e}")
 
+# 📌 Colonne usate come osservazioni dall'ambiente
+declare_columns("gym_trading_env", DEFAULT_FEATURES)
+
 class TradingEnv(gym.Env):
     """
     Ambiente di trading AI con supporto per scalping e multi-account.
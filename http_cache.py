@@ -0,0 +1,254 @@
+# http_cache.py - Cache su disco delle risposte HTTP delle API di mercato
+import os
+import sys
+import json
+import time
+import atexit
+import hashlib
+import logging
+import threading
+from urllib.parse import urlencode
+
+# Configurazione logging avanzata
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+# 📌 Parametri di default della cache
+CACHE_DIR = "http_cache"
+INDEX_FILE = "index.json"
+DEFAULT_MAX_SIZE_MB = 200
+SAVE_EVERY_STORES = 50  # L'indice viene riscritto ogni N risposte memorizzate...
+SAVE_INTERVAL_SECONDS = 30  # ...o se l'ultimo salvataggio è più vecchio di così, dopo un'eviction e all'uscita
+DEFAULT_TTLS = {
+    "default": 300,  # 5 minuti per gli endpoint non configurati
+}
+
+class CacheEntry:
+    """Risposta memorizzata con i metadati necessari per TTL, revalidazione e LRU."""
+
+    def __init__(self, key, url, stored_at, size, etag=None, last_modified=None, last_access=None):
+        self.key = key
+        self.url = url
+        self.stored_at = stored_at
+        self.size = size
+        self.etag = etag
+        self.last_modified = last_modified
+        self.last_access = last_access or stored_at
+
+    def to_dict(self):
+        return {"url": self.url, "stored_at": self.stored_at, "size": self.size, "etag": self.etag,
+                "last_modified": self.last_modified, "last_access": self.last_access}
+
+class ResponseCache:
+    """Cache su disco indicizzata per URL e parametri, con TTL per endpoint, ETag/If-Modified-Since ed eviction LRU."""
+
+    def __init__(self, cache_dir=CACHE_DIR, ttls=None, max_size_mb=DEFAULT_MAX_SIZE_MB,
+                 save_every=SAVE_EVERY_STORES, save_interval=SAVE_INTERVAL_SECONDS):
+        self.cache_dir = cache_dir
+        self.ttls = {**DEFAULT_TTLS, **(ttls or {})}
+        self.max_size = int(max_size_mb * 1024 * 1024)
+        self.save_every = save_every
+        self.save_interval = save_interval
+        self._lock = threading.Lock()
+        self.entries = self._load_index()  # La directory viene creata solo alla prima scrittura
+        self._unsaved = 0  # Risposte memorizzate dopo l'ultimo salvataggio dell'indice
+        self._saved_at = time.monotonic()
+        atexit.register(self.save)
+
+        # 📊 Statistiche
+        self.hits = 0
+        self.misses = 0
+        self.revalidations = 0
+        self.evictions = 0
+
+    # ===========================
+    # 🔹 INDICE E FILE
+    # ===========================
+
+    def _index_path(self):
+        return os.path.join(self.cache_dir, INDEX_FILE)
+
+    def _body_path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    def _load_index(self):
+        try:
+            with open(self._index_path(), "r") as f:
+                entries = {key: CacheEntry(key, **meta) for key, meta in json.load(f).items()}
+            return {key: entry for key, entry in entries.items() if os.path.exists(self._body_path(key))}
+        except FileNotFoundError:
+            return {}
+        except (json.JSONDecodeError, TypeError) as e:
+            logging.warning(f"⚠️ Indice della cache HTTP non valido, cache azzerata: {e}")
+            return {}
+
+    def save(self):
+        """Salva l'indice (comprese le informazioni LRU) in modo atomico."""
+        with self._lock:
+            data = {key: entry.to_dict() for key, entry in self.entries.items()}
+            self._unsaved = 0
+            self._saved_at = time.monotonic()
+        if not data and not os.path.isdir(self.cache_dir):
+            return
+        os.makedirs(self.cache_dir, exist_ok=True)
+        tmp_path = f"{self._index_path()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(data, f)
+        os.replace(tmp_path, self._index_path())
+
+    @staticmethod
+    def make_key(url, params=None):
+        """Chiave della cache: hash di URL e parametri ordinati."""
+        full_url = f"{url}?{urlencode(sorted(params.items()))}" if params else url
+        return hashlib.sha256(full_url.encode("utf-8")).hexdigest()
+
+    def ttl_for(self, url):
+        """TTL dell'endpoint: vince il frammento di URL configurato più lungo."""
+        matches = [pattern for pattern in self.ttls if pattern != "default" and pattern in url]
+        return self.ttls[max(matches, key=len)] if matches else self.ttls["default"]
+
+    # ===========================
+    # 🔹 LETTURA E SCRITTURA
+    # ===========================
+
+    def lookup(self, url, params=None):
+        """Restituisce (dati, fresco, entry) oppure (None, False, None) se la risposta non è in cache."""
+        key = self.make_key(url, params)
+        with self._lock:
+            entry = self.entries.get(key)
+        if entry is None:
+            with self._lock:
+                self.misses += 1
+            return None, False, None
+
+        try:
+            with open(self._body_path(key), "r") as f:
+                data = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            self._remove(key)
+            with self._lock:
+                self.misses += 1
+            return None, False, None
+
+        fresh = time.time() - entry.stored_at < self.ttl_for(url)
+        with self._lock:
+            entry.last_access = time.time()
+            if fresh:
+                self.hits += 1
+            else:
+                self.misses += 1
+        return data, fresh, entry
+
+    @staticmethod
+    def conditional_headers(entry):
+        """Header per la revalidazione di una risposta scaduta (ETag / If-Modified-Since)."""
+        headers = {}
+        if entry is not None:
+            if entry.etag:
+                headers["If-None-Match"] = entry.etag
+            if entry.last_modified:
+                headers["If-Modified-Since"] = entry.last_modified
+        return headers
+
+    def store(self, url, data, headers=None, params=None):
+        """Memorizza una risposta 200 e applica il limite di dimensione.
+
+        Il file della risposta è scritto subito; l'indice solo ogni `save_every` risposte, dopo
+        `save_interval` secondi o se un'eviction ha rimosso dei file (oltre che con save() e all'uscita).
+        """
+        headers = headers or {}
+        key = self.make_key(url, params)
+        body_path = self._body_path(key)
+        os.makedirs(self.cache_dir, exist_ok=True)
+        tmp_path = f"{body_path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(data, f)
+        os.replace(tmp_path, body_path)
+
+        now = time.time()
+        with self._lock:
+            self.entries[key] = CacheEntry(key, url, now, os.path.getsize(body_path),
+                                           headers.get("ETag"), headers.get("Last-Modified"), now)
+            self._unsaved += 1
+            due = (self._unsaved >= self.save_every
+                   or time.monotonic() - self._saved_at >= self.save_interval)
+        if self._evict() or due:
+            self.save()
+
+    def revalidated(self, entry, headers=None):
+        """Rinfresca una risposta confermata da un 304 Not Modified."""
+        headers = headers or {}
+        with self._lock:
+            entry.stored_at = entry.last_access = time.time()
+            entry.etag = headers.get("ETag", entry.etag)
+            entry.last_modified = headers.get("Last-Modified", entry.last_modified)
+            self.revalidations += 1
+
+    def _remove(self, key):
+        with self._lock:
+            entry = self.entries.pop(key, None)
+        if entry is not None:
+            try:
+                os.remove(self._body_path(key))
+            except FileNotFoundError:
+                pass
+
+    def _evict(self):
+        """Elimina le risposte usate meno di recente finché la cache supera la dimensione massima.
+
+        Restituisce il numero di risposte eliminate.
+        """
+        evicted = 0
+        while True:
+            with self._lock:
+                if sum(entry.size for entry in self.entries.values()) <= self.max_size or len(self.entries) <= 1:
+                    return evicted
+                oldest = min(self.entries.values(), key=lambda entry: entry.last_access)
+                self.evictions += 1
+            self._remove(oldest.key)
+            evicted += 1
+
+    def stats(self):
+        """Statistiche di hit/miss e occupazione della cache."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "revalidations": self.revalidations,
+                "evictions": self.evictions,
+                "entries": len(self.entries),
+                "size_bytes": sum(entry.size for entry in self.entries.values()),
+            }
+
+# ===========================
+# 🔹 VERIFICA
+# ===========================
+
+def save_check(n_responses=120):
+    """L'indice non viene riscritto a ogni risposta, ma save() e una nuova istanza ritrovano tutte le voci."""
+    import tempfile
+    with tempfile.TemporaryDirectory() as tmp:
+        cache = ResponseCache(cache_dir=tmp, save_every=50, save_interval=3600)
+        writes = 0
+        original_save = cache.save
+
+        def counting_save():
+            nonlocal writes
+            writes += 1
+            original_save()
+
+        cache.save = counting_save
+        for i in range(n_responses):
+            cache.store(f"https://api.example.com/prices/{i}", {"price": i})
+        batched = writes == n_responses // 50
+        cache.save()
+        reloaded = ResponseCache(cache_dir=tmp)
+        ok = batched and len(reloaded.entries) == n_responses and reloaded.lookup("https://api.example.com/prices/7")[1]
+        atexit.unregister(original_save)  # La directory temporanea non va ricreata all'uscita
+        atexit.unregister(reloaded.save)
+    logging.info(f"{'✅' if ok else '❌'} Indice della cache HTTP salvato {writes} volte per {n_responses} risposte.")
+    return ok
+
+if __name__ == "__main__":
+    sys.exit(0 if save_check() else 1)
@@ -0,0 +1,159 @@
+# incremental_sync.py - Sincronizzazione incrementale dei dati storici con watermark per crypto
+import os
+import json
+import math
+import time
+import logging
+from datetime import datetime, timezone
+
+# Configurazione logging avanzata
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+# 📌 File di stato della sincronizzazione
+WATERMARK_FILE = "sync_watermarks.json"
+DELTA_FILE = "market_data_delta.jsonl"  # Barre nuove in append, una per riga
+DEFAULT_TIMEFRAME = "1d"
+MS_PER_DAY = 24 * 60 * 60 * 1000
+
+# ===========================
+# 🔹 GESTIONE TIMESTAMP
+# ===========================
+
+def bar_timestamp_ms(timestamp):
+    """Converte il timestamp di una barra (ms, secondi o stringa ISO) in millisecondi UTC."""
+    if timestamp is None:
+        return None
+    if isinstance(timestamp, (int, float)):
+        return int(timestamp if timestamp > 1e11 else timestamp * 1000)
+    try:
+        parsed = datetime.fromisoformat(str(timestamp).replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return int(parsed.timestamp() * 1000)
+
+def days_to_fetch(watermark, max_days):
+    """Numero di giorni da richiedere per coprire il periodo successivo al watermark."""
+    if watermark is None:
+        return max_days
+    elapsed = time.time() * 1000 - watermark
+    return int(min(max_days, max(1, math.ceil(elapsed / MS_PER_DAY))))
+
+def filter_new_bars(bars, watermark):
+    """Restituisce, in ordine cronologico, solo le barre successive al watermark."""
+    if not isinstance(bars, list):
+        return []
+    new_bars = []
+    for bar in bars:
+        timestamp = bar_timestamp_ms(bar.get("timestamp")) if isinstance(bar, dict) else None
+        if timestamp is not None and (watermark is None or timestamp > watermark):
+            new_bars.append((timestamp, bar))
+    new_bars.sort(key=lambda item: item[0])
+    return [bar for _, bar in new_bars]
+
+# ===========================
+# 🔹 WATERMARK PER CRYPTO E TIMEFRAME
+# ===========================
+
+class WatermarkStore:
+    """Memorizza l'ultimo timestamp scaricato per ogni crypto e timeframe."""
+
+    def __init__(self, filename=WATERMARK_FILE):
+        self.filename = filename
+        self.loaded = False  # True se i watermark provengono da un file leggibile
+        self.watermarks = self._load()
+
+    def _load(self):
+        if os.path.exists(self.filename):
+            try:
+                with open(self.filename, "r") as f:
+                    watermarks = json.load(f)
+                self.loaded = True
+                return watermarks
+            except (json.JSONDecodeError, OSError) as e:
+                logging.error(f"❌ Watermark non leggibili in {self.filename}, sincronizzazione completa: {e}")
+        return {}
+
+    def get(self, coin_id, timeframe=DEFAULT_TIMEFRAME):
+        """Ultimo timestamp (ms) scaricato per la crypto, None se mai sincronizzata."""
+        return self.watermarks.get(coin_id, {}).get(timeframe)
+
+    def update(self, coin_id, bars, timeframe=DEFAULT_TIMEFRAME):
+        """Avanza il watermark all'ultima barra ricevuta."""
+        timestamps = [bar_timestamp_ms(bar.get("timestamp")) for bar in bars if isinstance(bar, dict)]
+        timestamps = [ts for ts in timestamps if ts is not None]
+        if not timestamps:
+            return
+        current = self.get(coin_id, timeframe)
+        latest = max(timestamps)
+        if current is None or latest > current:
+            self.watermarks.setdefault(coin_id, {})[timeframe] = latest
+
+    def seed_from(self, market_data, timeframe=DEFAULT_TIMEFRAME):
+        """Inizializza i watermark da un download completo."""
+        for crypto in market_data:
+            if crypto.get("id"):
+                self.update(crypto["id"], crypto.get("historical_prices") or [], timeframe)
+
+    def save(self):
+        """Salva i watermark in modo atomico."""
+        tmp_filename = f"{self.filename}.tmp"
+        with open(tmp_filename, "w") as f:
+            json.dump(self.watermarks, f)
+        os.replace(tmp_filename, self.filename)
+
+# ===========================
+# 🔹 LOG DELLE BARRE IN APPEND
+# ===========================
+
+def append_bars(coin_id, bars, timeframe=DEFAULT_TIMEFRAME, filename=DELTA_FILE):
+    """Aggiunge in coda le sole barre nuove, senza riscrivere lo storico."""
+    if not bars:
+        return 0
+    with open(filename, "a") as f:
+        for bar in bars:
+            f.write(json.dumps({"coin_id": coin_id, "timeframe": timeframe, **bar}) + "\n")
+    return len(bars)
+
+def load_delta_bars(filename=DELTA_FILE):
+    """Legge le barre accumulate nel log incrementale, ignorando eventuali righe troncate."""
+    if not os.path.exists(filename):
+        return
+    with open(filename, "r") as f:
+        for line in f:
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError:
+                logging.warning(f"⚠️ Riga incompleta ignorata in {filename}.")
+
+def merge_delta(raw_data, filename=DELTA_FILE):
+    """Unisce le barre del log incrementale ai dati grezzi caricati da market_data.json."""
+    by_id = {crypto.get("id"): crypto for crypto in raw_data}
+    for bar in load_delta_bars(filename):
+        coin_id = bar.pop("coin_id", None)
+        bar.pop("timeframe", None)
+        crypto = by_id.get(coin_id)
+        if crypto is None:
+            crypto = {"id": coin_id, "historical_prices": []}
+            by_id[coin_id] = crypto
+            raw_data.append(crypto)
+        if not isinstance(crypto.get("historical_prices"), list):
+            crypto["historical_prices"] = []
+        crypto["historical_prices"].append(bar)
+    return raw_data
+
+def compact_delta(storage_path, filename=DELTA_FILE):
+    """Consolida periodicamente il log incrementale in market_data.json e lo svuota."""
+    if not os.path.exists(filename):
+        return
+    with open(storage_path, "r") as f:
+        raw_data = json.load(f)
+    merge_delta(raw_data, filename)
+
+    tmp_filename = f"{storage_path}.tmp"
+    with open(tmp_filename, "w") as f:
+        json.dump(raw_data, f)
+    os.replace(tmp_filename, storage_path)
+    os.remove(filename)
+    logging.info(f"✅ Log incrementale consolidato in {storage_path}.")
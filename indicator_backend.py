@@ -0,0 +1,306 @@
+# indicator_backend.py - Backend degli indicatori: TA-Lib se installato, altrimenti kernel NumPy vettoriali
+import sys
+import time
+import logging
+import numpy as np
+from indicator_sweep import _as_float, _smoothed, _window_moments, true_range, atr_sweep, rolling_max_sweep, \
+    rolling_min_sweep
+
+# Configurazione logging avanzata
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+try:
+    import talib
+except ImportError:  # Ambiente senza la libreria C di TA-Lib
+    talib = None
+
+# 📌 Backend preferito: None = TA-Lib se installato, altrimenti NumPy
+PREFERRED_BACKEND = None
+# 📌 Tolleranza della parità NumPy/TA-Lib (stesse posizioni dei NaN, valori entro rtol/atol)
+PARITY_RTOL = 1e-9
+PARITY_ATOL = 1e-9
+BENCHMARK_SIZES = (10**4, 10**5, 10**6, 10**7)
+MAX_DIRECT_WINDOW = 64  # Fino a questa finestra ogni media mobile è una somma diretta (np.convolve)
+
+def _is_zero(values):
+    """TA_IS_ZERO di TA-Lib >= 0.6: confronto esatto (la 0.4 usava |x| < 1e-8 e azzerava i prezzi molto piccoli)."""
+    return values == 0.0
+
+def _first_valid(values):
+    valid = ~np.isnan(values)
+    return int(valid.argmax()) if valid.any() else len(values)
+
+def _window_mean(values, period):
+    """Media mobile (NaN nelle prime period-1 barre): somma diretta per finestre corte, altrimenti somme
+    cumulative ancorate a blocchi (indicator_sweep._window_moments)."""
+    out = np.full(len(values), np.nan)
+    if period > len(values):
+        return out
+    if period <= MAX_DIRECT_WINDOW:
+        out[period - 1:] = np.convolve(values, np.full(period, 1.0 / period), mode="valid")
+        return out
+    return _window_moments(values, np.array([period]))(period)[0]
+
+def _window_variance(values, period):
+    """Varianza di popolazione per finestre corte, come scarti dall'ultimo valore della finestra: niente
+    cancellazione tra quadrati grandi e le finestre piatte danno 0 esatto come TA-Lib."""
+    out = np.full(len(values), np.nan)
+    if period > len(values):
+        return out
+    last = values[period - 1:]
+    total, squares = np.zeros(len(last)), np.zeros(len(last))
+    for lag in range(period):
+        deviation = values[period - 1 - lag:len(values) - lag] - last
+        total += deviation
+        squares += deviation * deviation
+    mean = total / period
+    out[period - 1:] = np.maximum(squares / period - mean * mean, 0.0)
+    return out
+
+def _ema(values, period, k=None, seed_end=None):
+    """EMA con l'inizializzazione di TA-Lib: seme = media dei primi `period` valori validi (o di quelli che
+    terminano in `seed_end`), poi y[t] = y[t-1] + k * (x[t] - y[t-1]). I NaN iniziali vengono saltati."""
+    out = np.full(len(values), np.nan)
+    end = max(_first_valid(values) + period - 1, seed_end or 0)
+    if end >= len(values):
+        return out
+    return _smoothed(values, 2.0 / (period + 1) if k is None else k, end, values[end - period + 1:end + 1].mean(), out)
+
+def _wilder_sum(values, period):
+    """Somma di Wilder di TA-Lib (seme = somma dei valori 1..period-1) divisa per `period`: i rapporti non cambiano."""
+    out = np.full(len(values), np.nan)
+    if period < len(values):
+        _smoothed(values, 1.0 / period, period - 1, values[1:period].sum() / period, out)
+    return out
+
+def _directional_movement(high, low, close, period, plus=True, minus=True):
+    """+DM, -DM (None se non richiesti) e true range smussati come in TA-Lib."""
+    high, low, close = _as_float(high), _as_float(low), _as_float(close)
+    up = np.diff(high, prepend=np.nan)
+    down = -np.diff(low, prepend=np.nan)
+    plus_dm = _wilder_sum(np.where((up > 0) & (up > down), up, 0.0), period) if plus else None
+    minus_dm = _wilder_sum(np.where((down > 0) & (up < down), down, 0.0), period) if minus else None
+    return plus_dm, minus_dm, _wilder_sum(true_range(high, low, close), period)
+
+def _directional_index(movement, ranges, period):
+    with np.errstate(divide="ignore", invalid="ignore"):
+        index = np.where(_is_zero(ranges * period), 0.0, 100.0 * movement / ranges)
+    index[:period] = np.nan
+    return index
+
+class NumpyBackend:
+    """Stesse firme, stessi default e stesso periodo di lookback (NaN iniziali) delle funzioni di TA-Lib
+    usate da calculate_indicators. Le medie ricorsive girano in C con scipy.signal.lfilter."""
+
+    name = "numpy"
+
+    @staticmethod
+    def SMA(real, timeperiod=30):
+        return _window_mean(_as_float(real), timeperiod)
+
+    @staticmethod
+    def EMA(real, timeperiod=30):
+        return _ema(_as_float(real), timeperiod)
+
+    @staticmethod
+    def TEMA(real, timeperiod=30):
+        first = _ema(_as_float(real), timeperiod)
+        second = _ema(first, timeperiod)
+        third = _ema(second, timeperiod)
+        return 3.0 * first - 3.0 * second + third
+
+    @staticmethod
+    def BBANDS(real, timeperiod=20, nbdevup=2.0, nbdevdn=2.0, matype=0):
+        """Bande su media semplice con deviazione standard di popolazione, come TA-Lib."""
+        if matype != 0:
+            raise ValueError("Il backend NumPy supporta solo bande su media semplice (matype=0)")
+        real = _as_float(real)
+        if timeperiod > MAX_DIRECT_WINDOW and len(real):
+            middle, variance = _window_moments(real, np.array([timeperiod]))(timeperiod)
+        else:
+            middle = _window_mean(real, timeperiod)
+            variance = _window_variance(real, timeperiod)
+        deviation = np.sqrt(variance)
+        return middle + nbdevup * deviation, middle, middle - nbdevdn * deviation
+
+    @staticmethod
+    def ATR(high, low, close, timeperiod=14):
+        return atr_sweep(high, low, close, [timeperiod], backend="numpy")[:, 0]
+
+    @staticmethod
+    def PLUS_DI(high, low, close, timeperiod=14):
+        plus_dm, _, ranges = _directional_movement(high, low, close, timeperiod, minus=False)
+        return _directional_index(plus_dm, ranges, timeperiod)
+
+    @staticmethod
+    def MINUS_DI(high, low, close, timeperiod=14):
+        _, minus_dm, ranges = _directional_movement(high, low, close, timeperiod, plus=False)
+        return _directional_index(minus_dm, ranges, timeperiod)
+
+    @staticmethod
+    def ADX(high, low, close, timeperiod=14):
+        """Media di Wilder del DX; come TA-Lib le barre con DX indefinito (range nullo) lasciano l'ADX invariato."""
+        plus_dm, minus_dm, ranges = _directional_movement(high, low, close, timeperiod)
+        plus_di = _directional_index(plus_dm, ranges, timeperiod)
+        minus_di = _directional_index(minus_dm, ranges, timeperiod)
+        total = minus_di + plus_di
+        valid = ~np.isnan(total) & ~_is_zero(total)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            dx = 100.0 * np.abs(minus_di - plus_di) / total
+
+        n, first = len(close), 2 * timeperiod - 1
+        out = np.full(n, np.nan)
+        if first >= n:
+            return out
+        seed = np.where(valid[timeperiod:first + 1], dx[timeperiod:first + 1], 0.0).sum() / timeperiod
+        updates = np.flatnonzero(valid[first + 1:]) + first + 1
+        values = np.concatenate(([seed], dx[updates]))
+        smoothed = _smoothed(values, 1.0 / timeperiod, 0, seed, np.empty(len(values)))
+        # Ogni barra prende l'ultimo aggiornamento valido
+        latest = np.zeros(n - first, dtype=np.int64)
+        latest[updates - first] = np.arange(1, len(updates) + 1)
+        out[first:] = smoothed[np.maximum.accumulate(latest)]
+        return out
+
+    @staticmethod
+    def RSI(real, timeperiod=14):
+        real = _as_float(real)
+        out = np.full(len(real), np.nan)
+        if timeperiod >= len(real):
+            return out
+        change = np.diff(real)  # change[i] = real[i + 1] - real[i]
+        gains, losses = np.maximum(change, 0.0), np.maximum(-change, 0.0)
+        average_gain = _smoothed(gains, 1.0 / timeperiod, timeperiod - 1, gains[:timeperiod].mean(), np.empty(len(change)))
+        average_loss = _smoothed(losses, 1.0 / timeperiod, timeperiod - 1, losses[:timeperiod].mean(), np.empty(len(change)))
+        gain, total = average_gain[timeperiod - 1:], average_gain[timeperiod - 1:] + average_loss[timeperiod - 1:]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            out[timeperiod:] = np.where(_is_zero(total), 0.0, 100.0 * gain / total)
+        return out
+
+    @staticmethod
+    def MAX(real, timeperiod=30):
+        return rolling_max_sweep(real, [timeperiod], backend="numpy")[:, 0]
+
+    @staticmethod
+    def MIN(real, timeperiod=30):
+        return rolling_min_sweep(real, [timeperiod], backend="numpy")[:, 0]
+
+    @staticmethod
+    def MACD(real, fastperiod=12, slowperiod=26, signalperiod=9):
+        """Come TA-Lib: la EMA veloce parte dalla stessa barra della lenta e le uscite iniziano col segnale."""
+        real = _as_float(real)
+        if slowperiod < fastperiod:
+            fastperiod, slowperiod = slowperiod, fastperiod
+        slow = _ema(real, slowperiod)
+        fast = _ema(real, fastperiod, seed_end=_first_valid(real) + slowperiod - 1)
+        macd = fast - slow
+        signal = _ema(macd, signalperiod)
+        macd[np.isnan(signal)] = np.nan
+        return macd, signal, macd - signal
+
+def select_backend(name=None):
+    """Modulo/classe con le funzioni degli indicatori: "talib", "numpy" o None (PREFERRED_BACKEND, poi TA-Lib se installato)."""
+    name = name or PREFERRED_BACKEND or ("talib" if talib is not None else "numpy")
+    if name == "numpy":
+        return NumpyBackend
+    if name == "talib":
+        if talib is None:
+            raise ImportError("TA-Lib non installato: usare il backend 'numpy'")
+        return talib
+    raise ValueError("backend deve essere 'talib' o 'numpy'")
+
+# ✅ Backend scelto al caricamento del modulo
+ta = select_backend()
+if ta is NumpyBackend:
+    logging.info("⚠️ TA-Lib non disponibile: indicatori calcolati con il backend NumPy")
+
+# ===========================
+# 🔹 PARITÀ E BENCHMARK
+# ===========================
+
+# 📌 Colonne di input per funzione e casi verificati (i periodi di calculate_indicators e i default di TA-Lib)
+INPUTS = {"SMA": ["close"], "EMA": ["close"], "TEMA": ["close"], "BBANDS": ["close"], "RSI": ["close"],
+          "MACD": ["close"], "ATR": ["high", "low", "close"], "ADX": ["high", "low", "close"],
+          "PLUS_DI": ["high", "low", "close"], "MINUS_DI": ["high", "low", "close"], "MAX": ["high"], "MIN": ["low"]}
+PARITY_CASES = [("SMA", {"timeperiod": 5}), ("SMA", {}), ("EMA", {"timeperiod": 5}), ("EMA", {}),
+                ("TEMA", {"timeperiod": 5}), ("TEMA", {}), ("BBANDS", {}),
+                ("BBANDS", {"timeperiod": 20, "nbdevup": 2.5, "nbdevdn": 1.5}),
+                ("ATR", {"timeperiod": 5}), ("ATR", {}), ("ADX", {"timeperiod": 5}), ("ADX", {}),
+                ("PLUS_DI", {"timeperiod": 5}), ("PLUS_DI", {}), ("MINUS_DI", {"timeperiod": 5}), ("MINUS_DI", {}),
+                ("RSI", {"timeperiod": 7}), ("RSI", {}), ("MAX", {"timeperiod": 9}), ("MAX", {"timeperiod": 52}),
+                ("MIN", {"timeperiod": 9}), ("MIN", {"timeperiod": 52}), ("MACD", {}),
+                ("MACD", {"fastperiod": 26, "slowperiod": 12, "signalperiod": 5})]
+# Chiamate di calculate_indicators (parametri del registro)
+BENCHMARK_CASES = [("SMA", {"timeperiod": 5}), ("EMA", {"timeperiod": 5}), ("TEMA", {"timeperiod": 5}),
+                   ("BBANDS", {"timeperiod": 5}), ("ATR", {"timeperiod": 5}), ("ADX", {"timeperiod": 5}),
+                   ("PLUS_DI", {"timeperiod": 5}), ("MINUS_DI", {"timeperiod": 5}), ("RSI", {"timeperiod": 7}),
+                   ("MAX", {"timeperiod": 9}), ("MAX", {"timeperiod": 26}), ("MAX", {"timeperiod": 52}),
+                   ("MIN", {"timeperiod": 9}), ("MIN", {"timeperiod": 26}), ("MIN", {"timeperiod": 52})]
+
+def _call(backend, name, df, params):
+    result = getattr(backend, name)(*(df[column].to_numpy(dtype=np.float64) for column in INPUTS[name]), **params)
+    return result if isinstance(result, tuple) else (result,)
+
+def _parity_frames(n_bars):
+    """Random walk e una serie con prezzi arrotondati a 4 cifre significative e un tratto piatto (range nulli,
+    DX indefinito). Migliaia di barre identiche porterebbero le medie di Wilder nei numeri subnormali, dove
+    nessuno dei due backend è più preciso: quel caso resta fuori dalla tolleranza."""
+    from streaming_indicators import synthetic_ohlcv
+    df = synthetic_ohlcv(n_bars)
+    tick = 10.0 ** (np.floor(np.log10(df)) - 3)
+    flat = (df / tick).round() * tick
+    flat.iloc[n_bars // 3:n_bars // 3 + 50] = flat.iloc[n_bars // 3].to_numpy()
+    return {"random walk": df, "piatta": flat}
+
+def verify_parity(n_bars=50_000, rtol=PARITY_RTOL, atol=PARITY_ATOL):
+    """Confronta il backend NumPy con TA-Lib su ogni caso: stessi NaN e valori entro rtol/atol.
+
+    Verificato fino a 10^6 barre; su random walk più lunghi il prezzo arriva a 1e11 e la MACD (differenza di
+    due EMA) eredita un errore assoluto proporzionale al prezzo, uguale in relativo a quello delle EMA.
+    """
+    if talib is None:
+        logging.error("❌ TA-Lib non installato: parità non verificabile")
+        return False
+    failures = []
+    for label, df in _parity_frames(n_bars).items():
+        for name, params in PARITY_CASES:
+            for expected, actual in zip(_call(talib, name, df, params), _call(NumpyBackend, name, df, params)):
+                if not np.allclose(actual, expected, rtol=rtol, atol=atol, equal_nan=True):
+                    error = np.nanmax(np.abs(actual - expected))
+                    failures.append(f"{name}{params} su serie {label} (errore massimo {error:.3g})")
+    for failure in failures:
+        logging.error(f"❌ {failure}")
+    ok = not failures
+    logging.info(f"{'✅' if ok else '❌'} Backend NumPy uguale a TA-Lib su {len(PARITY_CASES)} casi x 2 serie "
+                 f"(rtol={rtol}, atol={atol})")
+    return ok
+
+def benchmark(sizes=BENCHMARK_SIZES, repeats=3):
+    """Tempi delle funzioni usate da calculate_indicators con i due backend su serie da 10^4 a 10^7 barre."""
+    from streaming_indicators import synthetic_ohlcv
+    backends = {"numpy": NumpyBackend}
+    if talib is not None:
+        backends["talib"] = talib
+    for n_bars in sizes:
+        df = synthetic_ohlcv(n_bars)
+        totals = dict.fromkeys(backends, 0.0)
+        lines = [f"📊 {n_bars} barre ({', '.join(backends)}, ms):"]
+        for name, params in BENCHMARK_CASES:
+            timings = {}
+            for label, backend in backends.items():
+                started = time.perf_counter()
+                for _ in range(repeats):
+                    _call(backend, name, df, params)
+                timings[label] = (time.perf_counter() - started) / repeats
+                totals[label] += timings[label]
+            lines.append(f"   {name}{params}".ljust(40) + "  ".join(f"{timings[label] * 1000:>10.2f}" for label in backends))
+        lines.append("   totale".ljust(40) + "  ".join(f"{totals[label] * 1000:>10.2f}" for label in backends))
+        lines.append(f"   NumPy: {n_bars / totals['numpy'] / 1e6:.1f} milioni di barre/s per il set completo"
+                     + (f", {totals['numpy'] / totals['talib']:.1f}x il tempo di TA-Lib" if "talib" in totals else ""))
+        logging.info("\n".join(lines))
+        del df
+
+if __name__ == "__main__":
+    ok = verify_parity()
+    benchmark(*([tuple(int(arg) for arg in sys.argv[1:])] if len(sys.argv) > 1 else []))
+    sys.exit(0 if ok else 1)
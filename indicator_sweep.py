@@ -0,0 +1,303 @@
+# indicator_sweep.py - Calcolo di un indicatore su una griglia di periodi in un solo passaggio (tempo x parametro)
+import sys
+import time
+import logging
+import numpy as np
+from scipy.signal import lfilter
+
+# Configurazione logging avanzata
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+# 📌 Griglia di default per la ricerca dei parametri (include i periodi fissi di calculate_indicators)
+DEFAULT_PERIODS = list(range(2, 61))
+
+try:
+    import talib
+except ImportError:  # Solo kernel NumPy
+    talib = None
+
+def _as_float(values):
+    return np.ascontiguousarray(values, dtype=np.float64)
+
+def _periods(periods):
+    periods = np.asarray(periods if periods is not None else DEFAULT_PERIODS, dtype=np.int64)
+    if (periods < 1).any():
+        raise ValueError("I periodi devono essere >= 1")
+    return periods
+
+def _grid(n, periods):
+    """Griglia preallocata: una riga contigua per periodo, restituita trasposta come (tempo x periodo)."""
+    return np.full((len(periods), n), np.nan)
+
+def _backend(backend):
+    backend = backend or ("talib" if talib is not None else "numpy")
+    if backend not in ("talib", "numpy"):
+        raise ValueError("backend deve essere 'talib' o 'numpy'")
+    if backend == "talib" and talib is None:
+        raise ImportError("TA-Lib non installato: usare backend='numpy'")
+    return backend
+
+def _cumulative(values):
+    return np.concatenate(([0.0], np.cumsum(values)))
+
+def _smoothed(values, alpha, start, seed, out):
+    """y[t] = y[t-1] + alpha * (x[t] - y[t-1]) da `start` con y[start] = seed, in C tramite lfilter."""
+    if start >= len(values) or np.isnan(seed):
+        return out
+    out[start] = seed
+    if start + 1 < len(values):
+        out[start + 1:], _ = lfilter([alpha], [1.0, alpha - 1.0], values[start + 1:], zi=[(1.0 - alpha) * seed])
+    return out
+
+# ===========================
+# 🔹 MEDIE E BANDE
+# ===========================
+
+def _window_moments(values, periods):
+    """Somme cumulative condivise da tutti i periodi per media e varianza mobili senza perdita di precisione.
+
+    I valori sono divisi in blocchi lunghi quanto il periodo massimo; ogni blocco viene riferito al suo
+    primo valore insieme al blocco precedente, così una finestra (che tocca al massimo due blocchi) si
+    somma sempre su scarti locali e non sull'intero storico. Restituisce window(period) -> (media, varianza).
+    """
+    n, size = len(values), max(int(periods.max()), 1)
+    n_blocks = -(-n // size)
+    blocks = np.zeros(n_blocks * size)
+    blocks[:n] = values
+    blocks = blocks.reshape(n_blocks, size)
+    anchors = blocks[:, :1]
+    previous = np.vstack([blocks[:1], blocks[:-1]])  # Il primo blocco non ha precedente: finestre già NaN
+    pairs = np.hstack([previous, blocks]) - anchors
+    sums = np.zeros((n_blocks, 2 * size + 1))
+    squares = np.zeros((n_blocks, 2 * size + 1))
+    np.cumsum(pairs, axis=1, out=sums[:, 1:])
+    np.cumsum(pairs * pairs, axis=1, out=squares[:, 1:])
+    ends = size + np.arange(1, size + 1)
+
+    def window(period):
+        mean = (sums[:, ends] - sums[:, ends - period]) / period
+        variance = np.maximum((squares[:, ends] - squares[:, ends - period]) / period - mean * mean, 0.0)
+        mean += anchors
+        mean, variance = mean.ravel()[:n], variance.ravel()[:n]
+        mean[:period - 1] = variance[:period - 1] = np.nan
+        return mean, variance
+    return window
+
+def sma_sweep(close, periods=None, backend=None):
+    """SMA per ogni periodo; in NumPy tutta la griglia usa le stesse somme cumulative."""
+    close, periods = _as_float(close), _periods(periods)
+    grid = _grid(len(close), periods)
+    if _backend(backend) == "talib":
+        for j, period in enumerate(periods):
+            grid[j] = talib.SMA(close, timeperiod=int(period))
+        return grid.T
+    if len(close):
+        window = _window_moments(close, periods)
+        for j, period in enumerate(periods):
+            grid[j] = window(int(period))[0]
+    return grid.T
+
+def bollinger_sweep(close, periods=None, nbdev=2.0, backend=None):
+    """Bande di Bollinger (upper, middle, lower) per ogni periodo, deviazione standard di popolazione come TA-Lib."""
+    close, periods = _as_float(close), _periods(periods)
+    upper, middle, lower = _grid(len(close), periods), _grid(len(close), periods), _grid(len(close), periods)
+    if _backend(backend) == "talib":
+        for j, period in enumerate(periods):
+            upper[j], middle[j], lower[j] = talib.BBANDS(close, timeperiod=int(period), nbdevup=nbdev, nbdevdn=nbdev)
+        return upper.T, middle.T, lower.T
+    if len(close):
+        window = _window_moments(close, periods)
+        for j, period in enumerate(periods):
+            middle[j], variance = window(int(period))
+            band = nbdev * np.sqrt(variance)
+            np.add(middle[j], band, out=upper[j])
+            np.subtract(middle[j], band, out=lower[j])
+    return upper.T, middle.T, lower.T
+
+def ema_sweep(close, periods=None, backend=None):
+    """EMA per ogni periodo con l'inizializzazione di TA-Lib (prima uscita = SMA dei primi `period` valori)."""
+    close, periods = _as_float(close), _periods(periods)
+    grid = _grid(len(close), periods)
+    if _backend(backend) == "talib":
+        for j, period in enumerate(periods):
+            grid[j] = talib.EMA(close, timeperiod=int(period))
+        return grid.T
+    cumulative = _cumulative(close)
+    for j, period in enumerate(periods):
+        seed = cumulative[period] / period if period <= len(close) else np.nan
+        _smoothed(close, 2.0 / (period + 1), period - 1, seed, grid[j])
+    return grid.T
+
+# ===========================
+# 🔹 OSCILLATORI E VOLATILITÀ (MEDIA DI WILDER)
+# ===========================
+
+def rsi_sweep(close, periods=None, backend=None):
+    """RSI di Wilder per ogni periodo; in NumPy guadagni e perdite sono calcolati una volta sola."""
+    close, periods = _as_float(close), _periods(periods)
+    n = len(close)
+    grid = _grid(n, periods)
+    if _backend(backend) == "talib":
+        for j, period in enumerate(periods):
+            grid[j] = talib.RSI(close, timeperiod=int(period))
+        return grid.T
+    change = np.diff(close, prepend=np.nan)
+    gains, losses = np.where(change > 0, change, 0.0), np.where(change < 0, -change, 0.0)
+    gain_sums, loss_sums = _cumulative(gains[1:]), _cumulative(losses[1:])
+    average_gain, average_loss = np.full(n, np.nan), np.full(n, np.nan)
+    for j, period in enumerate(periods):
+        if period >= n:
+            continue
+        _smoothed(gains, 1.0 / period, period, gain_sums[period] / period, average_gain)
+        _smoothed(losses, 1.0 / period, period, loss_sums[period] / period, average_loss)
+        total = average_gain + average_loss
+        with np.errstate(divide="ignore", invalid="ignore"):
+            grid[j, period:] = np.where(total > 0, 100.0 * average_gain / total, 0.0)[period:]
+    return grid.T
+
+def true_range(high, low, close):
+    high, low, close = _as_float(high), _as_float(low), _as_float(close)
+    previous = np.concatenate(([np.nan], close[:-1]))
+    return np.fmax(high - low, np.fmax(np.abs(high - previous), np.abs(low - previous)))
+
+def atr_sweep(high, low, close, periods=None, backend=None):
+    """ATR di Wilder per ogni periodo; in NumPy il true range è calcolato una volta sola."""
+    periods = _periods(periods)
+    n = len(close)
+    grid = _grid(n, periods)
+    if _backend(backend) == "talib":
+        high, low, close = _as_float(high), _as_float(low), _as_float(close)
+        for j, period in enumerate(periods):
+            grid[j] = talib.ATR(high, low, close, timeperiod=int(period))
+        return grid.T
+    ranges = true_range(high, low, close)
+    range_sums = _cumulative(ranges[1:])
+    for j, period in enumerate(periods):
+        seed = range_sums[period] / period if period < n else np.nan
+        _smoothed(ranges, 1.0 / period, period, seed, grid[j])
+    return grid.T
+
+# ===========================
+# 🔹 MASSIMI E MINIMI MOBILI
+# ===========================
+
+def _rolling_extreme_sweep(values, windows, reduce, talib_func, backend):
+    """Estremi mobili per ogni finestra; in NumPy da una sparse table condivisa (finestre potenze di 2).
+
+    Ogni finestra w è l'unione di due blocchi di lunghezza 2^k <= w, quindi costa un solo confronto
+    per barra qualunque sia w.
+    """
+    values, windows = _as_float(values), _periods(windows)
+    n = len(values)
+    grid = _grid(n, windows)
+    if _backend(backend) == "talib":
+        for j, window in enumerate(windows):
+            grid[j] = talib_func(values, timeperiod=int(window))
+        return grid.T
+    levels = [values]
+    while 2 ** len(levels) <= min(int(windows.max()), n):
+        previous, half = levels[-1], 2 ** (len(levels) - 1)
+        levels.append(reduce(previous[:-half], previous[half:]))
+    for j, window in enumerate(windows):
+        if window > n:
+            continue
+        k = int(window).bit_length() - 1
+        block, size = levels[k], 2 ** k
+        # Finestra che termina in i: blocco da i-w+1 e blocco da i-2^k+1
+        reduce(block[:n - window + 1], block[window - size:n - size + 1], out=grid[j, window - 1:])
+    return grid.T
+
+# La sparse table batte TA-Lib in ciclo già da poche finestre: qui NumPy è il default
+def rolling_max_sweep(values, windows=None, backend="numpy"):
+    return _rolling_extreme_sweep(values, windows, np.fmax, talib and talib.MAX, backend)
+
+def rolling_min_sweep(values, windows=None, backend="numpy"):
+    return _rolling_extreme_sweep(values, windows, np.fmin, talib and talib.MIN, backend)
+
+# 📌 Famiglie disponibili: nome -> (funzione, colonne di input)
+SWEEPS = {
+    "SMA": (sma_sweep, ["close"]),
+    "EMA": (ema_sweep, ["close"]),
+    "RSI": (rsi_sweep, ["close"]),
+    "BBANDS": (bollinger_sweep, ["close"]),
+    "ATR": (atr_sweep, ["high", "low", "close"]),
+    "MAX": (rolling_max_sweep, ["high"]),
+    "MIN": (rolling_min_sweep, ["low"]),
+}
+
+def sweep(df, family, periods=None, backend=None, **params):
+    """Matrice (tempo x periodo) di una famiglia di indicatori su tutta la griglia `periods`.
+
+    backend="talib" (default se installato, tranne MAX/MIN) usa i kernel C di TA-Lib per periodo;
+    backend="numpy" condivide somme cumulative, variazioni e sparse table tra i periodi.
+    """
+    func, columns = SWEEPS[family]
+    if backend is not None:
+        params["backend"] = backend
+    return func(*(df[column].to_numpy() for column in columns), periods, **params)
+
+# ===========================
+# 🔹 VERIFICA E BENCHMARK
+# ===========================
+
+def _talib_reference(df, family, period):
+    import talib
+    high, low, close = (df[column].to_numpy(dtype=np.float64) for column in ("high", "low", "close"))
+    if family == "BBANDS":
+        return talib.BBANDS(close, timeperiod=period)
+    if family == "ATR":
+        return talib.ATR(high, low, close, timeperiod=period)
+    if family == "MAX":
+        return talib.MAX(high, timeperiod=period)
+    if family == "MIN":
+        return talib.MIN(low, timeperiod=period)
+    return getattr(talib, family)(close, timeperiod=period)
+
+def benchmark(n_bars=100_000, periods=None):
+    """Verifica i kernel NumPy contro TA-Lib periodo per periodo e confronta i tempi della griglia con
+    calculate_indicators ripetuto una volta per periodo (il metodo attuale di ricerca dei parametri)."""
+    from streaming_indicators import synthetic_ohlcv
+    from indicators import TradingIndicators, FULL_INDICATORS
+
+    df = synthetic_ohlcv(n_bars)
+    periods = _periods(periods if periods is not None else list(range(2, 50)))
+    ok = True
+    for family in SWEEPS:
+        timings = {}
+        for backend in ("numpy", "talib"):
+            started = time.perf_counter()
+            grid = sweep(df, family, periods, backend=backend)
+            timings[backend] = time.perf_counter() - started
+
+        grids = grid if isinstance(grid, tuple) else (grid,)
+        numpy_grids = sweep(df, family, periods, backend="numpy")
+        numpy_grids = numpy_grids if isinstance(numpy_grids, tuple) else (numpy_grids,)
+        for j, period in enumerate(periods):
+            reference = _talib_reference(df, family, int(period))
+            reference = reference if isinstance(reference, tuple) else (reference,)
+            for talib_grid, numpy_grid, expected in zip(grids, numpy_grids, reference):
+                if not (np.array_equal(talib_grid[:, j], expected, equal_nan=True)
+                        and np.allclose(numpy_grid[:, j], expected, rtol=1e-7, atol=1e-7, equal_nan=True)):
+                    logging.error(f"❌ {family} periodo {period}: valori diversi da TA-Lib")
+                    ok = False
+        logging.info(f"📊 {family}: {len(periods)} periodi x {n_bars} barre in {timings['talib'] * 1000:.1f} ms "
+                     f"(kernel NumPy {timings['numpy'] * 1000:.1f} ms)")
+
+    # Metodo attuale: calculate_indicators completo per ogni valore del parametro
+    outputs = [name for name in FULL_INDICATORS if name != "Sentiment_Score"]  # Chiamata di rete esclusa
+    started = time.perf_counter()
+    for period in periods:
+        TradingIndicators.calculate_indicators(df.copy(), outputs, overrides={
+            name: {"timeperiod": int(period)} for name in ("SMA", "EMA", "RSI", "BB_upper", "ATR")})
+    legacy_seconds = time.perf_counter() - started
+    started = time.perf_counter()
+    for family in ("SMA", "EMA", "RSI", "BBANDS", "ATR"):
+        sweep(df, family, periods)
+    grid_seconds = time.perf_counter() - started
+    logging.info(f"{'✅' if ok else '❌'} Griglia SMA/EMA/RSI/BBANDS/ATR su {len(periods)} periodi: "
+                 f"{grid_seconds * 1000:.1f} ms contro {legacy_seconds * 1000:.1f} ms con calculate_indicators "
+                 f"per ogni periodo ({legacy_seconds / grid_seconds:.1f}x)")
+    return ok
+
+if __name__ == "__main__":
+    sys.exit(0 if benchmark(*(int(arg) for arg in sys.argv[1:2])) else 1)
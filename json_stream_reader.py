@@ -0,0 +1,345 @@
+# json_stream_reader.py - Lettura in streaming, a memoria costante, del vecchio market_data.json
+import os
+import sys
+import json
+import time
+import random
+import logging
+import resource
+import multiprocessing
+from itertools import islice, repeat
+from operator import itemgetter
+from datetime import datetime, timedelta
+import numpy as np
+import pandas as pd
+
+# Configurazione logging avanzata
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+# 📌 Parametri di lettura
+READ_BLOCK_SIZE = 1 << 20  # Caratteri letti dal file per volta (1 MiB)
+DEFAULT_CHUNK_SIZE = 65536  # Barre per ogni blocco di colonne NumPy
+PRICE_COLUMNS = ["open", "high", "low", "close", "volume"]
+FRAME_COLUMNS = ["coin_id", "close", "open", "high", "low", "volume"]
+
+_decoder = json.JSONDecoder()
+_WHITESPACE = " \t\n\r"
+
+# ===========================
+# 🔹 PARSER JSON INCREMENTALE
+# ===========================
+
+class _JsonStream:
+    """Buffer di lettura che decodifica un valore JSON alla volta senza caricare l'intero file."""
+
+    def __init__(self, file, block_size=READ_BLOCK_SIZE):
+        self.file = file
+        self.block_size = block_size
+        self.buffer = ""
+        self.pos = 0
+        self.eof = False
+
+    def _fill(self):
+        """Scarta la parte già consumata del buffer e legge un nuovo blocco."""
+        block = self.file.read(self.block_size)
+        if not block:
+            self.eof = True
+            return False
+        self.buffer = self.buffer[self.pos:] + block
+        self.pos = 0
+        return True
+
+    def peek(self):
+        """Restituisce il prossimo carattere significativo senza consumarlo ('' a fine file)."""
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos] in _WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self._fill():
+                return ""
+
+    def expect(self, char):
+        found = self.peek()
+        if found != char:
+            raise ValueError(f"JSON non valido: atteso '{char}', trovato '{found}' (posizione {self.pos}).")
+        self.pos += 1
+
+    def value(self):
+        """Decodifica il prossimo valore completo (oggetto, array, stringa o numero)."""
+        self.peek()
+        while True:
+            try:
+                value, end = _decoder.raw_decode(self.buffer, self.pos)
+                # Un numero alla fine del buffer potrebbe proseguire nel blocco successivo
+                if end < len(self.buffer) or self.eof:
+                    self.pos = end
+                    return value
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+            if not self._fill():
+                value, self.pos = _decoder.raw_decode(self.buffer, self.pos)
+                return value
+
+def iter_raw_bars(path):
+    """Percorre market_data.json e restituisce (coin_id, barra) un elemento alla volta.
+
+    Solo gli array `historical_prices` vengono letti elemento per elemento; gli altri campi delle crypto
+    sono piccoli e vengono decodificati interi. Se `id` compare dopo `historical_prices` le barre di quella
+    crypto vengono trattenute finché l'id non è noto (i file scritti dal bot hanno sempre `id` prima).
+    """
+    with open(path, "r") as file:
+        stream = _JsonStream(file)
+        stream.expect("[")
+        while stream.peek() != "]":
+            stream.expect("{")
+            coin_id, pending = None, []
+            while stream.peek() != "}":
+                key = stream.value()
+                stream.expect(":")
+                if key == "historical_prices" and stream.peek() == "[":
+                    stream.expect("[")
+                    while stream.peek() != "]":
+                        bar = stream.value()
+                        if coin_id is not None:
+                            yield coin_id, bar
+                        else:
+                            pending.append(bar)
+                        if stream.peek() == ",":
+                            stream.pos += 1
+                    stream.expect("]")
+                else:
+                    value = stream.value()
+                    if key == "id":
+                        coin_id = value
+                if stream.peek() == ",":
+                    stream.pos += 1
+            stream.expect("}")
+            for bar in pending:
+                yield coin_id or "unknown", bar
+            if stream.peek() == ",":
+                stream.pos += 1
+
+# ===========================
+# 🔹 BLOCCHI DI COLONNE NUMPY
+# ===========================
+
+def timestamps_to_ms(values):
+    """Converte in blocco timestamp misti (ms, secondi, stringhe ISO) in millisecondi UTC (NaN se non validi)."""
+    values = np.asarray(values, dtype=object)
+    text = np.fromiter(map(type, values), dtype=object, count=len(values)) == str
+    ms = np.full(len(values), np.nan)
+    if text.any():
+        parsed = pd.DatetimeIndex(pd.to_datetime(values[text], utc=True, errors="coerce", format="ISO8601"))
+        parsed_ms = parsed.as_unit("ms").asi8.astype(np.float64)
+        parsed_ms[parsed.isna()] = np.nan
+        ms[text] = parsed_ms
+    if not text.all():
+        numeric = pd.to_numeric(values[~text], errors="coerce").astype(np.float64)
+        ms[~text] = np.where(numeric > 1e11, numeric, numeric * 1000)
+    return ms
+
+def _numeric_column(values):
+    """Colonna float64 da una lista di valori: i non numerici diventano NaN."""
+    try:
+        return np.array(values, dtype=np.float64)  # Numeri, stringhe numeriche e None (-> NaN)
+    except (TypeError, ValueError):
+        return pd.to_numeric(pd.Series(values, dtype=object), errors="coerce").to_numpy(dtype=np.float64)
+
+def _convert_batch(coin_ids, bars, stats):
+    """Converte un blocco di barre in colonne tipizzate e scarta con una maschera quelle non valide."""
+    if set(map(type, bars)) != {dict}:
+        bars = [bar if isinstance(bar, dict) else {} for bar in bars]
+    timestamps = timestamps_to_ms(list(map(dict.get, bars, repeat("timestamp"))))
+    prices = {column: _numeric_column(list(map(dict.get, bars, repeat(column)))) for column in PRICE_COLUMNS}
+
+    # Stesso criterio del caricamento classico: timestamp valido e prezzo di chiusura presente e non nullo
+    valid = (timestamps > 0) & ~np.isnan(prices["close"]) & (prices["close"] != 0)
+    if stats is not None:
+        stats["rows"] = stats.get("rows", 0) + len(bars)
+        stats["rejected"] = stats.get("rejected", 0) + int(len(bars) - valid.sum())
+
+    chunk = {"timestamp": timestamps[valid].astype(np.int64).astype("datetime64[ms]"),
+             "coin_id": np.asarray(coin_ids, dtype=object)[valid]}
+    chunk.update({column: values[valid] for column, values in prices.items()})
+    return chunk
+
+def iter_bar_chunks(bars, chunk_size=DEFAULT_CHUNK_SIZE, stats=None):
+    """Raggruppa coppie (coin_id, barra) in blocchi di colonne NumPy convertiti in modo vettoriale.
+
+    Le barre senza timestamp o prezzo di chiusura vengono scartate, come nel caricamento classico; se
+    `stats` è un dict vi vengono sommate le righe lette ("rows") e quelle scartate ("rejected").
+    """
+    bars = iter(bars)
+    while True:
+        batch = list(islice(bars, chunk_size))
+        if not batch:
+            return
+        coin_ids, batch = list(map(itemgetter(0), batch)), list(map(itemgetter(1), batch))
+        chunk = _convert_batch(coin_ids, batch, stats)
+        if len(chunk["close"]):
+            yield chunk
+
+def iter_historical_chunks(path, chunk_size=DEFAULT_CHUNK_SIZE, stats=None):
+    """Legge market_data.json a memoria costante restituendo blocchi di colonne NumPy."""
+    return iter_bar_chunks(iter_raw_bars(path), chunk_size, stats)
+
+def compact_bar_frame(df):
+    """Tipi compatti per il DataFrame delle barre: prezzi float32, coin_id categorico, indice datetime64."""
+    df = df.astype({column: np.float32 for column in PRICE_COLUMNS if column in df.columns})
+    if "coin_id" in df.columns:
+        df["coin_id"] = df["coin_id"].astype("category")
+    df.index = pd.DatetimeIndex(df.index, name="timestamp")
+    return df
+
+def chunks_to_dataframe(chunks):
+    """Costruisce il DataFrame indicizzato per timestamp concatenando i blocchi di colonne."""
+    chunks = list(chunks)
+    if not chunks:
+        empty = pd.DataFrame(columns=FRAME_COLUMNS, index=pd.DatetimeIndex([], name="timestamp"))
+        return compact_bar_frame(empty)
+    columns = {column: np.concatenate([chunk[column] for chunk in chunks]) for column in chunks[0]}
+    index = pd.DatetimeIndex(columns.pop("timestamp").astype("datetime64[ns]"), name="timestamp")
+    df = pd.DataFrame({"coin_id": pd.Categorical(columns["coin_id"])}, index=index)
+    for column in FRAME_COLUMNS[1:]:
+        df[column] = columns[column].astype(np.float32)
+    return df
+
+# ===========================
+# 🔹 BENCHMARK
+# ===========================
+
+def generate_synthetic_file(path, size_mb, bars_per_coin=50_000):
+    """Genera un market_data.json sintetico della dimensione indicata (in MB)."""
+    target = size_mb * 1024 * 1024
+    start = datetime(2020, 1, 1)
+    with open(path, "w") as f:
+        f.write("[\n")
+        coin = 0
+        while f.tell() < target:
+            f.write(",\n" if coin else "")
+            f.write(json.dumps({"id": f"coin-{coin}", "symbol": f"c{coin}", "current_price": 1.0})[:-1])
+            f.write(', "historical_prices": [')
+            price = random.uniform(1, 1000)
+            for i in range(bars_per_coin):
+                price *= 1 + random.gauss(0, 0.01)
+                bar = {"timestamp": (start + timedelta(minutes=i)).isoformat(), "open": price, "high": price * 1.01,
+                       "low": price * 0.99, "close": price, "volume": random.uniform(1e3, 1e6)}
+                f.write((", " if i else "") + json.dumps(bar))
+                if i % 1000 == 0 and f.tell() >= target:
+                    break
+            f.write("]}")
+            coin += 1
+        f.write("\n]\n")
+
+def _legacy_load(path):
+    """Percorso classico: json.load + lista di dict + DataFrame."""
+    with open(path, "r") as f:
+        raw_data = json.load(f)
+    rows = []
+    for crypto in raw_data:
+        for entry in crypto.get("historical_prices", []):
+            if entry.get("timestamp") and entry.get("close"):
+                rows.append({"timestamp": entry.get("timestamp"), "coin_id": crypto.get("id", "unknown"),
+                             "close": entry.get("close"), "open": entry.get("open"), "high": entry.get("high"),
+                             "low": entry.get("low"), "volume": entry.get("volume")})
+    df = pd.DataFrame(rows)
+    df["timestamp"] = pd.to_datetime(df["timestamp"])
+    return len(df.set_index("timestamp"))
+
+def _streaming_scan(path):
+    """Streaming puro: i blocchi vengono consumati senza trattenerli."""
+    return sum(len(chunk["close"]) for chunk in iter_historical_chunks(path))
+
+def _streaming_dataframe(path):
+    """Streaming fino al DataFrame finale (la memoria cresce solo con il risultato)."""
+    return len(chunks_to_dataframe(iter_historical_chunks(path)))
+
+def _measure(method, path):
+    started = time.perf_counter()
+    rows = globals()[method](path)
+    elapsed = time.perf_counter() - started
+    peak_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss  # KB su Linux
+    return rows, elapsed, peak_kb / 1024
+
+def benchmark(sizes_mb=(10, 100, 1000), workdir="."):
+    """Confronta RSS di picco e tempo del caricamento classico e di quello in streaming."""
+    context = multiprocessing.get_context("spawn")  # Processo nuovo per ogni misura: RSS di picco indipendente
+    results = []
+    for size_mb in sizes_mb:
+        path = os.path.join(workdir, f"synthetic_market_data_{size_mb}mb.json")
+        if not os.path.exists(path):
+            logging.info(f"🧪 Generazione file sintetico da {size_mb} MB...")
+            generate_synthetic_file(path, size_mb)
+        for method in ("_legacy_load", "_streaming_scan", "_streaming_dataframe"):
+            with context.Pool(1) as pool:
+                rows, elapsed, peak_mb = pool.apply(_measure, (method, path))
+            results.append({"size_mb": size_mb, "method": method.strip("_"), "rows": rows,
+                            "seconds": round(elapsed, 2), "peak_rss_mb": round(peak_mb, 1)})
+            logging.info(f"📊 {results[-1]}")
+    return results
+
+def synthetic_bars(n_bars, n_coins=200, invalid_fraction=0.01, seed=42):
+    """Coppie (coin_id, barra) in memoria come prodotte dal parser, con una quota di barre non valide."""
+    rng = random.Random(seed)
+    start = datetime(2020, 1, 1)
+    bars_per_coin = max(1, n_bars // n_coins)
+    bars = []
+    for i in range(n_bars):
+        coin, step = divmod(i, bars_per_coin)
+        price = 100 + (i % 1000) * 0.01
+        bar = {"timestamp": (start + timedelta(minutes=step)).isoformat(), "open": price, "high": price * 1.01,
+               "low": price * 0.99, "close": price, "volume": 1000.0 + step}
+        if rng.random() < invalid_fraction:
+            bar[rng.choice(["timestamp", "close"])] = rng.choice([None, "n/a", 0])
+        bars.append((f"coin-{coin}", bar))
+    return bars
+
+def _legacy_convert(bars):
+    """Ciclo classico di process_historical_data: entry.get() riga per riga, lista di dict e DataFrame."""
+    rows = []
+    for coin_id, entry in bars:
+        try:
+            timestamp, close_price = entry.get("timestamp"), entry.get("close")
+            if timestamp and close_price:
+                rows.append({"timestamp": timestamp, "coin_id": coin_id, "close": close_price,
+                             "open": entry.get("open"), "high": entry.get("high"), "low": entry.get("low"),
+                             "volume": entry.get("volume")})
+        except Exception as e:
+            logging.error(f"⚠️ Errore nel parsing dei dati storici per {coin_id}: {e}")
+    df = pd.DataFrame(rows)
+    df["timestamp"] = pd.to_datetime(df["timestamp"], errors="coerce")
+    return df.dropna(subset=["timestamp"]).set_index("timestamp")
+
+def benchmark_conversion(n_bars=1_000_000):
+    """Confronta la conversione barre -> DataFrame classica con quella vettoriale (parsing JSON escluso)."""
+    bars = synthetic_bars(n_bars)
+
+    started = time.perf_counter()
+    legacy = _legacy_convert(bars)
+    legacy_seconds = time.perf_counter() - started
+
+    stats = {}
+    started = time.perf_counter()
+    vectorised = chunks_to_dataframe(iter_bar_chunks(bars, stats=stats))
+    vectorised_seconds = time.perf_counter() - started
+
+    # Il ciclo classico lascia passare chiusure non numeriche (es. "n/a"): il confronto è sulle righe numeriche
+    legacy_close = pd.to_numeric(legacy["close"], errors="coerce").dropna()
+    same = len(legacy_close) == len(vectorised) and np.allclose(legacy_close, vectorised["close"], rtol=1e-6)
+    result = {"bars": n_bars, "legacy_seconds": round(legacy_seconds, 2),
+              "vectorised_seconds": round(vectorised_seconds, 2),
+              "speedup": round(legacy_seconds / vectorised_seconds, 1), "rejected": stats.get("rejected", 0),
+              "legacy_mb": round(float(legacy.memory_usage(deep=True).sum()) / 2**20, 1),
+              "vectorised_mb": round(float(vectorised.memory_usage(deep=True).sum()) / 2**20, 1), "same_rows": same}
+    logging.info(f"📊 Conversione: {result}")
+    return result
+
+if __name__ == "__main__":
+    if sys.argv[1:2] == ["--conversion"]:
+        benchmark_conversion(int(sys.argv[2]) if len(sys.argv) > 2 else 1_000_000)
+        sys.exit(0)
+    sizes = tuple(int(size) for size in sys.argv[1:]) or (10, 100, 1000)
+    for result in benchmark(sizes):
+        print(result)
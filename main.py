@@ -7,8 +7,9 @@ import os
 import trading_environment
 from data_loader import load_config
 from dashboard import app, server
-from data_handler import get_client, get_pairs, get_historical_data
+from data_handler import get_client, get_pairs, get_historical_data, get_bar_frames
 from indicators import TradingIndicators
+from signal_panel import SignalPanel, SCREEN_OVERRIDES
 from portfolio_optimization import PortfolioOptimization
 from ai_model import AIModel
 
@@ -17,6 +18,8 @@ bridge_module.load_custom_modules()
 
 # 📌 Percorso di configurazione API
 CONFIG_PATH = "config.json"
+MAX_SCREENED_PAIRS = 300  # Coppie valutate per account a ogni ciclo
+SCREEN_TIMEFRAME = "1m"  # Barre chiuse del feed in tempo reale usate per lo screening
 
 def execute_trading_strategy():
     # Caricamento della configurazione
@@ -43,9 +46,16 @@ def execute_trading_strategy():
         print("❌ Errore: Nessuna coppia di trading disponibile.")
         return
 
-    # Recupero e elaborazione dei dati storici
-    data_danny = process_historical_data(client_danny, pairs_danny[0], "Danny")
-    data_giuseppe = process_historical_data(client_giuseppe, pairs_giuseppe[0], "Giuseppe")
+    # Screening di tutte le coppie: si opera sulla coppia con il segnale più forte. Le barre di tutte le
+    # coppie dei due account si leggono una sola volta dall'archivio locale, senza chiamate REST
+    screened = set(pairs_danny[:MAX_SCREENED_PAIRS]) | set(pairs_giuseppe[:MAX_SCREENED_PAIRS])
+    frames = get_bar_frames(screened, SCREEN_TIMEFRAME)
+    pair_danny = screen_pairs(pairs_danny, frames, "Danny")
+    pair_giuseppe = screen_pairs(pairs_giuseppe, frames, "Giuseppe")
+
+    # Recupero e elaborazione dei dati storici (riusando le barre dello screening se presenti)
+    data_danny = process_historical_data(client_danny, pair_danny, "Danny", frames.get(pair_danny))
+    data_giuseppe = process_historical_data(client_giuseppe, pair_giuseppe, "Giuseppe", frames.get(pair_giuseppe))
 
     if data_danny is None or data_giuseppe is None:
         return  # Errore nei dati, esce dalla funzione
@@ -59,26 +69,39 @@ def execute_trading_strategy():
     predictions_giuseppe = ai_model_giuseppe.predict(data_giuseppe['close'].values[-10:].reshape(-1, 10, 1))
 
     # Esecuzione delle strategie di trading
-    check_trading_signal(data_danny, predictions_danny, client_danny, pairs_danny[0], "Danny")
-    check_trading_signal(data_giuseppe, predictions_giuseppe, client_giuseppe, pairs_giuseppe[0], "Giuseppe")
+    check_trading_signal(data_danny, predictions_danny, client_danny, pair_danny, "Danny")
+    check_trading_signal(data_giuseppe, predictions_giuseppe, client_giuseppe, pair_giuseppe, "Giuseppe")
 
     # Ottimizzazione del portafoglio
     optimize_portfolio(data_danny, "Danny")
     optimize_portfolio(data_giuseppe, "Giuseppe")
 
 
-def process_historical_data(client, pair, trader_name):
-    """Recupera e elabora i dati storici per il trader specificato."""
-    print(f"📥 Recupero dati storici per {trader_name}...")
-    data = get_historical_data(client, pair)
+def screen_pairs(pairs, frames, trader_name):
+    """Valuta i segnali di tutte le coppie in un unico passaggio e restituisce quella con il segnale più forte."""
+    pairs = pairs[:MAX_SCREENED_PAIRS]
+    candidates = {pair: frames[pair] for pair in pairs if pair in frames}
+    print(f"🔎 Screening di {len(candidates)}/{len(pairs)} coppie con barre disponibili per {trader_name}...")
+    pair, screen = SignalPanel.select(candidates, default=pairs[0])
+    print(f"📊 Candidati per {trader_name}: acquisto {screen['buy']}, vendita {screen['sell']}")
+    return pair
+
+
+def process_historical_data(client, pair, trader_name, data=None):
+    """Recupera (se `data` non è già disponibile) e elabora i dati storici per il trader specificato."""
+    if data is None or data.empty:
+        print(f"📥 Recupero dati storici per {trader_name}...")
+        data = get_historical_data(client, pair)
+    else:
+        data = data.copy()  # Lo stesso frame può servire a entrambi gli account
     
     if data.empty:
         print(f"❌ Errore: i dati storici per {trader_name} sono vuoti.")
         return None
 
     print(f"📊 Calcolo indicatori tecnici per {trader_name}...")
-    data = TradingIndicators.calculate_indicators(data)
-    data = TradingIndicators.generate_signals(data)
+    data = TradingIndicators.calculate_indicators(data, overrides=SCREEN_OVERRIDES, symbol=pair)
+    data = TradingIndicators.generate_signals(data, symbol=pair, overrides=SCREEN_OVERRIDES)
     return data
 
 
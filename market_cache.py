@@ -0,0 +1,263 @@
+# market_cache.py - Cache condivisa dal processo dei metadati dei mercati (load_markets) degli exchange
+import os
+import sys
+import json
+import time
+import logging
+import threading
+import weakref
+from data_loader import load_config
+from rate_limiter import get_rate_limiter
+
+# Configurazione logging avanzata
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+# 📌 Parametri di default della cache dei mercati
+MARKET_CACHE_DIR = "market_cache"
+DEFAULT_TTL_SECONDS = 3600  # I mercati cambiano raramente: 1 ora
+REFRESH_FRACTION = 0.8  # Il thread in background rinfresca all'80% del TTL
+MAX_STALE_FACTOR = 24  # Oltre 24 TTL i dati su disco non vengono più serviti in attesa del refresh
+REFRESH_CHECK_SECONDS = 30
+
+class MarketEntry:
+    """Mercati e valute di un exchange con l'istante del download."""
+
+    def __init__(self, markets, currencies, loaded_at):
+        self.markets = markets
+        self.currencies = currencies
+        self.loaded_at = loaded_at
+
+    def age(self):
+        return time.time() - self.loaded_at
+
+class MarketCache:
+    """Cache dei mercati per exchange (id ccxt), in memoria e su disco, con refresh in background.
+
+    Tutti gli account e i moduli del processo ricevono gli stessi metadati: il download avviene una volta
+    sola per exchange, anche con più thread che chiedono i mercati nello stesso momento. All'avvio i dati
+    su disco vengono usati subito, anche se scaduti, e il refresh prosegue in background. Ogni download
+    (anche quello del refresh) viene applicato a tutte le istanze a cui la cache ha già dato i mercati.
+    """
+
+    def __init__(self, cache_dir=MARKET_CACHE_DIR, ttl_seconds=DEFAULT_TTL_SECONDS):
+        self.cache_dir = cache_dir
+        self.ttl = ttl_seconds
+        self.entries = {}
+        self._sources = {}  # exchange_id -> (classe ccxt, nome nel rate limiter) per i refresh
+        self._applied = weakref.WeakKeyDictionary()  # istanze ccxt servite -> loaded_at dei mercati applicati
+        self._lock = threading.Lock()
+        self._load_locks = {}
+        self._refresher = None
+
+        # 📊 Statistiche
+        self.hits = 0
+        self.disk_loads = 0
+        self.downloads = 0
+        self.refresh_errors = 0
+
+    def _path(self, exchange_id):
+        return os.path.join(self.cache_dir, f"{exchange_id}.json")
+
+    def _load_lock(self, exchange_id):
+        with self._lock:
+            return self._load_locks.setdefault(exchange_id, threading.Lock())
+
+    # ===========================
+    # 🔹 DISCO
+    # ===========================
+
+    def _read_disk(self, exchange_id):
+        try:
+            with open(self._path(exchange_id), "r") as f:
+                data = json.load(f)
+            return MarketEntry(data["markets"], data.get("currencies"), data["loaded_at"])
+        except FileNotFoundError:
+            return None
+        except (json.JSONDecodeError, KeyError, TypeError) as e:
+            logging.warning(f"⚠️ Cache dei mercati di {exchange_id} non valida, verrà riscaricata: {e}")
+            return None
+
+    def _write_disk(self, exchange_id, entry):
+        os.makedirs(self.cache_dir, exist_ok=True)  # Creata alla prima scrittura, non all'avvio
+        tmp_path = f"{self._path(exchange_id)}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"loaded_at": entry.loaded_at, "markets": entry.markets, "currencies": entry.currencies}, f)
+        os.replace(tmp_path, self._path(exchange_id))
+
+    # ===========================
+    # 🔹 DOWNLOAD E ACCESSO
+    # ===========================
+
+    def _download(self, exchange, limiter_name):
+        """Scarica i mercati con l'istanza indicata e aggiorna memoria e disco."""
+        if limiter_name:
+            get_rate_limiter().acquire_sync(limiter_name)
+        exchange.load_markets(reload=True)
+        entry = MarketEntry(exchange.markets, exchange.currencies, time.time())
+        with self._lock:
+            self.entries[exchange.id] = entry
+            self.downloads += 1
+            served = [instance for instance in list(self._applied.keys()) if instance.id == exchange.id]
+        try:
+            self._write_disk(exchange.id, entry)
+        except (OSError, TypeError, ValueError) as e:
+            logging.warning(f"⚠️ Impossibile salvare su disco i mercati di {exchange.id}: {e}")
+        for instance in served:  # Le istanze già servite ricevono subito i mercati aggiornati
+            if instance is not exchange:
+                self._apply(instance, entry)
+        logging.info(f"✅ Mercati di {exchange.id} aggiornati ({len(entry.markets)} simboli).")
+        return entry
+
+    def _entry(self, exchange, limiter_name):
+        exchange_id = exchange.id
+        with self._lock:
+            entry = self.entries.get(exchange_id)
+        if entry is not None:
+            with self._lock:
+                self.hits += 1
+            return entry
+
+        # Un solo download per exchange: gli altri thread attendono e poi trovano i dati in memoria
+        with self._load_lock(exchange_id):
+            with self._lock:
+                entry = self.entries.get(exchange_id)
+                if entry is not None:
+                    self.hits += 1
+            if entry is not None:
+                return entry
+            entry = self._read_disk(exchange_id)
+            if entry is not None and entry.age() < self.ttl * MAX_STALE_FACTOR:
+                with self._lock:
+                    self.entries[exchange_id] = entry
+                    self.disk_loads += 1
+                return entry
+            return self._download(exchange, limiter_name)
+
+    def load_markets(self, exchange, limiter_name=None):
+        """Sostituisce exchange.load_markets(): applica all'istanza i mercati condivisi e li restituisce.
+
+        `limiter_name` è il nome dell'exchange nel rate limiter condiviso (es. "Binance").
+        """
+        with self._lock:
+            self._sources.setdefault(exchange.id, (type(exchange), limiter_name))
+        entry = self._entry(exchange, limiter_name)
+        self._apply(exchange, entry)
+        self.start_background_refresh()
+        return exchange.markets
+
+    def _apply(self, exchange, entry):
+        """Applica i mercati all'istanza (se non li ha già) e la registra per i refresh successivi."""
+        with self._lock:
+            if self._applied.get(exchange) == entry.loaded_at:
+                return
+        exchange.set_markets(entry.markets, entry.currencies)
+        with self._lock:
+            self._applied[exchange] = entry.loaded_at
+
+    def invalidate(self, exchange_id):
+        """Forza il download al prossimo accesso (es. dopo un errore di simbolo sconosciuto)."""
+        with self._lock:
+            self.entries.pop(exchange_id, None)
+        try:
+            os.remove(self._path(exchange_id))
+        except FileNotFoundError:
+            pass
+
+    # ===========================
+    # 🔹 REFRESH IN BACKGROUND
+    # ===========================
+
+    def refresh_due(self):
+        """Riscarica i mercati vicini alla scadenza con un'istanza pubblica (senza credenziali)."""
+        with self._lock:
+            due = [exchange_id for exchange_id, entry in self.entries.items()
+                   if entry.age() >= self.ttl * REFRESH_FRACTION]
+            sources = {exchange_id: self._sources.get(exchange_id) for exchange_id in due}
+        for exchange_id, source in sources.items():
+            if source is None:
+                continue
+            exchange_class, limiter_name = source
+            try:
+                self._download(exchange_class(), limiter_name)
+            except Exception as e:
+                with self._lock:
+                    self.refresh_errors += 1
+                logging.warning(f"⚠️ Refresh dei mercati di {exchange_id} fallito, restano in uso quelli in cache: {e}")
+
+    def _refresh_loop(self):
+        while True:
+            time.sleep(min(REFRESH_CHECK_SECONDS, self.ttl * (1 - REFRESH_FRACTION)))
+            self.refresh_due()
+
+    def start_background_refresh(self):
+        with self._lock:
+            if self._refresher is not None:
+                return
+            self._refresher = threading.Thread(target=self._refresh_loop, name="market-cache-refresh", daemon=True)
+        self._refresher.start()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "disk_loads": self.disk_loads,
+                "downloads": self.downloads,
+                "refresh_errors": self.refresh_errors,
+                "exchanges": {exchange_id: {"symbols": len(entry.markets), "age_seconds": round(entry.age())}
+                              for exchange_id, entry in self.entries.items()},
+            }
+
+_market_cache = None
+_market_cache_lock = threading.Lock()
+
+def get_market_cache():
+    """Restituisce la cache dei mercati condivisa dal processo, configurata da config.json."""
+    global _market_cache
+    with _market_cache_lock:
+        if _market_cache is None:
+            fetch_config = (load_config() or {}).get("market_data_fetch", {})
+            _market_cache = MarketCache(ttl_seconds=fetch_config.get("markets_cache_ttl_seconds", DEFAULT_TTL_SECONDS))
+        return _market_cache
+
+# ===========================
+# 🔹 VERIFICA
+# ===========================
+
+class _FakeExchange:
+    """Exchange fittizio: ogni load_markets restituisce una versione nuova dei mercati."""
+    id = "fake"
+    version = 0
+
+    def __init__(self):
+        self.markets = {}
+        self.currencies = {}
+
+    def load_markets(self, reload=False):
+        _FakeExchange.version += 1
+        self.set_markets({"BTC/USDT": {"version": _FakeExchange.version}}, {})
+
+    def set_markets(self, markets, currencies=None):
+        self.markets = markets
+        self.currencies = currencies
+
+def refresh_check():
+    """Il refresh in background aggiorna anche le istanze già servite; la cartella nasce alla prima scrittura."""
+    import tempfile
+    with tempfile.TemporaryDirectory() as tmp:
+        cache_dir = os.path.join(tmp, "markets")
+        cache = MarketCache(cache_dir=cache_dir, ttl_seconds=3600)
+        created_early = os.path.exists(cache_dir)
+        cache._refresher = False  # Nessun thread: il refresh viene chiamato a mano
+        served = [_FakeExchange(), _FakeExchange()]
+        for exchange in served:
+            cache.load_markets(exchange)
+        cache.entries["fake"].loaded_at -= 3600  # Mercati scaduti
+        cache.refresh_due()
+        latest = cache.entries["fake"].markets
+        ok = (not created_early and os.path.exists(os.path.join(cache_dir, "fake.json"))
+              and cache.downloads == 2 and all(exchange.markets is latest for exchange in served))
+    logging.info(f"{'✅' if ok else '❌'} Mercati rinfrescati applicati alle istanze già servite.")
+    return ok
+
+if __name__ == "__main__":
+    sys.exit(0 if refresh_check() else 1)
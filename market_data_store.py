@@ -0,0 +1,275 @@
+# market_data_store.py - Archivio colonnare (Parquet) dei dati OHLCV partizionato per crypto e data
+import os
+import sys
+import json
+import time
+import uuid
+import shutil
+import logging
+import threading
+from datetime import datetime, timezone
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+from incremental_sync import bar_timestamp_ms
+from json_stream_reader import iter_historical_chunks
+
+# Configurazione logging avanzata
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+# 📌 Percorso di default dell'archivio e file di migrazione
+STORE_DIR = "market_store"
+LEGACY_JSON_FILE = "market_data.json"
+MIGRATION_MARKER = "_migrated_from_json"
+
+# 📌 Schema tipizzato delle colonne salvate nei file (coin_id e date sono chiavi di partizione)
+OHLCV_COLUMNS = ["open", "high", "low", "close", "volume"]
+BAR_SCHEMA = pa.schema([("timestamp", pa.timestamp("ms"))] + [(column, pa.float64()) for column in OHLCV_COLUMNS])
+DATE_PARTITIONING = ds.partitioning(pa.schema([("date", pa.string())]), flavor="hive")
+
+_part_lock = threading.Lock()
+_last_part_ns = 0
+
+def _part_name():
+    """Nome di un nuovo file: istante di scrittura in ns, crescente anche con più scritture nello stesso ns.
+
+    L'ordine alfabetico dei file è quindi l'ordine di scrittura: in lettura, tra barre con lo stesso
+    timestamp, vince quella del file più recente.
+    """
+    global _last_part_ns
+    with _part_lock:
+        _last_part_ns = max(time.time_ns(), _last_part_ns + 1)
+        return f"part-{_last_part_ns:020d}.parquet"
+
+class MarketDataStore:
+    """Archivio OHLCV in file Parquet: <root>/coin_id=<id>/date=<YYYY-MM-DD>/part-*.parquet."""
+
+    def __init__(self, root=STORE_DIR):
+        self.root = root  # Creata dalla prima scrittura delle partizioni, non all'import
+
+    def _coin_dir(self, coin_id):
+        return os.path.join(self.root, f"coin_id={coin_id}")
+
+    # ===========================
+    # 🔹 SCRITTURA
+    # ===========================
+
+    def write_bars(self, coin_id, bars, replace=False):
+        """Aggiunge le barre di una crypto (lista di dict o DataFrame) creando un nuovo file per ogni data.
+
+        Con `replace=True` lo storico precedente della crypto viene sostituito: il nuovo storico è scritto
+        in una directory temporanea e preso in uso con un rename, così un errore a metà scrittura lascia
+        intatto quello precedente.
+        """
+        table = self._bars_to_table(bars)
+        if not replace:
+            return self._write_partitions(self._coin_dir(coin_id), table)
+
+        os.makedirs(self.root, exist_ok=True)
+        staging_dir = os.path.join(self.root, f".coin_id={coin_id}.tmp-{uuid.uuid4().hex}")
+        try:
+            rows = self._write_partitions(staging_dir, table)
+            self._swap_in(coin_id, staging_dir)
+        finally:
+            shutil.rmtree(staging_dir, ignore_errors=True)
+        return rows
+
+    @staticmethod
+    def _write_partitions(coin_dir, table):
+        if table.num_rows == 0:
+            return 0
+        frame = table.to_pandas()
+        frame["date"] = frame["timestamp"].dt.strftime("%Y-%m-%d")
+        for date, group in frame.groupby("date", sort=True):
+            partition_dir = os.path.join(coin_dir, f"date={date}")
+            os.makedirs(partition_dir, exist_ok=True)
+            part = pa.Table.from_pandas(group.drop(columns="date"), schema=BAR_SCHEMA, preserve_index=False)
+            pq.write_table(part, os.path.join(partition_dir, _part_name()))
+        return table.num_rows
+
+    def _swap_in(self, coin_id, staging_dir):
+        """Sostituisce la directory della crypto con `staging_dir` (anche vuota o assente) con due rename.
+
+        La directory precedente viene spostata da parte, non cancellata, finché la nuova non è al suo posto.
+        """
+        coin_dir = self._coin_dir(coin_id)
+        retired_dir = os.path.join(self.root, f".coin_id={coin_id}.old-{uuid.uuid4().hex}")
+        if os.path.isdir(coin_dir):
+            os.replace(coin_dir, retired_dir)
+        try:
+            if os.path.isdir(staging_dir):
+                os.replace(staging_dir, coin_dir)
+        except OSError:
+            os.replace(retired_dir, coin_dir)  # Ripristino dello storico precedente
+            raise
+        shutil.rmtree(retired_dir, ignore_errors=True)
+
+    @staticmethod
+    def _bars_to_table(bars):
+        """Converte le barre in una tabella Arrow tipizzata, scartando quelle senza timestamp o chiusura."""
+        if isinstance(bars, pd.DataFrame):
+            frame = bars.reset_index() if "timestamp" not in bars.columns else bars.copy()
+        else:
+            frame = pd.DataFrame([bar for bar in bars or [] if isinstance(bar, dict)])
+        if frame.empty or "timestamp" not in frame.columns:
+            return BAR_SCHEMA.empty_table()
+
+        if pd.api.types.is_datetime64_any_dtype(frame["timestamp"]):
+            timestamps = pd.to_datetime(frame["timestamp"])
+        else:
+            timestamps = pd.to_datetime([bar_timestamp_ms(ts) for ts in frame["timestamp"]], unit="ms")
+        frame["timestamp"] = timestamps
+        for column in OHLCV_COLUMNS:
+            frame[column] = pd.to_numeric(frame[column], errors="coerce") if column in frame else float("nan")
+        frame = frame.dropna(subset=["timestamp", "close"]).sort_values("timestamp")
+        return pa.Table.from_pandas(frame[["timestamp"] + OHLCV_COLUMNS], schema=BAR_SCHEMA, preserve_index=False)
+
+    def compact(self, coin_id=None):
+        """Unisce i file di ogni partizione in un unico file (utile dopo molti append).
+
+        I duplicati vengono risolti con la barra del file più recente e il file unito prende il nome di
+        quest'ultimo: resta ordinato prima dei file scritti nel frattempo, che continuano a prevalere.
+        """
+        for coin in [coin_id] if coin_id else self.coins():
+            coin_dir = self._coin_dir(coin)
+            for partition in os.listdir(coin_dir) if os.path.isdir(coin_dir) else []:
+                partition_dir = os.path.join(coin_dir, partition)
+                parts = sorted(name for name in os.listdir(partition_dir) if name.endswith(".parquet"))
+                if len(parts) < 2:
+                    continue
+                frame = pd.concat([pq.read_table(os.path.join(partition_dir, name), schema=BAR_SCHEMA).to_pandas()
+                                   for name in parts], ignore_index=True)
+                frame = frame.drop_duplicates(subset="timestamp", keep="last").sort_values("timestamp")
+                tmp_path = os.path.join(partition_dir, f".{parts[-1]}.tmp")  # Il punto iniziale lo esclude dalle letture
+                pq.write_table(pa.Table.from_pandas(frame, schema=BAR_SCHEMA, preserve_index=False), tmp_path)
+                os.replace(tmp_path, os.path.join(partition_dir, parts[-1]))
+                for name in parts[:-1]:
+                    os.remove(os.path.join(partition_dir, name))
+
+    # ===========================
+    # 🔹 LETTURA CON FILTRI
+    # ===========================
+
+    def coins(self):
+        """Elenco delle crypto presenti nell'archivio."""
+        if not os.path.isdir(self.root):
+            return []
+        return sorted(name.split("=", 1)[1] for name in os.listdir(self.root) if name.startswith("coin_id="))
+
+    def has_data(self):
+        return bool(self.coins())
+
+    def read(self, coin_ids=None, start=None, end=None, columns=None, dedupe=True):
+        """Legge le barre filtrando per crypto e intervallo temporale direttamente sui file.
+
+        Vengono aperte solo le directory delle crypto richieste e, al loro interno, solo le partizioni
+        di data che intersecano [start, end]; il filtro sul timestamp è applicato in lettura. I file sono
+        letti in ordine di scrittura, così con `dedupe` resta la barra scritta per ultima.
+        """
+        if isinstance(coin_ids, str):
+            coin_ids = [coin_ids]
+        columns = ["timestamp"] + [column for column in (columns or OHLCV_COLUMNS) if column != "timestamp"]
+        start = pd.Timestamp(start) if start is not None else None
+        end = pd.Timestamp(end) if end is not None else None
+
+        expression = None
+        if start is not None:
+            expression = (ds.field("date") >= start.strftime("%Y-%m-%d")) & (ds.field("timestamp") >= pa.scalar(start.to_pydatetime(), pa.timestamp("ms")))
+        if end is not None:
+            end_filter = (ds.field("date") <= end.strftime("%Y-%m-%d")) & (ds.field("timestamp") <= pa.scalar(end.to_pydatetime(), pa.timestamp("ms")))
+            expression = end_filter if expression is None else expression & end_filter
+
+        frames = []
+        for coin_id in coin_ids if coin_ids is not None else self.coins():
+            coin_dir = self._coin_dir(coin_id)
+            if not os.path.isdir(coin_dir):
+                continue
+            dataset = ds.dataset(coin_dir, format="parquet", schema=BAR_SCHEMA.append(pa.field("date", pa.string())),
+                                 partitioning=DATE_PARTITIONING)
+            fragments = sorted(dataset.get_fragments(filter=expression), key=lambda fragment: fragment.path)
+            tables = [fragment.to_table(schema=dataset.schema, columns=columns, filter=expression)
+                      for fragment in fragments]
+            if not tables:
+                continue
+            frame = pa.concat_tables(tables).to_pandas()
+            frame["coin_id"] = coin_id
+            frames.append(frame)
+
+        if not frames:
+            return pd.DataFrame(columns=columns + ["coin_id"]).set_index("timestamp")
+
+        df = pd.concat(frames, ignore_index=True)
+        if dedupe:
+            df = df.drop_duplicates(subset=["coin_id", "timestamp"], keep="last")
+        return df.sort_values(["timestamp", "coin_id"], kind="stable").set_index("timestamp")
+
+# ===========================
+# 🔹 MIGRAZIONE DA market_data.json
+# ===========================
+
+def migrate_from_json(json_file=LEGACY_JSON_FILE, store=None, force=False):
+    """Importa una sola volta lo storico di market_data.json nell'archivio Parquet."""
+    store = store or MarketDataStore()
+    marker = os.path.join(store.root, MIGRATION_MARKER)
+    if os.path.exists(marker) and not force:
+        logging.info("✅ Migrazione da JSON già eseguita.")
+        return 0
+    if not os.path.exists(json_file):
+        logging.warning(f"⚠️ {json_file} non trovato, nessun dato da migrare.")
+        return 0
+
+    # Lettura in streaming: anche file da diversi GB vengono migrati a memoria costante
+    total_rows, migrated = 0, set()
+    for chunk in iter_historical_chunks(json_file):
+        for coin_id, bars in pd.DataFrame(chunk).groupby("coin_id", sort=False):
+            total_rows += store.write_bars(coin_id, bars.drop(columns="coin_id"), replace=coin_id not in migrated)
+            migrated.add(coin_id)
+    store.compact()
+
+    os.makedirs(store.root, exist_ok=True)
+    with open(marker, "w") as f:
+        json.dump({"source": json_file, "rows": total_rows,
+                   "migrated_at": datetime.now(timezone.utc).isoformat()}, f)
+    logging.info(f"✅ Migrate {total_rows} barre da {json_file} a {store.root}.")
+    return total_rows
+
+def store_from_config(storage_config):
+    """Restituisce l'archivio Parquet se abilitato nella sezione "storage" di config.json, altrimenti None."""
+    if (storage_config or {}).get("market_data_backend", "json") != "parquet":
+        return None
+    return MarketDataStore(storage_config.get("market_data_store_path", STORE_DIR))
+
+# ===========================
+# 🔹 VERIFICA
+# ===========================
+
+def write_order_check():
+    """Tra barre duplicate vince l'ultima scritta (anche dopo compact) e replace sostituisce lo storico."""
+    import tempfile
+    with tempfile.TemporaryDirectory() as tmp:
+        store = MarketDataStore(os.path.join(tmp, "store"))
+        ts = 1_704_067_200_000
+        for close in range(1, 21):  # Venti versioni della stessa barra, in file diversi
+            store.write_bars("btc", [{"timestamp": ts, "open": 1, "high": 1, "low": 1, "close": close, "volume": 1}])
+        latest = store.read("btc")["close"].tolist() == [20.0]
+        store.compact("btc")
+        store.write_bars("btc", [{"timestamp": ts, "open": 1, "high": 1, "low": 1, "close": 21, "volume": 1}])
+        after_compact = store.read("btc")["close"].tolist() == [21.0]
+        store.compact("btc")
+        compacted = store.read("btc")["close"].tolist() == [21.0]
+
+        store.write_bars("btc", [{"timestamp": ts + 60_000, "open": 1, "high": 1, "low": 1, "close": 5, "volume": 1}],
+                         replace=True)
+        replaced = store.read("btc")["close"].tolist() == [5.0]
+        leftovers = [name for name in os.listdir(store.root) if name.startswith(".")]
+        ok = latest and after_compact and compacted and replaced and not leftovers and store.coins() == ["btc"]
+    logging.info(f"{'✅' if ok else '❌'} Archivio Parquet: ordine di scrittura rispettato nei duplicati e replace atomico.")
+    return ok
+
+if __name__ == "__main__":
+    if sys.argv[1:] == ["check"]:
+        sys.exit(0 if write_order_check() else 1)
+    market_store = MarketDataStore()
+    migrate_from_json(store=market_store)
+    logging.info(f"📊 Crypto in archivio: {market_store.coins()}")
@@ -0,0 +1,275 @@
+# normalizer.py - Normalizzazione incrementale e persistente delle feature, per crypto
+import os
+import sys
+import json
+import time
+import hashlib
+import logging
+import numpy as np
+import pandas as pd
+
+# Configurazione logging avanzata
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+# 📌 Feature normalizzate di default (stesse colonne di data_handler.process_historical_data)
+DEFAULT_FEATURES = ["close", "open", "high", "low", "volume", "rsi", "macd", "macd_signal", "ema",
+                    "bollinger_upper", "bollinger_lower"]
+NORMALIZER_STATE_FILE = "normalizer_state.json"
+METHODS = ("minmax", "zscore")
+GLOBAL_KEY = "*"  # Statistiche di tutte le crypto insieme, usate per simboli mai visti
+
+class _FeatureStats:
+    """Statistiche in streaming di un simbolo: conteggio, media, M2 (varianza), minimo e massimo per feature."""
+
+    __slots__ = ("count", "mean", "m2", "min", "max", "last_timestamp")
+
+    def __init__(self, n_features):
+        self.count = np.zeros(n_features)
+        self.mean = np.zeros(n_features)
+        self.m2 = np.zeros(n_features)
+        self.min = np.full(n_features, np.inf)
+        self.max = np.full(n_features, -np.inf)
+        self.last_timestamp = None  # Ultimo timestamp (ms) già incluso nelle statistiche
+
+    def merge(self, values):
+        """Unisce le statistiche di un blocco di righe (n, feature) con la formula parallela di Chan."""
+        valid = ~np.isnan(values)
+        count = valid.sum(axis=0).astype(np.float64)
+        if not count.any():
+            return
+        safe_count = np.maximum(count, 1)
+        mean = np.where(valid, values, 0).sum(axis=0) / safe_count
+        m2 = np.where(valid, (values - mean) ** 2, 0).sum(axis=0)
+
+        total = self.count + count
+        safe_total = np.maximum(total, 1)
+        delta = mean - self.mean
+        self.mean = self.mean + delta * count / safe_total
+        self.m2 = self.m2 + m2 + delta ** 2 * self.count * count / safe_total
+        self.count = total
+        self.min = np.fmin(self.min, np.where(valid, values, np.inf).min(axis=0))
+        self.max = np.fmax(self.max, np.where(valid, values, -np.inf).max(axis=0))
+
+    def merge_stats(self, other):
+        """Unisce le statistiche di un altro simbolo (usato per il totale di tutte le crypto)."""
+        total = self.count + other.count
+        safe_total = np.maximum(total, 1)
+        delta = other.mean - self.mean
+        self.mean = self.mean + delta * other.count / safe_total
+        self.m2 = self.m2 + other.m2 + delta ** 2 * self.count * other.count / safe_total
+        self.count = total
+        self.min = np.fmin(self.min, other.min)
+        self.max = np.fmax(self.max, other.max)
+
+    def offset_scale(self, method):
+        """Parametri della trasformazione x' = (x - offset) * scale; feature senza dati restano invariate."""
+        seen = self.count > 0
+        if method == "minmax":
+            offset = np.where(seen, self.min, 0.0)
+            spread = self.max - self.min
+        else:
+            offset = np.where(seen, self.mean, 0.0)
+            spread = np.sqrt(self.m2 / np.maximum(self.count, 1))
+        scale = np.where(seen & (spread > 0), 1.0 / np.where(spread > 0, spread, 1.0), 1.0)
+        return offset, scale
+
+    def to_dict(self):
+        return {"count": self.count.tolist(), "mean": self.mean.tolist(), "m2": self.m2.tolist(),
+                "min": [None if np.isinf(v) else v for v in self.min.tolist()],
+                "max": [None if np.isinf(v) else v for v in self.max.tolist()],
+                "last_timestamp": self.last_timestamp}
+
+    @classmethod
+    def from_dict(cls, data):
+        stats = cls(len(data["count"]))
+        stats.count = np.asarray(data["count"], dtype=np.float64)
+        stats.mean = np.asarray(data["mean"], dtype=np.float64)
+        stats.m2 = np.asarray(data["m2"], dtype=np.float64)
+        stats.min = np.array([np.inf if v is None else v for v in data["min"]], dtype=np.float64)
+        stats.max = np.array([-np.inf if v is None else v for v in data["max"]], dtype=np.float64)
+        last_timestamp = data.get("last_timestamp")
+        # Stati salvati prima del passaggio ai millisecondi: valori in us/ns ricondotti a ms
+        while last_timestamp is not None and last_timestamp > 1e14:
+            last_timestamp //= 1000
+        stats.last_timestamp = last_timestamp
+        return stats
+
+class FeatureNormalizer:
+    """Normalizzatore min-max o z-score con statistiche per crypto aggiornate in modo incrementale.
+
+    partial_fit() aggiunge alle statistiche solo le righe più recenti dell'ultimo timestamp già visto per
+    ciascuna crypto, quindi rielaborare lo storico costa O(righe nuove). transform() usa sempre le
+    statistiche salvate, così training, backtest e tempo reale condividono la stessa scala. Lo stato
+    viene salvato in JSON accanto ai dati elaborati e ricaricato all'avvio.
+    """
+
+    def __init__(self, features=None, method="minmax", state_file=NORMALIZER_STATE_FILE, symbol_column="coin_id"):
+        if method not in METHODS:
+            raise ValueError(f"method deve essere uno tra {METHODS}")
+        self.features = list(features or DEFAULT_FEATURES)
+        self.method = method
+        self.state_file = state_file
+        self.symbol_column = symbol_column
+        self.stats = {}
+        if state_file:
+            self._load()
+
+    @property
+    def version(self):
+        """Identificativo della configurazione (feature e metodo): se cambia, i dati elaborati vanno rifatti."""
+        return hashlib.sha1(json.dumps([self.features, self.method]).encode()).hexdigest()[:12]
+
+    def _load(self):
+        if not os.path.exists(self.state_file):
+            return
+        try:
+            with open(self.state_file, "r") as f:
+                state = json.load(f)
+        except (json.JSONDecodeError, OSError) as e:
+            logging.error(f"❌ Stato del normalizzatore non leggibile in {self.state_file}, ripartenza da zero: {e}")
+            return
+        if state.get("features") != self.features or state.get("method") != self.method:
+            logging.warning("⚠️ Feature o metodo del normalizzatore cambiati: statistiche salvate ignorate.")
+            return
+        self.stats = {symbol: _FeatureStats.from_dict(data) for symbol, data in state.get("symbols", {}).items()}
+        logging.info(f"✅ Stato del normalizzatore caricato ({len(self.stats)} simboli).")
+
+    def save(self):
+        """Salva lo stato in modo atomico."""
+        if not self.state_file:
+            return
+        state = {"features": self.features, "method": self.method,
+                 "symbols": {symbol: stats.to_dict() for symbol, stats in self.stats.items()}}
+        directory = os.path.dirname(self.state_file)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_filename = f"{self.state_file}.tmp"
+        with open(tmp_filename, "w") as f:
+            json.dump(state, f)
+        os.replace(tmp_filename, self.state_file)
+
+    # ===========================
+    # 🔹 AGGIORNAMENTO DELLE STATISTICHE
+    # ===========================
+
+    def _symbols(self, df):
+        if self.symbol_column in df.columns:
+            return pd.factorize(df[self.symbol_column].astype(str))
+        return np.zeros(len(df), dtype=np.intp), np.array([GLOBAL_KEY])
+
+    @staticmethod
+    def _timestamps(df):
+        # Sempre in millisecondi: asi8 è nell'unità dell'indice (s, ms, us o ns a seconda della sorgente)
+        if isinstance(df.index, pd.DatetimeIndex):
+            return df.index.as_unit("ms").asi8
+        return None
+
+    def partial_fit(self, df, only_new=True):
+        """Aggiorna le statistiche con le righe di `df`; con only_new ignora quelle già viste per crypto."""
+        if df.empty:
+            return self
+        n_features = len(self.features)
+        values = df[self.features].to_numpy(dtype=np.float64)
+        codes, symbols = self._symbols(df)
+        timestamps = self._timestamps(df)
+
+        order = np.argsort(codes, kind="stable")
+        boundaries = np.flatnonzero(np.diff(codes[order])) + 1
+        total = self.stats.setdefault(GLOBAL_KEY, _FeatureStats(n_features))
+        for rows in np.split(order, boundaries):
+            symbol = str(symbols[codes[rows[0]]])
+            stats = self.stats.setdefault(symbol, _FeatureStats(n_features))
+            if timestamps is not None:
+                symbol_timestamps = timestamps[rows]
+                if only_new and stats.last_timestamp is not None:
+                    rows = rows[symbol_timestamps > stats.last_timestamp]
+                    symbol_timestamps = timestamps[rows]
+                if not len(rows):
+                    continue
+                stats.last_timestamp = int(symbol_timestamps.max())
+            chunk = _FeatureStats(n_features)
+            chunk.merge(values[rows])
+            stats.merge_stats(chunk)
+            if symbol != GLOBAL_KEY:
+                total.merge_stats(chunk)
+        return self
+
+    # ===========================
+    # 🔹 TRASFORMAZIONE
+    # ===========================
+
+    def _offset_scale(self, symbols):
+        """Matrici (simboli, feature) di offset e scala; i simboli mai visti usano le statistiche globali."""
+        fallback = self.stats.get(GLOBAL_KEY) or _FeatureStats(len(self.features))
+        pairs = [(self.stats.get(str(symbol)) or fallback).offset_scale(self.method) for symbol in symbols]
+        offsets = np.array([offset for offset, _ in pairs], dtype=np.float32)
+        scales = np.array([scale for _, scale in pairs], dtype=np.float32)
+        return offsets, scales
+
+    def transform(self, df, inplace=True):
+        """Normalizza le feature di `df` in float32 con le statistiche correnti (nessun fit)."""
+        if not inplace:
+            df = df.copy()
+        if df.empty:
+            return df
+        codes, symbols = self._symbols(df)
+        offsets, scales = self._offset_scale(symbols)
+        values = df[self.features].to_numpy(dtype=np.float32, copy=True)
+        np.subtract(values, offsets[codes], out=values)
+        np.multiply(values, scales[codes], out=values)
+        df[self.features] = values
+        return df
+
+    def fit_transform(self, df, only_new=True):
+        """partial_fit sulle righe nuove e poi transform di tutto il DataFrame."""
+        return self.partial_fit(df, only_new=only_new).transform(df)
+
+    def inverse_transform(self, values, feature, symbol=GLOBAL_KEY):
+        """Riporta alla scala originale i valori normalizzati di una feature (es. previsioni del prezzo)."""
+        index = self.features.index(feature)
+        offsets, scales = self._offset_scale([symbol])
+        return np.asarray(values, dtype=np.float64) / scales[0, index] + offsets[0, index]
+
+# ===========================
+# 🔹 VERIFICA
+# ===========================
+
+def verify(n_coins=20, bars_per_coin=2_000, chunks=7, seed=7):
+    """Fit a blocchi == fit completo, e scala min-max uguale a quella calcolata crypto per crypto."""
+    rng = np.random.default_rng(seed)
+    index = pd.date_range("2024-01-01", periods=bars_per_coin, freq="min")
+    frames = []
+    for i in range(n_coins):
+        base = rng.uniform(0.1, 50_000)
+        frame = pd.DataFrame(base * np.exp(rng.normal(0, 0.01, (bars_per_coin, len(DEFAULT_FEATURES))).cumsum(axis=0)),
+                             index=index, columns=DEFAULT_FEATURES)
+        frame["coin_id"] = f"coin-{i}"
+        frames.append(frame)
+    df = pd.concat(frames).sort_index(kind="stable")
+    df.iloc[::97, 3] = np.nan  # Valori mancanti sparsi
+
+    full = FeatureNormalizer(state_file=None, method="zscore").partial_fit(df)
+    incremental = FeatureNormalizer(state_file=None, method="zscore")
+    for chunk in np.array_split(np.arange(len(df)), chunks):
+        incremental.partial_fit(df.iloc[chunk])
+    incremental.partial_fit(df)  # Righe già viste: nessun effetto
+    ok = all(np.allclose(full.stats[s].mean, incremental.stats[s].mean)
+             and np.allclose(full.stats[s].m2, incremental.stats[s].m2, rtol=1e-6)
+             and np.array_equal(full.stats[s].count, incremental.stats[s].count) for s in full.stats)
+
+    minmax = FeatureNormalizer(state_file=None)
+    started = time.perf_counter()
+    result = minmax.fit_transform(df.copy())
+    elapsed = time.perf_counter() - started
+    for coin_id, group in df.groupby("coin_id"):
+        expected = (group[DEFAULT_FEATURES] - group[DEFAULT_FEATURES].min()) / (
+            group[DEFAULT_FEATURES].max() - group[DEFAULT_FEATURES].min())
+        actual = result.loc[result["coin_id"] == coin_id, DEFAULT_FEATURES]
+        ok &= np.allclose(actual.to_numpy(np.float64), expected.to_numpy(), atol=1e-5, equal_nan=True)
+    ok &= all(result[feature].dtype == np.float32 for feature in DEFAULT_FEATURES)
+    logging.info(f"{'✅' if ok else '❌'} Normalizzatore verificato su {len(df)} righe "
+                 f"({n_coins} crypto, fit+transform in {elapsed * 1000:.1f} ms).")
+    return ok
+
+if __name__ == "__main__":
+    sys.exit(0 if verify() else 1)
@@ -0,0 +1,271 @@
+# panel_indicators.py - Indicatori calcolati crypto per crypto, in parallelo su più core con memoria condivisa
+import os
+import sys
+import time
+import atexit
+import logging
+import threading
+import numpy as np
+import pandas as pd
+from multiprocessing import get_context
+from multiprocessing.shared_memory import SharedMemory
+from indicators import TradingIndicators
+
+# Configurazione logging avanzata
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+# 📌 Colonne prodotte per ogni crypto (stesse di data_handler.process_historical_data)
+INPUT_COLUMNS = ["close"]
+OUTPUT_COLUMNS = ["rsi", "macd", "macd_signal", "ema", "bollinger_upper", "bollinger_lower"]
+TASKS_PER_WORKER = 4  # Più task che processi per bilanciare crypto con storici di lunghezza diversa
+# 📌 Costi misurati con calibrate() (1 CPU, Python 3.11): servono a scegliere tra pool e calcolo inline
+POOL_TASK_SECONDS = 0.12e-3  # Invio di un task al pool già avviato, collegamento alla memoria condivisa e risposta
+INLINE_SECONDS_PER_ROW = 0.13e-6  # Indicatori di una riga nel processo principale
+
+def pool_threshold(workers, task_seconds=POOL_TASK_SECONDS, seconds_per_row=INLINE_SECONDS_PER_ROW,
+                   cpus=None):
+    """Righe oltre le quali il pool conviene: il tempo risparmiato supera il costo dei task di una chiamata.
+
+    Il pool resta attivo tra una chiamata e l'altra (vedi get_pool): l'avvio dei processi si paga una
+    sola volta e non entra nella soglia. Con `cpus` core (default os.cpu_count()) il calcolo accelera al
+    massimo di min(workers, cpus) volte; con un solo core il pool non conviene mai.
+    """
+    cpus = cpus or os.cpu_count() or 1
+    parallel = min(workers, cpus)
+    if parallel <= 1:
+        return float("inf")
+    call_seconds = task_seconds * workers * TASKS_PER_WORKER
+    return int(call_seconds / (seconds_per_row * (1 - 1 / parallel)))
+
+def coin_indicators(inputs):
+    """Indicatori di una singola crypto; `inputs` è un dict di array NumPy (una colonna per INPUT_COLUMNS)."""
+    macd, macd_signal = TradingIndicators.moving_average_convergence_divergence(inputs)
+    bollinger_upper, bollinger_lower = TradingIndicators.bollinger_bands(inputs)
+    return [TradingIndicators.relative_strength_index(inputs), macd, macd_signal,
+            TradingIndicators.exponential_moving_average(inputs), bollinger_upper, bollinger_lower]
+
+def _compute_ranges(inputs, outputs, ranges):
+    """Calcola gli indicatori per gli intervalli [start, end) di righe contigue di una stessa crypto."""
+    for start, end in ranges:
+        values = coin_indicators({column: inputs[i, start:end] for i, column in enumerate(INPUT_COLUMNS)})
+        for i, column_values in enumerate(values):
+            outputs[i, start:end] = column_values
+
+# ===========================
+# 🔹 POOL CONDIVISO E WORKER CON MEMORIA CONDIVISA
+# ===========================
+
+_pool = None
+_pool_workers = 0
+_pool_lock = threading.Lock()
+
+def get_pool(workers):
+    """Pool di `workers` processi creato al primo uso e riusato dalle chiamate successive.
+
+    Viene ricreato solo se cambia il numero di processi e chiuso all'uscita (o con close_pool()).
+    """
+    global _pool, _pool_workers
+    with _pool_lock:
+        if _pool is not None and _pool_workers != workers:
+            _close_pool_locked()
+        if _pool is None:
+            context = get_context("spawn")  # Processi puliti: nessuna copia dello stato del processo principale
+            _pool, _pool_workers = context.Pool(workers), workers
+            logging.info(f"✅ Pool indicatori avviato con {workers} processi.")
+        return _pool
+
+def _close_pool_locked():
+    global _pool, _pool_workers
+    if _pool is not None:
+        _pool.close()
+        _pool.join()
+        _pool, _pool_workers = None, 0
+
+def close_pool():
+    """Chiude il pool condiviso, se avviato."""
+    with _pool_lock:
+        _close_pool_locked()
+
+atexit.register(close_pool)
+
+def _attach(name, shape):
+    shm = SharedMemory(name=name)
+    return shm, np.ndarray(shape, dtype=np.float64, buffer=shm.buf)
+
+def _worker_task(task):
+    """Ogni task si collega ai blocchi condivisi della sua chiamata e li rilascia a fine lavoro."""
+    input_name, output_name, n_rows, ranges = task
+    input_shm, inputs = _attach(input_name, (len(INPUT_COLUMNS), n_rows))
+    output_shm, outputs = _attach(output_name, (len(OUTPUT_COLUMNS), n_rows))
+    try:
+        _compute_ranges(inputs, outputs, ranges)
+    finally:
+        del inputs, outputs  # Le viste vanno rilasciate prima di chiudere la memoria condivisa
+        input_shm.close()
+        output_shm.close()
+    return len(ranges)
+
+def _split_tasks(ranges, n_tasks):
+    """Divide le crypto in gruppi di righe simili, assegnando ogni crypto al gruppo meno carico."""
+    tasks = [[] for _ in range(max(1, n_tasks))]
+    loads = [0] * len(tasks)
+    for start, end in sorted(ranges, key=lambda r: r[0] - r[1]):  # Prima le crypto più lunghe
+        lightest = loads.index(min(loads))
+        tasks[lightest].append((start, end))
+        loads[lightest] += end - start
+    return [task for task in tasks if task]
+
+# ===========================
+# 🔹 CALCOLO PER CRYPTO
+# ===========================
+
+def compute_panel_indicators(df, workers=None, min_rows_for_pool=None):
+    """Aggiunge a `df` (indice temporale, colonna coin_id) gli indicatori calcolati separatamente per crypto.
+
+    Le finestre mobili non attraversano più il confine tra crypto diverse. I dati vengono ordinati per
+    (coin_id, timestamp), copiati una volta in memoria condivisa e suddivisi tra i processi del pool come
+    intervalli di righe; i risultati tornano nell'ordine originale delle righe. Senza `min_rows_for_pool`
+    la soglia per usare il pool dipende dai processi e dai core disponibili (vedi pool_threshold).
+    """
+    workers = workers or os.cpu_count() or 1
+    if min_rows_for_pool is None:
+        min_rows_for_pool = pool_threshold(workers)
+    if df.empty:
+        for column in OUTPUT_COLUMNS:
+            df[column] = np.array([], dtype=np.float64)
+        return df
+
+    # Ordine per crypto e tempo: ogni crypto occupa un intervallo contiguo di righe
+    codes = pd.Categorical(df["coin_id"]).codes
+    order = np.lexsort((df.index.values, codes))
+    sorted_codes = codes[order]
+    boundaries = np.flatnonzero(np.diff(sorted_codes)) + 1
+    starts = np.concatenate(([0], boundaries))
+    ends = np.concatenate((boundaries, [len(df)]))
+    ranges = list(zip(starts.tolist(), ends.tolist()))
+    n_rows = len(df)
+
+    use_pool = workers > 1 and len(ranges) > 1 and n_rows >= min_rows_for_pool
+    if not use_pool:
+        inputs = np.stack([df[column].to_numpy(dtype=np.float64)[order] for column in INPUT_COLUMNS])
+        outputs = np.empty((len(OUTPUT_COLUMNS), n_rows), dtype=np.float64)
+        _compute_ranges(inputs, outputs, ranges)
+    else:
+        outputs = _compute_in_pool(df, order, ranges, workers)
+
+    # Ritorno all'ordine originale delle righe
+    restored = np.empty_like(outputs)
+    restored[:, order] = outputs
+    for i, column in enumerate(OUTPUT_COLUMNS):
+        df[column] = restored[i]
+    return df
+
+def _compute_in_pool(df, order, ranges, workers):
+    n_rows = len(df)
+    input_shm = SharedMemory(create=True, size=len(INPUT_COLUMNS) * n_rows * 8)
+    output_shm = SharedMemory(create=True, size=len(OUTPUT_COLUMNS) * n_rows * 8)
+    try:
+        inputs = np.ndarray((len(INPUT_COLUMNS), n_rows), dtype=np.float64, buffer=input_shm.buf)
+        for i, column in enumerate(INPUT_COLUMNS):
+            inputs[i] = df[column].to_numpy(dtype=np.float64)[order]
+        outputs = np.ndarray((len(OUTPUT_COLUMNS), n_rows), dtype=np.float64, buffer=output_shm.buf)
+        outputs[:] = np.nan
+
+        tasks = [(input_shm.name, output_shm.name, n_rows, task)
+                 for task in _split_tasks(ranges, workers * TASKS_PER_WORKER)]
+        for _ in get_pool(workers).imap_unordered(_worker_task, tasks):
+            pass
+        result = outputs.copy()
+        del inputs, outputs  # Le viste vanno rilasciate prima di chiudere la memoria condivisa
+        return result
+    finally:
+        for shm in (input_shm, output_shm):
+            shm.close()
+            shm.unlink()
+
+# ===========================
+# 🔹 VERIFICA E BENCHMARK
+# ===========================
+
+def synthetic_panel(n_coins=300, bars_per_coin=5_000, seed=42):
+    """Panel sintetico di più crypto sullo stesso asse temporale, righe mescolate per timestamp."""
+    rng = np.random.default_rng(seed)
+    index = pd.date_range("2024-01-01", periods=bars_per_coin, freq="min")
+    close = 100 * np.exp(np.cumsum(rng.normal(0, 0.01, (n_coins, bars_per_coin)), axis=1))
+    df = pd.DataFrame({"coin_id": np.repeat([f"coin-{i}" for i in range(n_coins)], bars_per_coin),
+                       "close": close.ravel().astype(np.float32)}, index=np.tile(index, n_coins))
+    df.index.name = "timestamp"
+    return df.sort_index(kind="stable")
+
+def verify_per_coin(df, result):
+    """Confronta ogni crypto con il calcolo sul solo storico di quella crypto."""
+    for coin_id, group in df.groupby("coin_id", observed=True):
+        expected = coin_indicators({"close": group["close"].to_numpy(dtype=np.float64)})
+        actual = result.loc[result["coin_id"] == coin_id, OUTPUT_COLUMNS].to_numpy().T
+        if not all(np.allclose(a, e, equal_nan=True) for a, e in zip(actual, expected)):
+            logging.error(f"❌ Indicatori diversi per {coin_id}.")
+            return False
+    return True
+
+def calibrate(n_coins=100, bars_per_coin=5_000, n_tasks=200):
+    """Misura su questa macchina il costo di un task sul pool avviato e il costo inline per riga; stampa le soglie."""
+    df = synthetic_panel(n_coins, bars_per_coin)
+    compute_panel_indicators(df.copy(), workers=1)  # Riscaldamento
+    started = time.perf_counter()
+    compute_panel_indicators(df.copy(), workers=1)
+    seconds_per_row = (time.perf_counter() - started) / len(df)
+
+    # Task su una sola riga: il tempo misurato è quasi tutto invio, collegamento alla memoria e risposta
+    tiny = synthetic_panel(2, 1)
+    compute_panel_indicators(tiny.copy(), workers=2, min_rows_for_pool=0)  # Avvio del pool, escluso dalla misura
+    input_shm = SharedMemory(create=True, size=len(INPUT_COLUMNS) * 8)
+    output_shm = SharedMemory(create=True, size=len(OUTPUT_COLUMNS) * 8)
+    try:
+        tasks = [(input_shm.name, output_shm.name, 1, [(0, 1)])] * n_tasks
+        started = time.perf_counter()
+        for _ in get_pool(2).imap_unordered(_worker_task, tasks):
+            pass
+        task_seconds = (time.perf_counter() - started) / n_tasks
+    finally:
+        for shm in (input_shm, output_shm):
+            shm.close()
+            shm.unlink()
+
+    cpus = os.cpu_count() or 1
+    thresholds = {workers: pool_threshold(workers, task_seconds, seconds_per_row)
+                  for workers in sorted({2, 4, 8, cpus})}
+    logging.info(f"📊 Task sul pool {task_seconds * 1e3:.2f} ms, inline {seconds_per_row * 1e6:.2f} µs/riga, "
+                 f"{cpus} CPU: righe minime per il pool {thresholds}")
+    return {"task_seconds": task_seconds, "seconds_per_row": seconds_per_row, "thresholds": thresholds}
+
+def benchmark(n_coins=300, bars_per_coin=5_000, worker_counts=None):
+    """Tempo del calcolo per crypto al variare del numero di processi."""
+    df = synthetic_panel(n_coins, bars_per_coin)
+    worker_counts = worker_counts or sorted({1, 2, 4, os.cpu_count() or 1})
+    results = []
+    for workers in worker_counts:
+        started = time.perf_counter()
+        result = compute_panel_indicators(df.copy(), workers=workers, min_rows_for_pool=0)
+        elapsed = time.perf_counter() - started
+        results.append({"workers": workers, "seconds": round(elapsed, 2)})
+        logging.info(f"📊 {n_coins} crypto x {bars_per_coin} barre, {workers} processi: {elapsed:.2f}s")
+    ok = verify_per_coin(df, result)
+    logging.info(f"{'✅' if ok else '❌'} Indicatori per crypto verificati su {n_coins} crypto.")
+    return results
+
+def pool_reuse_check(n_coins=20, bars_per_coin=500):
+    """Due chiamate consecutive usano lo stesso pool (stessi processi) e danno indicatori corretti."""
+    df = synthetic_panel(n_coins, bars_per_coin)
+    compute_panel_indicators(df.copy(), workers=2, min_rows_for_pool=0)
+    first = get_pool(2)
+    result = compute_panel_indicators(df.copy(), workers=2, min_rows_for_pool=0)
+    ok = get_pool(2) is first and verify_per_coin(df, result)
+    close_pool()
+    ok = ok and _pool is None
+    logging.info(f"{'✅' if ok else '❌'} Pool riusato tra le chiamate e chiuso su richiesta.")
+    return ok
+
+if __name__ == "__main__":
+    benchmark(*(int(arg) for arg in sys.argv[1:3]))
+    calibrate()
+    sys.exit(0 if pool_reuse_check() else 1)
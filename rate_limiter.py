@@ -0,0 +1,221 @@
+# rate_limiter.py - Limitazione delle richieste per exchange con token bucket
+import sys
+import time
+import asyncio
+import logging
+import threading
+from email.utils import parsedate_to_datetime
+from datetime import datetime, timezone
+from data_loader import load_market_data_apis
+
+# Configurazione logging avanzata
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+# 📌 Margine di sicurezza rispetto ai limiti pubblicati (0.95 = 95% del limite)
+RATE_LIMIT_SAFETY_FACTOR = 0.95
+DEFAULT_REQUESTS_PER_MINUTE = 30  # Limite prudente per exchange non configurati
+DEFAULT_BURST = 1  # Richieste consecutive consentite senza attesa
+
+# ===========================
+# 🔹 TOKEN BUCKET
+# ===========================
+
+class TokenBucket:
+    """Token bucket thread-safe che distribuisce le richieste nel tempo rispettando il limite al minuto."""
+
+    def __init__(self, name, requests_per_minute, burst=DEFAULT_BURST, safety_factor=RATE_LIMIT_SAFETY_FACTOR):
+        self.name = name
+        self.safety_factor = safety_factor
+        self.requests_per_minute = requests_per_minute
+        self.rate = max(requests_per_minute * safety_factor, 1e-6) / 60.0  # Token al secondo
+        self.capacity = max(1, burst)
+        self.tokens = float(self.capacity)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+        # 📊 Metriche
+        self.queue_depth = 0
+        self.total_requests = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.rate_limit_hits = 0
+
+    def _refill(self, now):
+        """Ricarica i token maturati dall'ultimo aggiornamento (non durante un blocco Retry-After)."""
+        if now > self._updated:
+            self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+            self._updated = now
+
+    def reserve(self):
+        """Prenota un token e restituisce i secondi da attendere prima di poter inviare la richiesta."""
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            self.tokens -= 1
+            wait = max(0.0, self._updated - now)
+            if self.tokens < 0:
+                wait += -self.tokens / self.rate
+
+            self.total_requests += 1
+            self.total_wait += wait
+            self.max_wait = max(self.max_wait, wait)
+            return wait
+
+    def set_limit(self, requests_per_minute, burst=None):
+        """Cambia limite e burst senza azzerare lo stato: token consumati e pausa Retry-After restano validi."""
+        with self._lock:
+            self._refill(time.monotonic())  # I token maturati finora contano con il limite precedente
+            self.requests_per_minute = requests_per_minute
+            self.rate = max(requests_per_minute * self.safety_factor, 1e-6) / 60.0
+            if burst is not None:
+                self.capacity = max(1, burst)
+            self.tokens = min(self.tokens, self.capacity)
+
+    def penalize(self, retry_after):
+        """Sospende l'emissione di token per `retry_after` secondi dopo una risposta 429."""
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            self.tokens = min(self.tokens, 0.0)
+            self._updated = max(self._updated, now + retry_after)
+            self.rate_limit_hits += 1
+        logging.warning(f"⏳ {self.name}: limite raggiunto, pausa di {retry_after:.1f} secondi.")
+
+    def _enter_queue(self):
+        with self._lock:
+            self.queue_depth += 1
+
+    def _leave_queue(self):
+        with self._lock:
+            self.queue_depth -= 1
+
+    async def acquire_async(self):
+        """Attende in modo asincrono il proprio turno."""
+        wait = self.reserve()
+        if wait > 0:
+            self._enter_queue()
+            try:
+                await asyncio.sleep(wait)
+            finally:
+                self._leave_queue()
+        return wait
+
+    def acquire(self):
+        """Attende in modo bloccante il proprio turno (per client sincroni come ccxt)."""
+        wait = self.reserve()
+        if wait > 0:
+            self._enter_queue()
+            try:
+                time.sleep(wait)
+            finally:
+                self._leave_queue()
+        return wait
+
+    def stats(self):
+        """Restituisce le metriche di coda e di attesa del bucket."""
+        with self._lock:
+            return {
+                "requests_per_minute": self.requests_per_minute,
+                "queue_depth": self.queue_depth,
+                "total_requests": self.total_requests,
+                "avg_wait": self.total_wait / self.total_requests if self.total_requests else 0.0,
+                "max_wait": self.max_wait,
+                "rate_limit_hits": self.rate_limit_hits,
+            }
+
+# ===========================
+# 🔹 SCHEDULER MULTI-EXCHANGE
+# ===========================
+
+class RateLimiter:
+    """Raccoglie un token bucket per ogni exchange e lo condivide tra tutti i moduli."""
+
+    def __init__(self, exchanges=None, burst=DEFAULT_BURST):
+        self.burst = burst
+        self.buckets = {}
+        self._lock = threading.Lock()
+        for exchange in exchanges or []:
+            limits = exchange.get("limitations", {})
+            self.register(exchange["name"], limits.get("requests_per_minute", DEFAULT_REQUESTS_PER_MINUTE))
+
+    def register(self, name, requests_per_minute, burst=None):
+        """Registra (o aggiorna sul bucket esistente, senza perderne lo stato) il limite di un exchange."""
+        with self._lock:
+            bucket = self.buckets.get(name)
+            if bucket is None:
+                bucket = TokenBucket(name, requests_per_minute, burst or self.burst)
+                self.buckets[name] = bucket
+            elif bucket.requests_per_minute != requests_per_minute or (burst and bucket.capacity != burst):
+                bucket.set_limit(requests_per_minute, burst)
+            return bucket
+
+    def bucket(self, name):
+        """Restituisce il bucket dell'exchange, creandone uno prudente se non configurato."""
+        with self._lock:
+            if name not in self.buckets:
+                logging.warning(f"⚠️ Exchange {name} senza limiti configurati, uso {DEFAULT_REQUESTS_PER_MINUTE} req/min.")
+                self.buckets[name] = TokenBucket(name, DEFAULT_REQUESTS_PER_MINUTE, self.burst)
+            return self.buckets[name]
+
+    async def acquire(self, name):
+        """Attende un token per l'exchange indicato (versione asincrona)."""
+        return await self.bucket(name).acquire_async()
+
+    def acquire_sync(self, name):
+        """Attende un token per l'exchange indicato (versione bloccante)."""
+        return self.bucket(name).acquire()
+
+    def penalize(self, name, retry_after):
+        """Applica l'attesa indicata dall'header Retry-After all'exchange."""
+        self.bucket(name).penalize(retry_after)
+
+    def stats(self):
+        """Metriche di coda e attesa per ogni exchange."""
+        with self._lock:
+            buckets = dict(self.buckets)
+        return {name: bucket.stats() for name, bucket in buckets.items()}
+
+def parse_retry_after(value, default=None):
+    """Converte l'header Retry-After (secondi o data HTTP) in secondi di attesa."""
+    if not value:
+        return default
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+        return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+    except (TypeError, ValueError):
+        return default
+
+_rate_limiter = None
+_rate_limiter_lock = threading.Lock()
+
+def get_rate_limiter():
+    """Restituisce lo scheduler condiviso, inizializzato da market_data_apis.json."""
+    global _rate_limiter
+    with _rate_limiter_lock:
+        if _rate_limiter is None:
+            _rate_limiter = RateLimiter(load_market_data_apis() or [])
+        return _rate_limiter
+
+# ===========================
+# 🔹 VERIFICA
+# ===========================
+
+def update_check():
+    """Cambiare il limite di un exchange mantiene lo stesso bucket, i token consumati e la pausa Retry-After."""
+    limiter = RateLimiter([{"name": "Test", "limitations": {"requests_per_minute": 60}}], burst=5)
+    bucket = limiter.bucket("Test")
+    for _ in range(5):
+        bucket.reserve()
+    bucket.penalize(30)
+    updated = limiter.register("Test", 120)
+    wait = updated.reserve()  # Nessun token residuo e pausa in corso: si attende almeno la pausa
+    ok = updated is bucket and updated.requests_per_minute == 120 and updated.capacity == 5 and wait >= 29
+    logging.info(f"{'✅' if ok else '❌'} Limite aggiornato sul bucket esistente (attesa {wait:.1f}s).")
+    return ok
+
+if __name__ == "__main__":
+    sys.exit(0 if update_check() else 1)
@@ -0,0 +1,340 @@
+# sentiment_client.py - Client asincrono del sentiment di mercato: richieste a blocchi, cache per simbolo e scadenze
+import sys
+import time
+import asyncio
+import logging
+import threading
+import aiohttp
+
+# Configurazione logging avanzata
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+# 📌 Parametri di default
+SENTIMENT_API_URL = "https://your-sentiment-api.com/analyze"
+TTL_SECONDS = 300  # Validità di un punteggio in cache
+BATCH_SIZE = 50  # Simboli per richiesta
+BATCH_WINDOW = 0.05  # Attesa per raccogliere altri simboli nella stessa richiesta
+REQUEST_TIMEOUT = 5.0
+DEADLINE = 0.25  # Attesa massima del chiamante prima di usare l'ultimo valore noto
+MAX_PRICES = 200  # Prezzi più recenti inviati per simbolo
+DEFAULT_SYMBOL = "*"
+LEGACY_STATUSES = {400, 404, 405, 415, 422}  # Risposte di un server che non conosce il formato a blocchi
+
+class SentimentClient:
+    """Raccoglie le richieste di più simboli in un'unica POST e tiene in cache i punteggi.
+
+    Richiesta: {"items": [{"symbol": ..., "prices": [...]}, ...]}
+    Risposta:  {"scores": {symbol: punteggio}}
+    Con un server che conosce solo il formato originale (risposta LEGACY_STATUSES o senza "scores") il
+    client passa a una richiesta {"prices": [...]} -> {"sentiment_score": x} per simbolo, in parallelo;
+    `batch_api` forza un formato (True/False), None lo rileva alla prima richiesta.
+    Un punteggio resta in cache per TTL_SECONDS dalla ricezione; se la risposta non arriva entro la
+    scadenza del chiamante si restituisce l'ultimo valore noto (0 se mai ricevuto) e la richiesta
+    prosegue in background aggiornando la cache.
+    """
+
+    def __init__(self, url=SENTIMENT_API_URL, ttl_seconds=TTL_SECONDS, batch_size=BATCH_SIZE,
+                 batch_window=BATCH_WINDOW, request_timeout=REQUEST_TIMEOUT, deadline=DEADLINE,
+                 max_prices=MAX_PRICES, batch_api=None):
+        self.url = url
+        self.ttl_seconds = ttl_seconds
+        self.batch_api = batch_api
+        self.batch_size = batch_size
+        self.batch_window = batch_window
+        self.request_timeout = request_timeout
+        self.deadline = deadline
+        self.max_prices = max_prices
+        self._cache = {}  # symbol -> (punteggio, ricevuto alle)
+        self._last = {}  # symbol -> ultimo punteggio ricevuto
+        self._pending = {}  # symbol -> (prezzi, future) in attesa della prossima richiesta
+        self._in_flight = {}  # symbol -> future della richiesta in corso
+        self._flush_task = None
+        self._session = None
+        self._loop = None
+        self._thread = None
+        self._lock = threading.Lock()
+
+        # 📊 Statistiche
+        self.hits = 0
+        self.misses = 0
+        self.requests = 0
+        self.errors = 0
+        self.deadline_fallbacks = 0
+
+    # ===========================
+    # 🔹 CACHE
+    # ===========================
+
+    def cached(self, symbol):
+        """Punteggio ricevuto da meno di ttl_seconds, None se assente o scaduto."""
+        entry = self._cache.get(symbol)
+        if entry and time.time() - entry[1] < self.ttl_seconds:
+            return entry[0]
+        return None
+
+    def last_known(self, symbol):
+        return self._last.get(symbol, 0)
+
+    def _store(self, symbol, score):
+        self._cache[symbol] = (score, time.time())
+        self._last[symbol] = score
+
+    # ===========================
+    # 🔹 API ASINCRONA
+    # ===========================
+
+    async def get_score(self, symbol=DEFAULT_SYMBOL, prices=None, deadline=None):
+        """Punteggio di un simbolo: dalla cache, altrimenti dalla prossima richiesta a blocchi entro `deadline`."""
+        score = self.cached(symbol)
+        if score is not None:
+            self.hits += 1
+            return score
+        self.misses += 1
+        future = self._in_flight.get(symbol) or self._enqueue(symbol, prices)
+        try:
+            return await asyncio.wait_for(asyncio.shield(future), self.deadline if deadline is None else deadline)
+        except asyncio.TimeoutError:
+            self.deadline_fallbacks += 1
+            return self.last_known(symbol)
+        except Exception:
+            return self.last_known(symbol)
+
+    async def get_scores(self, prices_by_symbol, deadline=None):
+        """Punteggi di più simboli con un'unica richiesta per i valori mancanti."""
+        symbols = list(prices_by_symbol)
+        scores = await asyncio.gather(*(self.get_score(symbol, prices_by_symbol[symbol], deadline) for symbol in symbols))
+        return dict(zip(symbols, scores))
+
+    def _enqueue(self, symbol, prices):
+        pending = self._pending.get(symbol)
+        if pending is not None:
+            return pending[1]
+        future = asyncio.get_running_loop().create_future()
+        self._pending[symbol] = (self._tail(prices), future)
+        if len(self._pending) >= self.batch_size:
+            self._start_flush(delay=0)
+        elif self._flush_task is None or self._flush_task.done():
+            self._start_flush(delay=self.batch_window)
+        return future
+
+    def _tail(self, prices):
+        if prices is None:
+            return []
+        prices = prices.tolist() if hasattr(prices, "tolist") else list(prices)
+        return prices[-self.max_prices:]
+
+    def _start_flush(self, delay):
+        self._flush_task = asyncio.get_running_loop().create_task(self._flush(delay))
+
+    async def _flush(self, delay):
+        if delay:
+            await asyncio.sleep(delay)
+        while self._pending:
+            symbols = list(self._pending)[:self.batch_size]
+            batch = {symbol: self._pending.pop(symbol) for symbol in symbols}
+            for symbol, (_, future) in batch.items():
+                self._in_flight[symbol] = future
+            await self._request(batch)
+
+    async def _post(self, payload, accept_legacy=False):
+        """POST all'API; con `accept_legacy` restituisce None se il server rifiuta il formato a blocchi."""
+        self.requests += 1
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=self.request_timeout))
+        async with self._session.post(self.url, json=payload) as response:
+            if accept_legacy and response.status in LEGACY_STATUSES:
+                return None
+            response.raise_for_status()
+            return await response.json()
+
+    async def _request_batch(self, batch):
+        """Una richiesta per tutto il blocco; None se il server conosce solo il formato originale."""
+        payload = {"items": [{"symbol": symbol, "prices": prices} for symbol, (prices, _) in batch.items()]}
+        body = await self._post(payload, accept_legacy=self.batch_api is None)
+        scores = body.get("scores") if isinstance(body, dict) else None
+        if scores is None and self.batch_api is None:
+            self.batch_api = False
+            logging.warning("⚠️ L'API di sentiment non accetta richieste a blocchi: uso una richiesta per simbolo.")
+            return None
+        self.batch_api = True
+        return scores
+
+    async def _request_legacy(self, batch):
+        """Formato originale dell'API: una richiesta {"prices": [...]} per simbolo, tutte in parallelo."""
+        symbols = list(batch)
+        bodies = await asyncio.gather(*(self._post({"prices": batch[symbol][0]}) for symbol in symbols),
+                                      return_exceptions=True)
+        failed = [body for body in bodies if isinstance(body, BaseException)]
+        if failed and len(failed) == len(bodies):
+            raise failed[0]
+        return {symbol: body.get("sentiment_score") for symbol, body in zip(symbols, bodies)
+                if isinstance(body, dict)}
+
+    async def _request(self, batch):
+        try:
+            scores = await self._request_batch(batch) if self.batch_api is not False else None
+            if scores is None:
+                scores = await self._request_legacy(batch)
+            for symbol, (_, future) in batch.items():
+                score = (scores or {}).get(symbol)
+                if score is not None:
+                    self._store(symbol, score)
+                if not future.done():
+                    future.set_result(self.last_known(symbol))
+        except Exception as e:
+            self.errors += 1
+            logging.error(f"⚠️ Errore nel recupero del sentiment di mercato ({len(batch)} simboli): {e}")
+            for symbol, (_, future) in batch.items():
+                if not future.done():
+                    future.set_result(self.last_known(symbol))
+        finally:
+            for symbol in batch:
+                self._in_flight.pop(symbol, None)
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+
+    # ===========================
+    # 🔹 API SINCRONA (per il calcolo degli indicatori)
+    # ===========================
+
+    def _ensure_loop(self):
+        with self._lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                self._thread = threading.Thread(target=self._loop.run_forever, name="sentiment-client", daemon=True)
+                self._thread.start()
+        return self._loop
+
+    def score(self, symbol=DEFAULT_SYMBOL, prices=None, deadline=None):
+        """Versione bloccante al massimo per `deadline` secondi: la richiesta gira nel loop del client."""
+        score = self.cached(symbol)
+        if score is not None:
+            self.hits += 1
+            return score
+        deadline = self.deadline if deadline is None else deadline
+        future = asyncio.run_coroutine_threadsafe(self.get_score(symbol, prices, deadline), self._ensure_loop())
+        try:
+            return future.result(timeout=deadline + 0.5)
+        except Exception:
+            self.deadline_fallbacks += 1
+            return self.last_known(symbol)
+
+    def scores(self, prices_by_symbol, deadline=None):
+        """Versione bloccante di get_scores(): tutti i simboli mancanti in richieste a blocchi, una sola attesa."""
+        scores = {symbol: self.cached(symbol) for symbol in prices_by_symbol}
+        missing = {symbol: prices_by_symbol[symbol] for symbol, score in scores.items() if score is None}
+        self.hits += len(scores) - len(missing)
+        if missing:
+            deadline = self.deadline if deadline is None else deadline
+            future = asyncio.run_coroutine_threadsafe(self.get_scores(missing, deadline), self._ensure_loop())
+            try:
+                scores.update(future.result(timeout=deadline + 0.5))
+            except Exception:
+                self.deadline_fallbacks += 1
+                scores.update({symbol: self.last_known(symbol) for symbol in missing})
+        return scores
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses, "requests": self.requests, "errors": self.errors,
+                "deadline_fallbacks": self.deadline_fallbacks, "symbols": len(self._last)}
+
+_client = None
+_client_lock = threading.Lock()
+
+def get_sentiment_client():
+    """Client condiviso da tutto il processo."""
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = SentimentClient()
+        return _client
+
+# ===========================
+# 🔹 SERVER LOCALE DI PROVA
+# ===========================
+
+async def stub_server(host="127.0.0.1", port=8766, latency=0.0):
+    """Server HTTP locale che risponde come l'API di sentiment dopo `latency` secondi (modificabile).
+
+    /analyze accetta entrambi i formati, /legacy solo quello originale {"prices": [...]} (400 agli altri).
+    Restituisce (runner, state): state["latency"] cambia il ritardo, state["requests"] conta le richieste,
+    state["symbols"] i simboli ricevuti e state["rejected"] le richieste a blocchi rifiutate da /legacy.
+    """
+    from aiohttp import web
+    state = {"latency": latency, "requests": 0, "symbols": 0, "rejected": 0}
+
+    def score(prices):
+        return 1 if len(prices) > 1 and prices[-1] > prices[0] else -1
+
+    async def analyze(request, legacy=False):
+        body = await request.json()
+        state["requests"] += 1
+        if "items" in body and legacy:
+            state["rejected"] += 1
+            return web.json_response({"error": "prices mancanti"}, status=400)
+        await asyncio.sleep(state["latency"])
+        if "items" not in body:
+            state["symbols"] += 1
+            return web.json_response({"sentiment_score": score(body["prices"])})
+        state["symbols"] += len(body["items"])
+        return web.json_response({"scores": {item["symbol"]: score(item["prices"]) for item in body["items"]}})
+
+    async def analyze_legacy(request):
+        return await analyze(request, legacy=True)
+
+    app = web.Application()
+    app.router.add_post("/analyze", analyze)
+    app.router.add_post("/legacy", analyze_legacy)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    return runner, state
+
+async def stub_check(n_symbols=40):
+    """Prova su server locale: richieste a blocchi, cache con TTL, scadenza con ultimo valore noto, server
+    lento e server che accetta solo il formato originale."""
+    runner, state = await stub_server()
+    client = SentimentClient(url="http://127.0.0.1:8766/analyze", batch_size=25, deadline=0.5)
+    legacy = SentimentClient(url="http://127.0.0.1:8766/legacy", batch_size=25, deadline=0.5)
+    prices = {f"COIN{i}": [1.0, 2.0] if i % 2 else [2.0, 1.0] for i in range(n_symbols)}
+    checks = {}
+    try:
+        scores = await client.get_scores(prices)
+        checks["batched"] = state["requests"] == -(-n_symbols // 25) and state["symbols"] == n_symbols
+        checks["scores"] = all(scores[symbol] == (1 if i % 2 else -1) for i, symbol in enumerate(prices))
+
+        await client.get_scores(prices)
+        checks["cached"] = state["requests"] == -(-n_symbols // 25) and client.batch_api is True
+
+        score, received_at = client._cache["COIN1"]  # Scade solo dopo ttl_seconds dalla ricezione
+        client._cache["COIN1"] = (score, received_at - client.ttl_seconds + 1)
+        fresh = client.cached("COIN1") == 1
+        client._cache["COIN1"] = (score, received_at - client.ttl_seconds)
+        checks["ttl"] = fresh and client.cached("COIN1") is None
+
+        state["requests"] = state["symbols"] = 0
+        first = await legacy.get_scores(dict(list(prices.items())[:4]))
+        second = await legacy.get_scores(dict(list(prices.items())[4:8]))
+        checks["legacy"] = (legacy.batch_api is False and state["rejected"] == 1 and state["symbols"] == 8
+                            and all(scores[symbol] == value for symbol, value in {**first, **second}.items()))
+
+        client._cache.clear()  # Cache scaduta, server lento: si usa l'ultimo valore noto senza attendere
+        state["latency"] = 1.0
+        started = time.perf_counter()
+        score = await client.get_score("COIN1", prices["COIN1"], deadline=0.1)
+        checks["deadline"] = score == 1 and time.perf_counter() - started < 0.5
+        await asyncio.sleep(1.2)  # La richiesta in background aggiorna comunque la cache
+        checks["refreshed"] = client.cached("COIN1") == 1
+    finally:
+        await client.close()
+        await legacy.close()
+        await runner.cleanup()
+
+    ok = all(checks.values())
+    logging.info(f"{'✅' if ok else '❌'} Client sentiment: {checks}, statistiche {client.stats()}")
+    return ok
+
+if __name__ == "__main__":
+    sys.exit(0 if asyncio.run(stub_check()) else 1)
@@ -0,0 +1,302 @@
+# signal_panel.py - Motore dei segnali su un panel di simboli: array (tempo x simbolo) e ranking trasversali
+import sys
+import time
+import logging
+import numpy as np
+import pandas as pd
+from indicators import TradingIndicators, SIGNAL_INPUTS
+from sentiment_client import get_sentiment_client
+
+# Configurazione logging avanzata
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+# 📌 Campi del panel (input delle regole di TradingIndicators.generate_signals)
+PANEL_FIELDS = ["close"] + SIGNAL_INPUTS
+WINDOW = 500  # Barre tenute in memoria per simbolo
+RSI_OVERSOLD = 30
+RSI_OVERBOUGHT = 70
+ADX_TREND = 20
+# 📌 Parametri dello screening: con le bande di default (5 barre, 2 deviazioni) il prezzo non può uscire
+# dalla banda e le regole non darebbero mai segnali
+SCREEN_OVERRIDES = {"BB_upper": {"timeperiod": 20}}
+
+# ===========================
+# 🔹 RANKING TRASVERSALI (una riga = una barra, una colonna = un simbolo)
+# ===========================
+
+def cross_sectional_rank(values):
+    """Percentile di ogni simbolo nella sua barra, in [0, 1] (NaN restano NaN; 1 = valore più alto)."""
+    values = np.atleast_2d(np.asarray(values, dtype=np.float64))
+    valid = ~np.isnan(values)
+    ranks = np.argsort(np.argsort(values, axis=1, kind="stable"), axis=1).astype(np.float64)  # NaN in fondo
+    counts = valid.sum(axis=1, keepdims=True)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        ranks = np.where(counts > 1, ranks / (counts - 1), 1.0)
+    ranks[~valid] = np.nan
+    return ranks
+
+def cross_sectional_zscore(values):
+    """Z-score di ogni simbolo rispetto agli altri simboli nella stessa barra."""
+    values = np.atleast_2d(np.asarray(values, dtype=np.float64))
+    valid = ~np.isnan(values)
+    counts = valid.sum(axis=1, keepdims=True)
+    filled = np.where(valid, values, 0.0)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean = filled.sum(axis=1, keepdims=True) / counts
+        std = np.sqrt(np.where(valid, (values - mean) ** 2, 0.0).sum(axis=1, keepdims=True) / counts)
+        return np.where(std > 0, (values - mean) / std, 0.0) * np.where(valid, 1.0, np.nan)
+
+def top_k(scores, symbols, k=10, mask=None):
+    """I `k` simboli con il punteggio più alto in una barra (vettore 1-D), eventualmente solo dove `mask`."""
+    scores = np.asarray(scores, dtype=np.float64)
+    scores = np.where(np.isnan(scores) if mask is None else ~np.asarray(mask, dtype=bool) | np.isnan(scores), -np.inf, scores)
+    k = min(k, int(np.isfinite(scores).sum()))
+    if k <= 0:
+        return []
+    best = np.argpartition(-scores, k - 1)[:k]
+    best = best[np.argsort(-scores[best], kind="stable")]
+    return [(symbols[i], float(scores[i])) for i in best]
+
+# ===========================
+# 🔹 PANEL DEI SEGNALI
+# ===========================
+
+class SignalPanel:
+    """Array allineati (tempo x simbolo) di close, bande di Bollinger, RSI, ADX, sentiment e order flow.
+
+    Le regole di acquisto/vendita di generate_signals() vengono valutate per tutti i simboli con un
+    unico passaggio vettoriale. Le nuove barre si aggiungono con push(): il buffer ha capacità doppia
+    rispetto alla finestra e viene compattato solo quando si riempie (costo costante ammortizzato).
+    """
+
+    def __init__(self, symbols, index, fields, window=WINDOW):
+        self.symbols = list(symbols)
+        self._column = {symbol: i for i, symbol in enumerate(self.symbols)}
+        self.window = window
+        rows = min(len(index), window)
+        capacity = 2 * window
+        self._index = np.empty(capacity, dtype="datetime64[ns]")
+        self._index[:rows] = np.asarray(index, dtype="datetime64[ns]")[-rows:] if rows else []
+        self._data = {}
+        for name in PANEL_FIELDS:
+            buffer = np.full((capacity, len(self.symbols)), np.nan)
+            buffer[:rows] = np.asarray(fields[name], dtype=np.float64)[-rows:] if rows else np.nan
+            self._data[name] = buffer
+        self._start, self._stop = 0, rows
+
+    @classmethod
+    def from_frames(cls, frames, window=WINDOW, sentiment_deadline=None, overrides=None):
+        """Panel da {simbolo: DataFrame OHLCV} indicizzati per tempo (asse comune = unione dei tempi).
+
+        Calcola solo gli input dei segnali mancanti (`overrides` come in TradingIndicators.compute); il
+        sentiment dei simboli che non lo hanno viene chiesto con un'unica chiamata a blocchi al client condiviso.
+        """
+        prepared = {}
+        for symbol, df in frames.items():
+            df = df.copy(deep=False)  # Le nuove colonne non toccano il DataFrame del chiamante
+            missing = [name for name in SIGNAL_INPUTS if name not in df.columns and name != "Sentiment_Score"]
+            if missing:
+                TradingIndicators.compute(df, missing, overrides)
+            prepared[symbol] = df
+
+        need_sentiment = {symbol: df["close"] for symbol, df in prepared.items() if "Sentiment_Score" not in df.columns}
+        if need_sentiment:
+            scores = get_sentiment_client().scores(need_sentiment, sentiment_deadline)
+            for symbol, score in scores.items():
+                prepared[symbol]["Sentiment_Score"] = float(score)
+
+        symbols = list(prepared)
+        fields = {name: pd.DataFrame({symbol: prepared[symbol][name] for symbol in symbols}) for name in PANEL_FIELDS}
+        index = fields["close"].index
+        return cls(symbols, index, {name: frame.reindex(index).to_numpy(dtype=np.float64) for name, frame in fields.items()}, window)
+
+    @classmethod
+    def from_long(cls, df, symbol_column="coin_id", window=WINDOW, sentiment_deadline=None, overrides=None):
+        """Panel da un DataFrame lungo (una riga per barra e simbolo, indice temporale)."""
+        frames = {str(symbol): group.drop(columns=symbol_column)
+                  for symbol, group in df.groupby(symbol_column, observed=True, sort=False)}
+        return cls.from_frames(frames, window, sentiment_deadline, overrides)
+
+    # ===========================
+    # 🔹 DATI
+    # ===========================
+
+    def __len__(self):
+        return self._stop - self._start
+
+    @property
+    def index(self):
+        return pd.DatetimeIndex(self._index[self._start:self._stop])
+
+    def field(self, name):
+        """Vista (tempo x simbolo) di un campo, senza copie."""
+        return self._data[name][self._start:self._stop]
+
+    def push(self, timestamp, values):
+        """Aggiunge una barra: `values` è {campo: vettore ordinato come self.symbols} (campi assenti = NaN)."""
+        if self._stop == len(self._index):
+            keep = min(len(self), self.window - 1)
+            for buffer in (self._index, *self._data.values()):
+                buffer[:keep] = buffer[self._stop - keep:self._stop]
+            self._start, self._stop = 0, keep
+        elif len(self) >= self.window:
+            self._start += 1
+        self._index[self._stop] = pd.Timestamp(timestamp).to_datetime64()
+        for name, buffer in self._data.items():
+            buffer[self._stop] = values.get(name, np.nan)
+        self._stop += 1
+
+    # ===========================
+    # 🔹 SEGNALI
+    # ===========================
+
+    def _rules(self, rows):
+        close, lower, upper = (self._data[name][rows] for name in ("close", "BB_lower", "BB_upper"))
+        rsi, adx = self._data["RSI"][rows], self._data["ADX"][rows]
+        sentiment, order_flow = self._data["Sentiment_Score"][rows], self._data["Order_Flow_Score"][rows]
+        trend = adx > ADX_TREND
+        buy = (close < lower) & (rsi < RSI_OVERSOLD) & trend & (sentiment > 0) & (order_flow > 0)
+        sell = (close > upper) & (rsi > RSI_OVERBOUGHT) & trend & (sentiment < 0) & (order_flow < 0)
+        return buy, sell
+
+    def signals(self):
+        """Matrici booleane (tempo x simbolo) di acquisto e vendita, stesse regole di generate_signals()."""
+        return self._rules(slice(self._start, self._stop))
+
+    def latest_signals(self):
+        """Segnali dell'ultima barra (vettori per simbolo)."""
+        return self._rules(self._stop - 1)
+
+    def strength(self, rows=None):
+        """Forza del segnale: distanza dalla banda in ampiezze di banda più distanza dell'RSI dalla soglia.
+
+        Positiva per eccessi al ribasso (candidati all'acquisto), negativa per eccessi al rialzo.
+        """
+        rows = slice(self._start, self._stop) if rows is None else rows
+        close, lower, upper = (self._data[name][rows] for name in ("close", "BB_lower", "BB_upper"))
+        rsi = self._data["RSI"][rows]
+        with np.errstate(invalid="ignore", divide="ignore"):
+            width = upper - lower
+            band = np.where(close < lower, (lower - close) / width, np.where(close > upper, (upper - close) / width, 0.0))
+        rsi_excess = np.where(rsi < RSI_OVERSOLD, RSI_OVERSOLD - rsi, np.where(rsi > RSI_OVERBOUGHT, RSI_OVERBOUGHT - rsi, 0.0))
+        return band + rsi_excess / 100
+
+    def screen(self, k=10):
+        """Ultima barra: i `k` migliori candidati all'acquisto e alla vendita, ordinati per forza del segnale."""
+        buy, sell = self.latest_signals()
+        strength = self.strength(self._stop - 1)
+        return {"buy": top_k(strength, self.symbols, k, buy), "sell": top_k(-strength, self.symbols, k, sell)}
+
+    @classmethod
+    def select(cls, frames, default=None, k=10, overrides=SCREEN_OVERRIDES, sentiment_deadline=None):
+        """Simbolo con il segnale più forte nell'ultima barra di `frames`, `default` se nessuno dà segnali.
+
+        Restituisce (simbolo, screen); `frames` sono i dati già caricati ({simbolo: DataFrame OHLCV}).
+        """
+        if not frames:
+            return default, {"buy": [], "sell": []}
+        screen = cls.from_frames(frames, sentiment_deadline=sentiment_deadline, overrides=overrides).screen(k)
+        candidates = screen["buy"] + screen["sell"]
+        best = max(candidates, key=lambda candidate: candidate[1])[0] if candidates else default
+        return best, screen
+
+    def rank(self, name="RSI", rows=None):
+        """Percentile trasversale di un campo (o della forza del segnale con name="strength")."""
+        rows = slice(self._start, self._stop) if rows is None else rows
+        values = self.strength(rows) if name == "strength" else self._data[name][rows]
+        return cross_sectional_rank(values)
+
+    def zscore(self, name="RSI", rows=None):
+        rows = slice(self._start, self._stop) if rows is None else rows
+        values = self.strength(rows) if name == "strength" else self._data[name][rows]
+        return cross_sectional_zscore(values)
+
+# ===========================
+# 🔹 VERIFICA E BENCHMARK
+# ===========================
+
+SYNTHETIC_OVERRIDES = SCREEN_OVERRIDES
+
+def synthetic_frames(n_symbols=300, n_bars=WINDOW, seed=7):
+    """Frame OHLCV sintetici per simbolo con indicatori dei segnali già calcolati e sentiment fisso.
+
+    Le bande sono a 20 barre: con quelle di default (5 barre, 2 deviazioni) il prezzo non può uscire
+    dalla banda e le regole non darebbero mai segnali da confrontare.
+    """
+    from streaming_indicators import synthetic_ohlcv
+    rng = np.random.default_rng(seed)
+    frames = {}
+    for i in range(n_symbols):
+        df = synthetic_ohlcv(n_bars, seed=seed + i)
+        TradingIndicators.compute(df, [name for name in SIGNAL_INPUTS if name != "Sentiment_Score"], SYNTHETIC_OVERRIDES)
+        df["Sentiment_Score"] = float(rng.choice([-1.0, 1.0]))
+        frames[f"COIN{i}USDT"] = df
+    return frames
+
+def verify(frames=None):
+    """Confronta i segnali del panel con generate_signals() eseguito simbolo per simbolo."""
+    frames = frames or synthetic_frames(n_symbols=50)
+    panel = SignalPanel.from_frames(frames)
+    buy, sell = panel.signals()
+    mismatched = []
+    for j, (symbol, df) in enumerate(frames.items()):
+        expected = TradingIndicators.generate_signals(df.copy())
+        rows = len(panel)
+        if not (np.array_equal(buy[:, j], expected["Buy_Signal"].to_numpy()[-rows:])
+                and np.array_equal(sell[:, j], expected["Sell_Signal"].to_numpy()[-rows:])):
+            mismatched.append(symbol)
+    ok = not mismatched and buy.any() and sell.any()
+    logging.info(f"{'✅' if ok else '❌'} Segnali del panel uguali a generate_signals() su {len(frames)} simboli "
+                 f"({int(buy.sum())} acquisti, {int(sell.sum())} vendite){'' if not mismatched else f', diversi: {mismatched}'}")
+    return ok
+
+def select_check(n_symbols=20, n_bars=300):
+    """select() su dati OHLCV senza indicatori: sceglie un simbolo con segnale invece del primo (default)."""
+    frames = synthetic_frames(n_symbols, n_bars)
+    panel = SignalPanel.from_frames(frames)
+    buy, sell = panel.signals()
+    signalled = buy | sell
+    # Ultima barra in cui un simbolo diverso dal primo ha un segnale e il primo no: la storia si ferma lì
+    rows = np.flatnonzero(signalled[:, 1:].any(axis=1) & ~signalled[:, 0])
+    if not len(rows):
+        logging.error("❌ Nessun segnale nei dati sintetici.")
+        return False
+    end = panel.index[rows[-1]]
+    raw = {symbol: df.loc[:end, ["open", "high", "low", "close", "volume", "Sentiment_Score"]]
+           for symbol, df in frames.items()}  # Gli indicatori li calcola select() con SCREEN_OVERRIDES
+
+    first = panel.symbols[0]
+    chosen, screen = SignalPanel.select(raw, default=first)
+    ok = chosen != first and chosen in [symbol for symbol, _ in screen["buy"] + screen["sell"]]
+    logging.info(f"{'✅' if ok else '❌'} Screening: scelto {chosen} invece di {first} "
+                 f"(acquisto {screen['buy'][:3]}, vendita {screen['sell'][:3]})")
+    return ok
+
+def benchmark(n_symbols=500, n_bars=WINDOW, bars=200):
+    """Screening di `n_symbols` simboli a ogni nuova barra contro generate_signals() simbolo per simbolo."""
+    frames = synthetic_frames(n_symbols, n_bars + bars)
+    history = {symbol: df.iloc[:n_bars] for symbol, df in frames.items()}
+    panel = SignalPanel.from_frames(history)
+    live = {name: np.column_stack([frames[symbol][name].to_numpy()[n_bars:] for symbol in panel.symbols])
+            for name in PANEL_FIELDS}
+    new_index = frames[panel.symbols[0]].index[n_bars:]
+
+    started = time.perf_counter()
+    for t in range(bars):
+        panel.push(new_index[t], {name: live[name][t] for name in PANEL_FIELDS})
+        screen = panel.screen()
+    per_bar = (time.perf_counter() - started) / bars
+
+    started = time.perf_counter()
+    for symbol in panel.symbols:
+        TradingIndicators.generate_signals(history[symbol].copy())
+    loop = time.perf_counter() - started
+
+    ok = verify(frames={symbol: df.iloc[:120] for symbol, df in list(frames.items())[:50]})
+    logging.info(f"📊 {n_symbols} simboli: push + screening in {per_bar * 1000:.2f} ms per barra "
+                 f"(generate_signals simbolo per simbolo: {loop * 1000:.0f} ms); "
+                 f"ultimi candidati acquisto {screen['buy'][:3]}, vendita {screen['sell'][:3]}")
+    return ok
+
+if __name__ == "__main__":
+    sys.exit(0 if benchmark() and select_check() else 1)
@@ -0,0 +1,520 @@
+# streaming_indicators.py - Indicatori tecnici incrementali (costo O(1) per nuova barra) con stato serializzabile
+import os
+import sys
+import json
+import math
+import time
+import logging
+from collections import deque
+import numpy as np
+import pandas as pd
+
+# Configurazione logging avanzata
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+NAN = float("nan")
+
+def _is_zero(value):
+    """Stesso confronto con zero usato da TA-Lib (TA_IS_ZERO)."""
+    return -1e-14 < value < 1e-14
+
+# ===========================
+# 🔹 STATO SERIALIZZABILE
+# ===========================
+
+_REGISTRY = {}
+
+class StreamingIndicator:
+    """Base degli indicatori incrementali: lo stato è composto solo da numeri, deque e altri indicatori."""
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        _REGISTRY[cls.__name__] = cls
+
+    def to_dict(self):
+        state = {}
+        for key, value in vars(self).items():
+            if isinstance(value, StreamingIndicator):
+                state[key] = value.to_dict()
+            elif isinstance(value, deque):
+                state[key] = {"deque": [list(item) if isinstance(item, tuple) else item for item in value],
+                              "maxlen": value.maxlen}
+            else:
+                state[key] = value
+        return {"type": type(self).__name__, "state": state}
+
+    @staticmethod
+    def from_dict(data):
+        indicator = object.__new__(_REGISTRY[data["type"]])
+        for key, value in data["state"].items():
+            if isinstance(value, dict) and "type" in value and "state" in value:
+                value = StreamingIndicator.from_dict(value)
+            elif isinstance(value, dict) and "deque" in value:
+                value = deque(value["deque"], maxlen=value["maxlen"])
+            setattr(indicator, key, value)
+        return indicator
+
+# ===========================
+# 🔹 MEDIE MOBILI
+# ===========================
+
+class SMA(StreamingIndicator):
+    """Media mobile semplice su somma mobile (come TA-Lib SMA)."""
+
+    def __init__(self, period):
+        self.period = period
+        self.window = deque(maxlen=period)
+        self.total = 0.0
+
+    def update(self, value):
+        if len(self.window) == self.period:
+            self.total -= self.window[0]
+        self.window.append(value)
+        self.total += value
+        return self.total / self.period if len(self.window) == self.period else NAN
+
+class EMA(StreamingIndicator):
+    """Media esponenziale inizializzata con la SMA dei primi `period` valori (come TA-Lib EMA).
+
+    `delay` ignora i primi valori: serve al MACD, in cui TA-Lib allinea l'EMA veloce a quella lenta.
+    """
+
+    def __init__(self, period, delay=0):
+        self.period = period
+        self.k = 2.0 / (period + 1)
+        self.delay = delay
+        self.seen = 0
+        self.seed_total = 0.0
+        self.value = None
+
+    def update(self, value):
+        self.seen += 1
+        if self.seen <= self.delay:
+            return NAN
+        if self.value is None:
+            self.seed_total += value
+            if self.seen - self.delay < self.period:
+                return NAN
+            self.value = self.seed_total / self.period
+            return self.value
+        self.value = (value - self.value) * self.k + self.value
+        return self.value
+
+class TEMA(StreamingIndicator):
+    """Triple EMA: 3·EMA1 − 3·EMA2 + EMA3."""
+
+    def __init__(self, period):
+        self.ema1, self.ema2, self.ema3 = EMA(period), EMA(period), EMA(period)
+
+    def update(self, value):
+        e1 = self.ema1.update(value)
+        if math.isnan(e1):
+            return NAN
+        e2 = self.ema2.update(e1)
+        if math.isnan(e2):
+            return NAN
+        e3 = self.ema3.update(e2)
+        if math.isnan(e3):
+            return NAN
+        return 3.0 * e1 - 3.0 * e2 + e3
+
+# ===========================
+# 🔹 OSCILLATORI E VOLATILITÀ
+# ===========================
+
+class BollingerBands(StreamingIndicator):
+    """Bande di Bollinger su SMA con deviazione standard della popolazione (come TA-Lib BBANDS)."""
+
+    def __init__(self, period, nbdev=2.0):
+        self.period = period
+        self.nbdev = nbdev
+        self.window = deque(maxlen=period)
+        self.total = 0.0
+
+    def update(self, value):
+        if len(self.window) == self.period:
+            self.total -= self.window[0]
+        self.window.append(value)
+        self.total += value
+        if len(self.window) < self.period:
+            return NAN, NAN, NAN
+        mean = self.total / self.period
+        # Varianza sugli scarti dalla media: la somma mobile dei quadrati perde precisione sui prezzi piatti
+        variance = sum((x - mean) * (x - mean) for x in self.window) / self.period
+        std = math.sqrt(variance)
+        return mean + self.nbdev * std, mean, mean - self.nbdev * std
+
+class RSI(StreamingIndicator):
+    """RSI con media di Wilder (come TA-Lib RSI)."""
+
+    def __init__(self, period):
+        self.period = period
+        self.previous = None
+        self.moves = 0
+        self.gain = 0.0
+        self.loss = 0.0
+
+    def update(self, value):
+        if self.previous is None:
+            self.previous = value
+            return NAN
+        change = value - self.previous
+        self.previous = value
+        self.moves += 1
+        if self.moves > self.period:
+            self.gain *= self.period - 1
+            self.loss *= self.period - 1
+        if change < 0:
+            self.loss -= change
+        else:
+            self.gain += change
+        if self.moves < self.period:
+            return NAN
+        self.gain /= self.period
+        self.loss /= self.period
+        total = self.gain + self.loss
+        return 0.0 if _is_zero(total) else 100.0 * self.gain / total
+
+class MACD(StreamingIndicator):
+    """MACD, linea del segnale e istogramma (come TA-Lib MACD)."""
+
+    def __init__(self, fast=12, slow=26, signal=9):
+        fast, slow = min(fast, slow), max(fast, slow)
+        self.fast = EMA(fast, delay=slow - fast)
+        self.slow = EMA(slow)
+        self.signal = EMA(signal)
+
+    def update(self, value):
+        fast, slow = self.fast.update(value), self.slow.update(value)
+        if math.isnan(slow):
+            return NAN, NAN, NAN
+        macd = fast - slow
+        signal = self.signal.update(macd)
+        if math.isnan(signal):
+            return NAN, NAN, NAN
+        return macd, signal, macd - signal
+
+def _true_range(high, low, previous_close):
+    return max(high - low, abs(high - previous_close), abs(low - previous_close))
+
+class ATR(StreamingIndicator):
+    """Average True Range con media di Wilder (come TA-Lib ATR)."""
+
+    def __init__(self, period):
+        self.period = period
+        self.previous_close = None
+        self.count = 0
+        self.total = 0.0
+        self.value = None
+
+    def update(self, high, low, close):
+        if self.previous_close is None:
+            self.previous_close = close
+            return NAN
+        true_range = _true_range(high, low, self.previous_close)
+        self.previous_close = close
+        self.count += 1
+        if self.value is None:
+            self.total += true_range
+            if self.count < self.period:
+                return NAN
+            self.value = self.total / self.period
+            return self.value
+        self.value = (self.value * (self.period - 1) + true_range) / self.period
+        return self.value
+
+class DirectionalMovement(StreamingIndicator):
+    """ADX, +DI e -DI calcolati insieme (come TA-Lib ADX, PLUS_DI e MINUS_DI)."""
+
+    def __init__(self, period):
+        self.period = period
+        self.previous = None  # [high, low, close] della barra precedente
+        self.moves = 0
+        self.plus_dm = 0.0
+        self.minus_dm = 0.0
+        self.true_range = 0.0
+        self.dx_total = 0.0
+        self.adx = None
+
+    def update(self, high, low, close):
+        if self.previous is None:
+            self.previous = [high, low, close]
+            return NAN, NAN, NAN
+        previous_high, previous_low, previous_close = self.previous
+        self.previous = [high, low, close]
+        diff_plus, diff_minus = high - previous_high, previous_low - low
+        plus_dm = minus_dm = 0.0
+        if diff_minus > 0 and diff_plus < diff_minus:
+            minus_dm = diff_minus
+        elif diff_plus > 0 and diff_plus > diff_minus:
+            plus_dm = diff_plus
+        true_range = _true_range(high, low, previous_close)
+        self.moves += 1
+
+        n = self.period
+        if self.moves < n:
+            self.plus_dm += plus_dm
+            self.minus_dm += minus_dm
+            self.true_range += true_range
+            return NAN, NAN, NAN
+        self.plus_dm += plus_dm - self.plus_dm / n
+        self.minus_dm += minus_dm - self.minus_dm / n
+        self.true_range += true_range - self.true_range / n
+
+        plus_di = minus_di = 0.0
+        dx = None
+        if not _is_zero(self.true_range):
+            plus_di = 100.0 * self.plus_dm / self.true_range
+            minus_di = 100.0 * self.minus_dm / self.true_range
+            di_total = plus_di + minus_di
+            if not _is_zero(di_total):
+                dx = 100.0 * abs(minus_di - plus_di) / di_total
+
+        dx_count = self.moves - n + 1
+        if dx_count <= n:
+            self.dx_total += dx or 0.0
+            if dx_count == n:
+                self.adx = self.dx_total / n
+        elif dx is not None:
+            self.adx = (self.adx * (n - 1) + dx) / n
+        return (NAN if self.adx is None else self.adx), plus_di, minus_di
+
+# ===========================
+# 🔹 ICHIMOKU E VOLUMI
+# ===========================
+
+class RollingExtreme(StreamingIndicator):
+    """Massimo (o minimo) mobile in O(1) ammortizzato con deque monotona."""
+
+    def __init__(self, period, maximum=True):
+        self.period = period
+        self.maximum = maximum
+        self.index = 0
+        self.candidates = deque()  # coppie (indice, valore)
+
+    def update(self, value):
+        candidates = self.candidates
+        if self.maximum:
+            while candidates and candidates[-1][1] <= value:
+                candidates.pop()
+        else:
+            while candidates and candidates[-1][1] >= value:
+                candidates.pop()
+        candidates.append((self.index, value))
+        if candidates[0][0] <= self.index - self.period:
+            candidates.popleft()
+        self.index += 1
+        return candidates[0][1] if self.index >= self.period else NAN
+
+class Ichimoku(StreamingIndicator):
+    """Linee Ichimoku come in TradingIndicators.calculate_indicators (spans spostati in avanti di `shift`)."""
+
+    def __init__(self, conversion=9, base=26, span_b=52, shift=26):
+        self.conversion_high, self.conversion_low = RollingExtreme(conversion), RollingExtreme(conversion, False)
+        self.base_high, self.base_low = RollingExtreme(base), RollingExtreme(base, False)
+        self.span_b_high, self.span_b_low = RollingExtreme(span_b), RollingExtreme(span_b, False)
+        self.spans = deque(maxlen=shift + 1)  # coppie (span A, span B) degli ultimi shift+1 periodi
+
+    def update(self, high, low):
+        conversion = (self.conversion_high.update(high) + self.conversion_low.update(low)) / 2
+        base = (self.base_high.update(high) + self.base_low.update(low)) / 2
+        span_b = (self.span_b_high.update(high) + self.span_b_low.update(low)) / 2
+        self.spans.append(((conversion + base) / 2, span_b))
+        span_a, span_b_shifted = self.spans[0] if len(self.spans) == self.spans.maxlen else (NAN, NAN)
+        return conversion, base, span_a, span_b_shifted
+
+class VolumeMomentum(StreamingIndicator):
+    """Variazione percentuale del volume e sua somma mobile (Volume_Change, Volume_Momentum)."""
+
+    def __init__(self, window=3):
+        self.previous = None
+        self.changes = deque(maxlen=window)
+
+    def update(self, volume):
+        if self.previous is None:
+            change = NAN
+        elif self.previous == 0:
+            change = NAN if volume == 0 else math.copysign(math.inf, volume)
+        else:
+            change = volume / self.previous - 1.0
+        self.previous = volume
+        self.changes.append(change)
+        momentum = sum(self.changes) if len(self.changes) == self.changes.maxlen else NAN
+        return change, momentum
+
+# ===========================
+# 🔹 MOTORE COMPLETO
+# ===========================
+
+class IndicatorEngine:
+    """Aggiorna barra per barra le colonne di TradingIndicators.calculate_indicators (più il MACD).
+
+    Gli indicatori che dipendono da servizi esterni (sentiment, order flow) restano nel calcolo batch.
+    """
+
+    def __init__(self, fast_period=5, rsi_period=7, macd=(12, 26, 9)):
+        self.sma = SMA(fast_period)
+        self.ema = EMA(fast_period)
+        self.tema = TEMA(fast_period)
+        self.bbands = BollingerBands(fast_period)
+        self.atr = ATR(fast_period)
+        self.dmi = DirectionalMovement(fast_period)
+        self.rsi = RSI(rsi_period)
+        self.macd = MACD(*macd)
+        self.ichimoku = Ichimoku()
+        self.volume = VolumeMomentum()
+        self.bars = 0
+
+    def update(self, bar):
+        """Aggiunge una barra (dict o riga con open/high/low/close/volume) e restituisce i nuovi valori."""
+        high, low, close = float(bar["high"]), float(bar["low"]), float(bar["close"])
+        volume = float(bar["volume"])
+        bb_upper, bb_middle, bb_lower = self.bbands.update(close)
+        atr = self.atr.update(high, low, close)
+        adx, plus_di, minus_di = self.dmi.update(high, low, close)
+        macd, macd_signal, macd_hist = self.macd.update(close)
+        conversion, base, span_a, span_b = self.ichimoku.update(high, low)
+        volume_change, volume_momentum = self.volume.update(volume)
+        self.bars += 1
+        return {
+            "SMA": self.sma.update(close), "EMA": self.ema.update(close), "TEMA": self.tema.update(close),
+            "BB_upper": bb_upper, "BB_middle": bb_middle, "BB_lower": bb_lower,
+            "ATR": atr, "Volatility_Index": atr / close if close else NAN,
+            "Volume_Change": volume_change, "Volume_Momentum": volume_momentum,
+            "Breakout": close > bb_upper and volume_momentum > 0,
+            "ADX": adx, "+DI": plus_di, "-DI": minus_di, "RSI": self.rsi.update(close),
+            "MACD": macd, "MACD_signal": macd_signal, "MACD_hist": macd_hist,
+            "conversion_line": conversion, "base_line": base, "leading_span_a": span_a, "leading_span_b": span_b,
+        }
+
+    def update_frame(self, df):
+        """Elabora in ordine le barre di un DataFrame (es. per inizializzare lo stato dallo storico)."""
+        columns = [df[column].to_numpy(dtype=float) for column in ("high", "low", "close", "volume")]
+        rows = [self.update({"high": h, "low": l, "close": c, "volume": v}) for h, l, c, v in zip(*columns)]
+        return pd.DataFrame(rows, index=df.index)
+
+    # ===========================
+    # 🔹 PERSISTENZA DELLO STATO
+    # ===========================
+
+    def to_dict(self):
+        return {key: value.to_dict() if isinstance(value, StreamingIndicator) else value
+                for key, value in vars(self).items()}
+
+    @classmethod
+    def from_dict(cls, data):
+        engine = object.__new__(cls)
+        for key, value in data.items():
+            if isinstance(value, dict) and "type" in value:
+                value = StreamingIndicator.from_dict(value)
+            setattr(engine, key, value)
+        return engine
+
+    def save(self, path):
+        """Salva lo stato in JSON in modo atomico (NaN e infiniti sono ammessi)."""
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.to_dict(), f)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "r") as f:
+            return cls.from_dict(json.load(f))
+
+# ===========================
+# 🔹 VERIFICA CON TA-LIB E BENCHMARK
+# ===========================
+
+def batch_indicators(df, fast_period=5, rsi_period=7, macd=(12, 26, 9)):
+    """Stesse colonne di IndicatorEngine calcolate sull'intero DataFrame con TA-Lib e pandas."""
+    import talib
+    high, low, close, volume = (df[column].astype(float) for column in ("high", "low", "close", "volume"))
+    out = pd.DataFrame(index=df.index)
+    out["SMA"] = talib.SMA(close, timeperiod=fast_period)
+    out["EMA"] = talib.EMA(close, timeperiod=fast_period)
+    out["TEMA"] = talib.TEMA(close, timeperiod=fast_period)
+    out["BB_upper"], out["BB_middle"], out["BB_lower"] = talib.BBANDS(close, timeperiod=fast_period)
+    out["ATR"] = talib.ATR(high, low, close, timeperiod=fast_period)
+    out["Volatility_Index"] = out["ATR"] / close
+    out["Volume_Change"] = volume.pct_change()
+    out["Volume_Momentum"] = out["Volume_Change"].rolling(window=3).sum()
+    out["Breakout"] = (close > out["BB_upper"]) & (out["Volume_Momentum"] > 0)
+    out["ADX"] = talib.ADX(high, low, close, timeperiod=fast_period)
+    out["+DI"] = talib.PLUS_DI(high, low, close, timeperiod=fast_period)
+    out["-DI"] = talib.MINUS_DI(high, low, close, timeperiod=fast_period)
+    out["RSI"] = talib.RSI(close, timeperiod=rsi_period)
+    out["MACD"], out["MACD_signal"], out["MACD_hist"] = talib.MACD(close, *macd)
+    out["conversion_line"] = (high.rolling(window=9).max() + low.rolling(window=9).min()) / 2
+    out["base_line"] = (high.rolling(window=26).max() + low.rolling(window=26).min()) / 2
+    out["leading_span_a"] = ((out["conversion_line"] + out["base_line"]) / 2).shift(26)
+    out["leading_span_b"] = ((high.rolling(window=52).max() + low.rolling(window=52).min()) / 2).shift(26)
+    return out
+
+def synthetic_ohlcv(n_bars, seed=42):
+    """Barre OHLCV sintetiche (random walk) per verifiche e benchmark."""
+    rng = np.random.default_rng(seed)
+    close = 100 * np.exp(np.cumsum(rng.normal(0, 0.01, n_bars)))
+    spread = np.abs(rng.normal(0, 0.005, n_bars)) * close
+    open_ = np.roll(close, 1)
+    open_[0] = close[0]
+    return pd.DataFrame({"open": open_, "high": np.maximum(open_, close) + spread,
+                         "low": np.minimum(open_, close) - spread, "close": close,
+                         "volume": rng.uniform(1e3, 1e6, n_bars)},
+                        index=pd.date_range("2024-01-01", periods=n_bars, freq="min"))
+
+def verify_against_talib(n_bars=5000, rtol=1e-9, atol=1e-9):
+    """Confronta colonna per colonna motore incrementale e calcolo batch, anche dopo un salvataggio dello stato.
+
+    Restituisce l'elenco delle colonne che differiscono (vuoto se tutto coincide).
+    """
+    df = synthetic_ohlcv(n_bars)
+    expected = batch_indicators(df)
+
+    # Metà delle barre, salvataggio e ripristino dello stato, poi il resto: simula un riavvio
+    half = n_bars // 2
+    engine = IndicatorEngine()
+    first = engine.update_frame(df.iloc[:half])
+    engine = IndicatorEngine.from_dict(json.loads(json.dumps(engine.to_dict())))
+    actual = pd.concat([first, engine.update_frame(df.iloc[half:])])
+
+    mismatches = []
+    for column in expected.columns:
+        if not np.allclose(actual[column].astype(float), expected[column].astype(float), rtol=rtol, atol=atol,
+                           equal_nan=True):
+            mismatches.append(column)
+            logging.error(f"❌ {column}: il calcolo incrementale differisce da quello batch.")
+    if not mismatches:
+        logging.info(f"✅ Tutti i {len(expected.columns)} indicatori coincidono con TA-Lib su {n_bars} barre.")
+    return mismatches
+
+def benchmark(history_sizes=(1_000, 10_000, 100_000), updates=200):
+    """Costo di una nuova barra: aggiornamento incrementale contro ricalcolo batch sull'intero storico."""
+    results = []
+    for size in history_sizes:
+        df = synthetic_ohlcv(size + updates)
+        engine = IndicatorEngine()
+        engine.update_frame(df.iloc[:size])
+        new_bars = df.iloc[size:].to_dict("records")
+
+        started = time.perf_counter()
+        for bar in new_bars:
+            engine.update(bar)
+        incremental_us = (time.perf_counter() - started) / updates * 1e6
+
+        batch_runs = min(updates, 20)
+        started = time.perf_counter()
+        for i in range(batch_runs):
+            batch_indicators(df.iloc[:size + i + 1])
+        batch_us = (time.perf_counter() - started) / batch_runs * 1e6
+
+        results.append({"history": size, "incremental_us": round(incremental_us, 1), "batch_us": round(batch_us, 1),
+                        "speedup": round(batch_us / incremental_us, 1)})
+        logging.info(f"📊 {results[-1]}")
+    return results
+
+if __name__ == "__main__":
+    if "--benchmark" in sys.argv:
+        benchmark()
+    else:
+        sys.exit(1 if verify_against_talib() else 0)
@@ -0,0 +1,395 @@
+# tick_pipeline.py - Pipeline dei trade in tempo reale con ring buffer NumPy e salvataggio a blocchi
+import os
+import sys
+import json
+import time
+import uuid
+import random
+import asyncio
+import logging
+import threading
+import numpy as np
+import pandas as pd
+from streaming_indicators import BollingerBands
+
+# Configurazione logging avanzata
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+# 📌 Parametri della pipeline
+DEFAULT_CAPACITY = 1 << 16  # Trade conservati in memoria per simbolo
+FLUSH_INTERVAL_SECONDS = 5.0
+FLUSH_MAX_ROWS = 50_000  # Flush anticipato se i trade in attesa superano questa soglia
+LATENCY_SAMPLES = 1 << 16  # Ultime latenze conservate per i percentili
+
+# 📌 Periodi degli indicatori calcolati tick per tick
+RSI_PERIOD = 14
+MACD_FAST, MACD_SLOW, MACD_SIGNAL = 12, 26, 9
+EMA_PERIOD = 20
+BOLLINGER_PERIOD, BOLLINGER_STD = 20, 2.0
+
+TICK_COLUMNS = ["price", "quantity", "rsi", "macd", "macd_signal", "ema", "bollinger_upper", "bollinger_lower"]
+
+# ===========================
+# 🔹 RING BUFFER PER SIMBOLO
+# ===========================
+
+class TickBuffer:
+    """Ring buffer preallocato dei trade di un simbolo con indicatori aggiornati in place a costo O(1)."""
+
+    def __init__(self, symbol, capacity=DEFAULT_CAPACITY):
+        if capacity < BOLLINGER_PERIOD:
+            raise ValueError(f"La capacità del buffer deve essere almeno {BOLLINGER_PERIOD}.")
+        self.symbol = symbol
+        self.capacity = capacity
+        self.timestamps = np.zeros(capacity, dtype=np.int64)  # Millisecondi epoch
+        self.columns = {column: np.full(capacity, np.nan) for column in TICK_COLUMNS}
+        self.count = 0  # Trade ricevuti in totale
+        self.flushed = 0  # Trade già consegnati al salvataggio
+        self.dropped = 0  # Trade sovrascritti prima del salvataggio
+
+        # Stato degli indicatori incrementali
+        self._last_price = None
+        self._ema = self._ema_fast = self._ema_slow = self._macd_signal = None
+        self._avg_gain = self._avg_loss = 0.0
+        self._bollinger = BollingerBands(BOLLINGER_PERIOD, BOLLINGER_STD)
+
+    @staticmethod
+    def _ema_step(previous, value, period):
+        return value if previous is None else previous + (value - previous) * 2.0 / (period + 1)
+
+    def append(self, timestamp, price, quantity):
+        """Aggiunge un trade e calcola gli indicatori della nuova riga."""
+        i = self.count % self.capacity
+        columns = self.columns
+        self.timestamps[i] = timestamp
+        columns["price"][i] = price
+        columns["quantity"][i] = quantity
+        n = self.count + 1
+
+        # EMA e MACD
+        self._ema = self._ema_step(self._ema, price, EMA_PERIOD)
+        self._ema_fast = self._ema_step(self._ema_fast, price, MACD_FAST)
+        self._ema_slow = self._ema_step(self._ema_slow, price, MACD_SLOW)
+        macd = self._ema_fast - self._ema_slow
+        self._macd_signal = self._ema_step(self._macd_signal, macd, MACD_SIGNAL)
+        columns["ema"][i] = self._ema
+        columns["macd"][i] = macd
+        columns["macd_signal"][i] = self._macd_signal
+
+        # RSI con media di Wilder (media semplice per i primi RSI_PERIOD movimenti)
+        if self._last_price is not None:
+            change = price - self._last_price
+            gain, loss = (change, 0.0) if change > 0 else (0.0, -change)
+            moves = n - 1
+            weight = min(moves, RSI_PERIOD)
+            self._avg_gain += (gain - self._avg_gain) / weight
+            self._avg_loss += (loss - self._avg_loss) / weight
+            if moves >= RSI_PERIOD:
+                columns["rsi"][i] = 100.0 if self._avg_loss == 0 else 100.0 - 100.0 / (1.0 + self._avg_gain / self._avg_loss)
+        self._last_price = price
+
+        # Bande di Bollinger: varianza sugli scarti dalla media della finestra (streaming_indicators), senza
+        # la somma mobile dei quadrati che sui prezzi intorno a 60 000 perde precisione col passare dei trade
+        upper, _, lower = self._bollinger.update(price)
+        columns["bollinger_upper"][i] = upper
+        columns["bollinger_lower"][i] = lower
+
+        self.count = n
+
+    def _rows(self, start, stop):
+        """Indici del ring buffer per i trade [start, stop) ancora in memoria."""
+        return np.arange(start, stop) % self.capacity
+
+    def latest(self, n=None):
+        """Ultimi n trade (default: tutti quelli in memoria) come DataFrame indicizzato per timestamp."""
+        available = min(self.count, self.capacity)
+        n = available if n is None else min(n, available)
+        rows = self._rows(self.count - n, self.count)
+        df = pd.DataFrame({column: values[rows] for column, values in self.columns.items()},
+                          index=pd.to_datetime(self.timestamps[rows], unit="ms"))
+        df.index.name = "timestamp"
+        return df
+
+    def drain(self):
+        """Restituisce in colonne i trade non ancora salvati, oppure None.
+
+        I trade restano in attesa finché mark_flushed() non conferma il salvataggio: se la scrittura
+        fallisce vengono riproposti al flush successivo (se nel frattempo non sono stati sovrascritti).
+        """
+        start = max(self.flushed, self.count - self.capacity)
+        self.dropped += start - self.flushed
+        self.flushed = start
+        rows = self._rows(start, self.count)
+        if not len(rows):
+            return None
+        chunk = {"timestamp": self.timestamps[rows].astype("datetime64[ms]")}
+        chunk.update({column: values[rows] for column, values in self.columns.items()})
+        chunk["symbol"] = np.full(len(rows), self.symbol, dtype=object)
+        return chunk
+
+    def mark_flushed(self, stop):
+        """Segna come salvati i trade fino a `stop` (valore di count al momento di drain())."""
+        self.flushed = max(self.flushed, stop)
+
+    def pending(self):
+        return min(self.count - self.flushed, self.capacity)
+
+# ===========================
+# 🔹 PIPELINE
+# ===========================
+
+class TickPipeline:
+    """Smista i messaggi trade di Binance nei buffer per simbolo e salva i trade a blocchi in Parquet.
+
+    L'elaborazione di un messaggio non alloca DataFrame né scrive su disco: il salvataggio avviene
+    in un thread separato ogni `flush_interval` secondi (o prima, oltre `flush_rows` trade in attesa).
+    """
+
+    def __init__(self, flush_dir=None, capacity=DEFAULT_CAPACITY, flush_interval=FLUSH_INTERVAL_SECONDS,
+                 flush_rows=FLUSH_MAX_ROWS, trade_listeners=None):
+        self.flush_dir = flush_dir
+        self.capacity = capacity
+        self.flush_interval = flush_interval
+        self.flush_rows = flush_rows
+        self.buffers = {}
+        self.trade_listeners = list(trade_listeners or [])  # listener(symbol, timestamp_ms, price, quantity)
+        self._lock = threading.Lock()  # Protegge i buffer tra ricezione e flush
+        self._flusher = None
+        self._flush_requested = None
+        self._stopping = False  # Chiesto da stop_flusher(): il task esce dal ciclo dopo l'ultimo flush
+
+        # 📊 Metriche
+        self.messages = 0
+        self.errors = 0
+        self.listener_errors = 0
+        self.flushed_rows = 0
+        self._latencies = np.zeros(LATENCY_SAMPLES, dtype=np.float64)  # Microsecondi
+
+    def buffer(self, symbol):
+        buffer = self.buffers.get(symbol)
+        if buffer is None:
+            buffer = self.buffers[symbol] = TickBuffer(symbol, self.capacity)
+        return buffer
+
+    def process_message(self, message):
+        """Elabora un messaggio trade (stringa JSON o dict già decodificato)."""
+        started = time.perf_counter()
+        try:
+            data = json.loads(message) if isinstance(message, (str, bytes)) else message
+            data = data.get("data", data)  # Stream combinati: {"stream": ..., "data": {...}}
+            symbol, timestamp = data.get("s", "BTCUSDT"), int(data["T"])
+            price, quantity = float(data["p"]), float(data.get("q", 0.0))
+            with self._lock:
+                buffer = self.buffer(symbol)
+                buffer.append(timestamp, price, quantity)
+                pending = buffer.pending()
+        except (KeyError, TypeError, ValueError, AttributeError) as e:
+            self.errors += 1
+            logging.error(f"❌ Messaggio trade non valido: {e}")
+            return
+        for listener in self.trade_listeners:
+            try:
+                listener(symbol, timestamp, price, quantity)
+            except Exception as e:  # Un listener difettoso non deve fermare la pipeline né gli altri listener
+                self.listener_errors += 1
+                logging.error(f"❌ Errore nel listener dei trade {getattr(listener, '__qualname__', listener)}: {e}")
+        self._latencies[self.messages % LATENCY_SAMPLES] = (time.perf_counter() - started) * 1e6
+        self.messages += 1
+        if pending >= self.flush_rows and self._flush_requested is not None:
+            self._flush_requested.set()
+
+    # ===========================
+    # 🔹 SALVATAGGIO A BLOCCHI
+    # ===========================
+
+    def drain(self):
+        """Trade non ancora salvati di tutti i simboli in un unico DataFrame, con {buffer: count} da passare
+        a mark_flushed() dopo la scrittura."""
+        with self._lock:
+            chunks, marks = [], {}
+            for buffer in self.buffers.values():
+                chunk = buffer.drain()
+                if chunk is not None:
+                    chunks.append(chunk)
+                    marks[buffer] = buffer.count
+        if not chunks:
+            return None, marks
+        return pd.concat([pd.DataFrame(chunk) for chunk in chunks], ignore_index=True), marks
+
+    def mark_flushed(self, marks):
+        with self._lock:
+            for buffer, stop in marks.items():
+                buffer.mark_flushed(stop)
+
+    def flush(self):
+        """Scrive un nuovo file Parquet con i trade in attesa. Restituisce il numero di righe scritte.
+
+        I trade vengono segnati come salvati solo dopo la scrittura: se fallisce restano in attesa.
+        """
+        df, marks = self.drain()
+        if df is None:
+            return 0
+        if self.flush_dir:
+            os.makedirs(self.flush_dir, exist_ok=True)
+            path = os.path.join(self.flush_dir, f"part-{int(time.time() * 1000)}-{uuid.uuid4().hex[:8]}.parquet")
+            tmp_path = f"{path}.tmp"
+            try:
+                df.to_parquet(tmp_path, index=False)
+                os.replace(tmp_path, path)
+            except Exception:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                raise
+        self.mark_flushed(marks)
+        self.flushed_rows += len(df)
+        return len(df)
+
+    async def _flush_once(self):
+        try:
+            rows = await asyncio.to_thread(self.flush)
+            if rows:
+                logging.info(f"💾 Salvati {rows} trade in {self.flush_dir}.")
+        except Exception as e:
+            logging.error(f"❌ Errore nel salvataggio dei trade: {e}")
+
+    async def _flush_loop(self):
+        # L'arresto passa da _stopping e non da cancel(): su Python 3.11 wait_for() perde la cancellazione
+        # se l'evento è già impostato (flush anticipato in attesa) e il ciclo non terminerebbe mai
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._flush_requested.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._flush_requested.clear()
+            if self._stopping:
+                break
+            await self._flush_once()
+        await self._flush_once()  # Trade rimasti al momento dell'arresto
+
+    def start_flusher(self):
+        """Avvia (una sola volta) il task di salvataggio periodico nell'event loop corrente."""
+        if self._flusher is None or self._flusher.done():
+            self._stopping = False
+            self._flush_requested = asyncio.Event()
+            self._flusher = asyncio.get_running_loop().create_task(self._flush_loop())
+        return self._flusher
+
+    async def stop_flusher(self):
+        """Ferma il task di salvataggio dopo un ultimo flush dei trade rimasti."""
+        if self._flusher is None:
+            await self._flush_once()
+            return
+        self._stopping = True
+        self._flush_requested.set()
+        await self._flusher
+        self._flusher = None
+
+    def stats(self):
+        """Messaggi elaborati, errori, trade persi e percentili della latenza per messaggio (µs)."""
+        samples = self._latencies[:min(self.messages, LATENCY_SAMPLES)]
+        p50, p99, p999 = np.percentile(samples, [50, 99, 99.9]) if len(samples) else (0.0, 0.0, 0.0)
+        return {
+            "messages": self.messages,
+            "errors": self.errors,
+            "listener_errors": self.listener_errors,
+            "flushed_rows": self.flushed_rows,
+            "dropped_rows": sum(buffer.dropped for buffer in self.buffers.values()),
+            "latency_p50_us": round(float(p50), 2),
+            "latency_p99_us": round(float(p99), 2),
+            "latency_p999_us": round(float(p999), 2),
+        }
+
+# ===========================
+# 🔹 BENCHMARK
+# ===========================
+
+def synthetic_trades(n_messages, symbol="BTCUSDT", start_ms=None):
+    """Messaggi trade sintetici nel formato dello stream <symbol>@trade di Binance."""
+    timestamp = start_ms or int(time.time() * 1000)
+    price = 60_000.0
+    for trade_id in range(n_messages):
+        price *= 1 + random.gauss(0, 0.0002)
+        timestamp += random.randint(0, 3)
+        yield json.dumps({"e": "trade", "E": timestamp, "s": symbol, "t": trade_id, "p": f"{price:.2f}",
+                          "q": f"{random.uniform(0.0001, 0.5):.5f}", "T": timestamp, "m": random.random() < 0.5})
+
+def benchmark(n_messages=200_000, flush_dir="tick_benchmark"):
+    """Misura throughput e latenza per messaggio su un solo core, con flush periodico attivo."""
+    messages = list(synthetic_trades(n_messages))
+
+    async def run():
+        pipeline = TickPipeline(flush_dir=flush_dir, flush_interval=1.0)
+        pipeline.start_flusher()
+        started = time.perf_counter()
+        for i, message in enumerate(messages):
+            pipeline.process_message(message)
+            if i % 1000 == 0:
+                await asyncio.sleep(0)  # Come con un WebSocket reale, il flush può procedere tra un blocco e l'altro
+        elapsed = time.perf_counter() - started
+        await pipeline.stop_flusher()
+        return pipeline, elapsed
+
+    pipeline, elapsed = asyncio.run(run())
+    result = {"messages_per_second": round(n_messages / elapsed), **pipeline.stats()}
+    logging.info(f"📊 Tick pipeline: {result}")
+    return result
+
+def stop_check(flush_rows=1_000, timeout=10.0):
+    """Arresto con un flush anticipato già richiesto: stop_flusher() deve terminare e salvare tutti i trade."""
+    messages = list(synthetic_trades(flush_rows))
+
+    async def run():
+        pipeline = TickPipeline(flush_rows=flush_rows, flush_interval=60.0)
+        pipeline.start_flusher()
+        for message in messages:
+            pipeline.process_message(message)  # L'ultimo messaggio imposta la richiesta di flush
+        await asyncio.wait_for(pipeline.stop_flusher(), timeout)
+        return pipeline
+
+    try:
+        pipeline = asyncio.run(run())
+        ok = pipeline.flushed_rows == flush_rows
+    except asyncio.TimeoutError:
+        ok = False
+    logging.info(f"{'✅' if ok else '❌'} Arresto con flush in attesa {'completato' if ok else 'bloccato o incompleto'}")
+    return ok
+
+def robustness_check(n_messages=100_000):
+    """Bande di Bollinger stabili su un processo lungo, listener difettoso isolato, trade conservati se la
+    scrittura fallisce."""
+    import tempfile
+    checks = {}
+    messages = list(synthetic_trades(n_messages))
+
+    calls = []
+    def failing(symbol, timestamp, price, quantity):
+        if len(calls) % 10_000 == 0:
+            raise RuntimeError("listener di prova")
+    pipeline = TickPipeline(trade_listeners=[failing, lambda *trade: calls.append(trade)])
+    for message in messages:
+        pipeline.process_message(message)
+    checks["listener"] = len(calls) == n_messages and pipeline.listener_errors == -(-n_messages // 10_000)
+
+    window = pipeline.buffer("BTCUSDT").latest(BOLLINGER_PERIOD)
+    mean, std = window["price"].mean(), window["price"].std(ddof=0)
+    checks["bollinger"] = bool(np.isclose(window["bollinger_upper"].iloc[-1], mean + BOLLINGER_STD * std, rtol=0, atol=1e-9))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        blocked = os.path.join(tmp, "file")
+        open(blocked, "w").close()
+        pipeline.flush_dir = os.path.join(blocked, "trades")  # La directory non si può creare: scrittura fallita
+        try:
+            pipeline.flush()
+        except OSError:
+            pass
+        pipeline.flush_dir = os.path.join(tmp, "trades")
+        written = pipeline.flush()
+        checks["retry"] = written == min(n_messages, pipeline.capacity) and pipeline.buffer("BTCUSDT").pending() == 0
+
+    ok = all(checks.values())
+    logging.info(f"{'✅' if ok else '❌'} Robustezza della pipeline: {checks}")
+    return ok
+
+if __name__ == "__main__":
+    benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else 200_000)
+    sys.exit(0 if stop_check() and robustness_check() else 1)
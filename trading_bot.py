@@ -12,6 +12,7 @@ import bridge_module
 from ai_model import AIModel
 from trading_environment import TradingEnv
 from drl_agent import DRLAgent
+from market_cache import get_market_cache
 import portfolio_optimization
 import risk_management
 import tensorflow as tf
@@ -42,6 +43,7 @@ class TradingBot:
         self.risk_management = risk_management.RiskManagement(max_risk=0.02, max_drawdown=0.1)
         self.portfolio_optimization = portfolio_optimization.PortfolioOptimization()
         self.bots = []
+        market_cache = get_market_cache()  # Mercati scaricati una sola volta e condivisi da tutti gli account
 
         for account in self.accounts:
             api_key = account['api_key']
@@ -53,7 +55,7 @@ class TradingBot:
                 logging.error(f"Errore nelle credenziali Binance: {e}")
                 continue
 
-            trading_pair = [symbol for symbol in exchange.load_markets() if symbol.endswith("/EUR") or symbol.endswith("/USDT")]
+            trading_pair = [symbol for symbol in market_cache.load_markets(exchange) if symbol.endswith("/EUR") or symbol.endswith("/USDT")]
             timeframes = ["1m", "5m", "15m", "30m", "1h", "4h", "D1"]
 
             bot = self.create_bot(exchange, trading_pair, timeframes)
@@ -3,6 +3,8 @@ from gym import spaces
 import numpy as np
 import pandas as pd
 import data_handler
+from frame_memory import declare_columns
+from normalizer import DEFAULT_FEATURES
 import indicators
 import risk_management
 import portfolio_optimization
@@ -24,6 +26,9 @@ os.makedirs(BACKUP_DIR, exist_ok=True)
 
 CLOUD_BACKTEST_URL = "https://your-cloud-backtesting.com/run"
 
+# 📌 Colonne usate come osservazioni dall'ambiente
+declare_columns("trading_environment", DEFAULT_FEATURES)
+
 class TradingEnv(gym.Env):
     """
     Ambiente di trading AI con supporto per scalping ultra-rapido, gestione del rischio avanzata e logging dettagliato.
@@ -72,6 +77,9 @@ class TradingEnv(gym.Env):
 
     def _verify_and_prepare_data(self, data):
         """Verifica la struttura dei dati e prepara i dati per scalping."""
+        # I dati di data_handler.load_normalized_data() hanno il timestamp come indice
+        if "timestamp" not in data.columns and data.index.name == "timestamp":
+            data = data.reset_index()
         if "timestamp" not in data.columns:
             raise ValueError("❌ Errore: Nessuna colonna 'timestamp' trovata nei dati.")
 
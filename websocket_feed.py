@@ -0,0 +1,283 @@
+# websocket_feed.py - Feed WebSocket multi-simbolo su stream combinati con riconnessione a ciclo e metriche
+import sys
+import json
+import time
+import random
+import asyncio
+import inspect
+import logging
+import websockets
+
+# Configurazione logging avanzata
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+# 📌 Parametri di default del feed
+BINANCE_STREAM_URL = "wss://stream.binance.com:9443"
+MAX_STREAMS_PER_CONNECTION = 200  # Binance ne accetta fino a 1024 per connessione
+QUEUE_SIZE = 10_000  # Messaggi in attesa per simbolo
+DROP_POLICIES = ("drop_oldest", "drop_newest", "block")
+RECONNECT_BASE_DELAY = 1.0
+RECONNECT_MAX_DELAY = 60.0
+RATE_WINDOW_SECONDS = 10.0
+LAG_EWMA_ALPHA = 0.05
+
+class SymbolChannel:
+    """Coda limitata e gestori di un simbolo, consumati da un task dedicato."""
+
+    def __init__(self, symbol, queue_size):
+        self.symbol = symbol
+        self.queue = asyncio.Queue(maxsize=queue_size)
+        self.handlers = []
+        self.received = 0
+        self.processed = 0
+        self.dropped = 0
+        self.errors = 0
+        self.task = None
+
+class FeedManager:
+    """Sottoscrive molti simboli su stream combinati usando il minor numero di connessioni.
+
+    Il ciclo di ricezione decodifica il messaggio e lo accoda al simbolo corretto senza attendere i
+    gestori; se un consumatore resta indietro si applica `drop_policy`:
+    - "drop_oldest": scarta il messaggio più vecchio in coda (default, adatto ai dati di mercato);
+    - "drop_newest": scarta il messaggio appena arrivato;
+    - "block": il ciclo di ricezione attende (backpressure verso la connessione).
+    Le riconnessioni avvengono in un ciclo con backoff esponenziale e jitter, senza ricorsione.
+    """
+
+    def __init__(self, symbols, stream="trade", base_url=BINANCE_STREAM_URL,
+                 max_streams_per_connection=MAX_STREAMS_PER_CONNECTION, queue_size=QUEUE_SIZE,
+                 drop_policy="drop_oldest", reconnect_base_delay=RECONNECT_BASE_DELAY,
+                 reconnect_max_delay=RECONNECT_MAX_DELAY):
+        if drop_policy not in DROP_POLICIES:
+            raise ValueError(f"drop_policy deve essere uno tra {DROP_POLICIES}")
+        self.stream = stream
+        self.base_url = base_url.rstrip("/")
+        self.max_streams_per_connection = max_streams_per_connection
+        self.drop_policy = drop_policy
+        self.receive_queue_size = queue_size  # Limite anche per il buffer della libreria websockets
+        self.reconnect_base_delay = reconnect_base_delay
+        self.reconnect_max_delay = reconnect_max_delay
+        self.channels = {symbol.upper(): SymbolChannel(symbol.upper(), queue_size) for symbol in symbols}
+        self.default_handlers = []
+        self._tasks = []
+        self._running = False
+
+        # 📊 Metriche
+        self.messages = 0
+        self.invalid_messages = 0
+        self.reconnects = 0
+        self.connections_open = 0
+        self.lag_ms_ewma = None
+        self.lag_ms_max = 0.0
+        self._rate_started = time.monotonic()
+        self._rate_count = 0
+        self.message_rate = 0.0
+
+    # ===========================
+    # 🔹 GESTORI
+    # ===========================
+
+    def add_handler(self, handler, symbol=None):
+        """Registra handler(data) per un simbolo, o per tutti se `symbol` è None. Può essere una coroutine."""
+        if symbol is None:
+            self.default_handlers.append(handler)
+        else:
+            self.channels[symbol.upper()].handlers.append(handler)
+
+    async def _consume(self, channel):
+        while True:
+            data = await channel.queue.get()
+            for handler in channel.handlers or self.default_handlers:
+                try:
+                    result = handler(data)
+                    if inspect.isawaitable(result):
+                        await result
+                except Exception as e:
+                    channel.errors += 1
+                    logging.error(f"❌ Errore nel gestore dei messaggi di {channel.symbol}: {e}")
+            channel.processed += 1
+
+    # ===========================
+    # 🔹 CONNESSIONI
+    # ===========================
+
+    def stream_urls(self):
+        """URL degli stream combinati, al massimo `max_streams_per_connection` simboli ciascuno."""
+        names = [f"{symbol.lower()}@{self.stream}" for symbol in self.channels]
+        size = self.max_streams_per_connection
+        return [f"{self.base_url}/stream?streams={'/'.join(names[i:i + size])}" for i in range(0, len(names), size)]
+
+    def reconnect_delay(self, attempt):
+        """Backoff esponenziale con jitter, per non riconnettere tutti i client nello stesso istante."""
+        delay = min(self.reconnect_max_delay, self.reconnect_base_delay * 2 ** attempt)
+        return random.uniform(delay / 2, delay)
+
+    async def _connection_loop(self, url):
+        attempt = 0
+        while self._running:
+            try:
+                async with websockets.connect(url, max_queue=self.receive_queue_size) as websocket:
+                    self.connections_open += 1
+                    attempt = 0
+                    logging.info(f"✅ Connessione WebSocket stabilita ({url[:80]}...).")
+                    try:
+                        async for raw in websocket:
+                            await self._dispatch(raw)
+                    finally:
+                        self.connections_open -= 1
+                logging.warning("⚠️ Connessione WebSocket chiusa dal server.")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logging.warning(f"⚠️ Errore sulla connessione WebSocket: {e}")
+            if not self._running:
+                break
+            delay = self.reconnect_delay(attempt)
+            attempt += 1
+            self.reconnects += 1
+            logging.info(f"🔄 Riconnessione tra {delay:.1f}s (tentativo {attempt}).")
+            await asyncio.sleep(delay)
+
+    async def _dispatch(self, raw):
+        try:
+            message = json.loads(raw)
+            data = message.get("data", message)
+            channel = self.channels[data["s"].upper()]
+        except (ValueError, KeyError, AttributeError, TypeError):
+            self.invalid_messages += 1
+            return
+
+        self.messages += 1
+        channel.received += 1
+        self._update_metrics(data)
+
+        queue = channel.queue
+        if queue.full():
+            if self.drop_policy == "block":
+                await queue.put(data)
+                return
+            channel.dropped += 1
+            if self.drop_policy == "drop_newest":
+                return
+            queue.get_nowait()
+        queue.put_nowait(data)
+
+    def _update_metrics(self, data):
+        event_time = data.get("E") or data.get("T")
+        if event_time:
+            lag = time.time() * 1000 - event_time
+            self.lag_ms_max = max(self.lag_ms_max, lag)
+            self.lag_ms_ewma = lag if self.lag_ms_ewma is None else (
+                self.lag_ms_ewma + LAG_EWMA_ALPHA * (lag - self.lag_ms_ewma))
+        self._rate_count += 1
+        elapsed = time.monotonic() - self._rate_started
+        if elapsed >= RATE_WINDOW_SECONDS:
+            self.message_rate = self._rate_count / elapsed
+            self._rate_started, self._rate_count = time.monotonic(), 0
+
+    # ===========================
+    # 🔹 AVVIO E ARRESTO
+    # ===========================
+
+    async def run(self):
+        """Avvia consumatori e connessioni e resta in esecuzione fino a stop() o cancellazione."""
+        self._running = True
+        loop = asyncio.get_running_loop()
+        for channel in self.channels.values():
+            channel.task = loop.create_task(self._consume(channel))
+        self._tasks = [loop.create_task(self._connection_loop(url)) for url in self.stream_urls()]
+        try:
+            await asyncio.gather(*self._tasks)
+        finally:
+            await self._shutdown()
+
+    async def stop(self):
+        self._running = False
+        for task in self._tasks:
+            task.cancel()
+
+    async def _shutdown(self):
+        self._running = False
+        tasks = self._tasks + [channel.task for channel in self.channels.values() if channel.task]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def stats(self):
+        """Messaggi, velocità, ritardo rispetto all'exchange, riconnessioni e stato delle code per simbolo."""
+        rate = self.message_rate
+        if not rate:  # Nessuna finestra completa: velocità della finestra in corso
+            rate = self._rate_count / max(time.monotonic() - self._rate_started, 1e-9)
+        return {
+            "messages": self.messages,
+            "invalid_messages": self.invalid_messages,
+            "message_rate": round(rate, 1),
+            "lag_ms_ewma": round(self.lag_ms_ewma or 0.0, 1),
+            "lag_ms_max": round(self.lag_ms_max, 1),
+            "reconnects": self.reconnects,
+            "connections_open": self.connections_open,
+            "symbols": {symbol: {"received": channel.received, "processed": channel.processed,
+                                 "dropped": channel.dropped, "errors": channel.errors,
+                                 "queue_depth": channel.queue.qsize()}
+                        for symbol, channel in self.channels.items()},
+        }
+
+# ===========================
+# 🔹 SERVER LOCALE DI REPLAY
+# ===========================
+
+async def replay_server(host="127.0.0.1", port=8765, messages_per_connection=5_000, close_after=None):
+    """Server WebSocket locale che replica trade sintetici in formato stream combinato Binance.
+
+    Con `close_after` il server chiude ogni connessione dopo quel numero di messaggi, per provare le
+    riconnessioni. Restituisce il server avviato (da chiudere con server.close()).
+    """
+    async def handler(connection):
+        query = connection.request.path.split("streams=", 1)[-1]
+        streams = [stream for stream in query.split("/") if stream]
+        prices = {stream: random.uniform(10, 60_000) for stream in streams}
+        limit = close_after or messages_per_connection
+        try:
+            for i in range(min(limit, messages_per_connection)):
+                stream = streams[i % len(streams)]
+                prices[stream] *= 1 + random.gauss(0, 0.0002)
+                now = int(time.time() * 1000)
+                data = {"e": "trade", "E": now, "s": stream.split("@")[0].upper(), "t": i,
+                        "p": f"{prices[stream]:.4f}", "q": f"{random.uniform(0.001, 1):.4f}", "T": now,
+                        "m": random.random() < 0.5}
+                await connection.send(json.dumps({"stream": stream, "data": data}))
+                if i % 100 == 0:
+                    await asyncio.sleep(0)
+        except websockets.ConnectionClosed:
+            return  # Il client si è disconnesso
+        await connection.close()
+
+    return await websockets.serve(handler, host, port)
+
+async def replay_check(symbols=("BTCUSDT", "ETHUSDT", "SOLUSDT", "BNBUSDT"), close_after=2_000, connections=2,
+                       seconds=5.0):
+    """Prova end-to-end su server locale: instradamento, riconnessioni e metriche."""
+    server = await replay_server(close_after=close_after)
+    received = {symbol: 0 for symbol in symbols}
+
+    def count(data):
+        received[data["s"]] += 1
+
+    feed = FeedManager(symbols, base_url="ws://127.0.0.1:8765", reconnect_base_delay=0.05,
+                       max_streams_per_connection=max(1, len(symbols) // connections))
+    feed.add_handler(count)
+    runner = asyncio.create_task(feed.run())
+    await asyncio.sleep(seconds)
+    await feed.stop()
+    await asyncio.gather(runner, return_exceptions=True)
+    server.close()
+    await server.wait_closed()
+
+    stats = feed.stats()
+    ok = all(received.values()) and stats["reconnects"] > 0 and stats["invalid_messages"] == 0
+    logging.info(f"{'✅' if ok else '❌'} Replay: ricevuti {received}, metriche {stats}")
+    return ok
+
+if __name__ == "__main__":
+    sys.exit(0 if asyncio.run(replay_check()) else 1)
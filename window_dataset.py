@@ -0,0 +1,174 @@
+# window_dataset.py - Dataset a finestre scorrevoli per i modelli: viste strided sull'array sorgente, senza copie
+import sys
+import time
+import logging
+import tracemalloc
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view, as_strided
+
+# Configurazione logging avanzata
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+# 📌 Parametri di default (come prepare_lstm_data / prepare_xgboost_data)
+LOOK_BACK = 60
+HORIZON = 1  # Barre tra l'ultima barra della finestra e il target
+STRIDE = 1  # Barre tra l'inizio di due finestre consecutive
+VALIDATION_FRACTION = 0.2
+
+class WindowDataset:
+    """Finestre di `look_back` righe e target `horizon` righe dopo la fine di ciascuna finestra.
+
+    X (campioni x look_back x feature), X_flat (campioni x look_back*feature, per XGBoost) e y sono viste
+    in sola lettura sull'array sorgente: la memoria non cresce con look_back. Le uniche copie possibili
+    (una volta, non per finestra) sono la conversione di un DataFrame o di un array non contiguo e le
+    feature non adiacenti; X_flat richiede inoltre feature contigue in memoria.
+    """
+
+    def __init__(self, data, look_back=LOOK_BACK, horizon=HORIZON, stride=STRIDE, features=None, target=0):
+        if look_back < 1 or horizon < 1 or stride < 1:
+            raise ValueError("look_back, horizon e stride devono essere >= 1")
+        self.look_back, self.horizon, self.stride = look_back, horizon, stride
+
+        if isinstance(data, pd.DataFrame):
+            columns = list(data.columns)
+            features = columns if features is None else list(features)
+            target = columns.index(target) if not isinstance(target, int) else target
+            data = data.to_numpy()
+        else:
+            columns = None
+        data = np.asarray(data)
+        if data.ndim == 1:
+            data = data[:, None]
+        self.source = np.ascontiguousarray(data)  # Nessuna copia se l'array è già contiguo
+
+        # Colonne delle feature: un intervallo contiguo resta una vista, altrimenti si estraggono una volta
+        indices = list(range(self.source.shape[1])) if features is None else \
+            [columns.index(f) if columns is not None and not isinstance(f, int) else f for f in features]
+        self.features = indices
+        if indices == list(range(indices[0], indices[0] + len(indices))):
+            self._values = self.source[:, indices[0]:indices[0] + len(indices)]
+        else:
+            self._values = np.ascontiguousarray(self.source[:, indices])
+        self._target = self.source[:, target]
+
+        self.n_samples = max((len(self.source) - look_back - horizon) // stride + 1, 0)
+
+    def __len__(self):
+        return self.n_samples
+
+    @property
+    def X(self):
+        """Vista (campioni x look_back x feature)."""
+        if not self.n_samples:
+            return np.empty((0, self.look_back, self._values.shape[1]), dtype=self._values.dtype)
+        windows = sliding_window_view(self._values, (self.look_back, self._values.shape[1]))[:, 0]
+        return windows[::self.stride][:self.n_samples]
+
+    @property
+    def X_flat(self):
+        """Vista (campioni x look_back*feature): le righe di una finestra sono contigue in memoria."""
+        values = self._values
+        if not values.flags.c_contiguous:
+            values = self._values = np.ascontiguousarray(values)
+        row, item = values.strides
+        return as_strided(values, shape=(self.n_samples, self.look_back * values.shape[1]),
+                          strides=(row * self.stride, item), writeable=False)
+
+    @property
+    def y(self):
+        """Vista dei target: riga look_back - 1 + horizon di ogni finestra."""
+        first = self.look_back - 1 + self.horizon
+        return self._target[first::self.stride][:self.n_samples]
+
+    def split(self, validation_fraction=VALIDATION_FRACTION, gap=0, flat=False):
+        """(X_train, y_train, X_val, y_val) come viste; `gap` campioni scartati tra i due insiemi evitano che le
+        finestre di validazione contengano i target di addestramento (gap=look_back li separa del tutto)."""
+        X, y = (self.X_flat if flat else self.X), self.y
+        train_end = int((1 - validation_fraction) * self.n_samples)
+        validation_start = min(train_end + gap, self.n_samples)
+        return X[:train_end], y[:train_end], X[validation_start:], y[validation_start:]
+
+# ===========================
+# 🔹 BENCHMARK
+# ===========================
+
+def _legacy_windows(data, look_back=LOOK_BACK):
+    """Ciclo Python precedente di ai_model.prepare_lstm_data (liste di slice copiate in un nuovo array)."""
+    X, y = [], []
+    for i in range(look_back, len(data)):
+        X.append(data[i-look_back:i, 0])
+        y.append(data[i, 0])
+    X, y = np.array(X), np.array(y)
+    X = np.reshape(X, (X.shape[0], X.shape[1], 1))
+    return X, y
+
+def _legacy_flat_windows(data, look_back=LOOK_BACK):
+    """Ciclo Python precedente di ai_model.prepare_xgboost_data (finestre piatte, nessun reshape)."""
+    X, y = [], []
+    for i in range(look_back, len(data)):
+        X.append(data[i-look_back:i, 0])
+        y.append(data[i, 0])
+    return np.array(X), np.array(y)
+
+def _current_functions():
+    """prepare_lstm_data / prepare_xgboost_data di ai_model, None se ai_model non è importabile (TensorFlow, XGBoost)."""
+    try:
+        import ai_model
+    except ImportError as e:
+        logging.warning(f"⚠️ ai_model non importabile ({e}): confronto solo con le copie dei cicli precedenti")
+        return None
+    return ai_model.prepare_lstm_data, ai_model.prepare_xgboost_data
+
+def _measure(func):
+    tracemalloc.start()
+    started = time.perf_counter()
+    result = func()
+    seconds = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, seconds, peak
+
+def benchmark(n_rows=1_000_000, look_back=LOOK_BACK, n_features=5):
+    """Tempo e picco di memoria del ciclo precedente e delle viste strided su `n_rows` righe; verifica i valori."""
+    rng = np.random.default_rng(11)
+    data = rng.random((n_rows, n_features))
+
+    (X_old, y_old), old_seconds, old_peak = _measure(lambda: _legacy_windows(data, look_back))
+    dataset, new_seconds, new_peak = _measure(
+        lambda: WindowDataset(data, look_back, features=[0]).split(validation_fraction=0))
+    X_new, y_new = dataset[0], dataset[1]
+    ok = np.array_equal(X_new, X_old) and np.array_equal(y_new, y_old) and not X_new.flags.owndata
+    del X_old, y_old
+
+    # Funzioni usate dai modelli: stesse finestre dei cicli precedenti, senza copie
+    sample = data[:20_000]
+    X_old, y_old = _legacy_flat_windows(sample, look_back)
+    ok &= np.array_equal(WindowDataset(sample, look_back, features=[0]).X_flat, X_old)
+    current = _current_functions()
+    if current is not None:
+        prepare_lstm, prepare_xgboost = current
+        X_lstm, y_lstm = prepare_lstm(sample, look_back)
+        X_xgb, y_xgb = prepare_xgboost(sample, look_back)
+        legacy_lstm = _legacy_windows(sample, look_back)
+        ok &= np.array_equal(X_lstm, legacy_lstm[0]) and np.array_equal(y_lstm, legacy_lstm[1])
+        ok &= np.array_equal(X_xgb, X_old) and np.array_equal(y_xgb, y_old)
+        ok &= np.shares_memory(X_lstm, sample) and np.shares_memory(X_xgb, sample)
+
+    # Tutte le feature, passo 5 e orizzonte 10: controllo a campione contro lo slicing diretto
+    multi = WindowDataset(data, look_back, horizon=10, stride=5)
+    for i in (0, len(multi) // 2, len(multi) - 1):
+        start = i * 5
+        ok &= np.array_equal(multi.X[i], data[start:start + look_back])
+        ok &= np.array_equal(multi.X_flat[i], data[start:start + look_back].ravel())
+        ok &= multi.y[i] == data[start + look_back - 1 + 10, 0]
+    ok &= np.shares_memory(multi.X, data) and np.shares_memory(multi.X_flat, data)
+
+    logging.info(f"{'✅' if ok else '❌'} {n_rows} righe, look_back {look_back}: ciclo precedente "
+                 f"{old_seconds:.2f} s / {old_peak / 2**20:.0f} MiB, viste strided {new_seconds * 1000:.2f} ms / "
+                 f"{new_peak / 2**20:.2f} MiB (X {X_new.shape}, {multi.X.shape} con {n_features} feature e passo 5; "
+                 f"funzioni di ai_model {'verificate' if current is not None else 'non verificate'})")
+    return bool(ok)
+
+if __name__ == "__main__":
+    sys.exit(0 if benchmark() else 1)